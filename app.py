@@ -11,22 +11,41 @@ YouTube「大人の学び直しTV」のすあし社長用 X投稿生成Webアプ
 
 import streamlit as st
 import anthropic
+import httpx
 import json
 import os
 import re
 import io
 import base64
-import feedparser
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import urllib.parse
 import urllib.request
 from dotenv import load_dotenv
 from x_scraper import fetch_x_news_trends, login_to_x, is_logged_in, clear_session, _is_cloud_environment
-from datetime import datetime, timezone, timedelta
+import trend_store
+import factcheck_cache
+import claim_grounding
+import claim_store
+import fact_search
+from claude_gateway import ClaudeGateway, PRIORITY_INTERACTIVE, PRIORITY_NORMAL, PRIORITY_BACKGROUND, describe_error
+from post_pipeline import (
+    JST, logger, rewrite_max_tokens,
+    PIPELINE_PROFILES, DEFAULT_PROFILE, stage_config, apply_stage, record_run, profile_usage_summary,
+    log_usage, save_history, load_history_list,
+    fetch_google_news, search_topic_facts, search_facts_for_topics, join_topic_facts, TopicFactStore,
+    build_recommend_request, extract_recommendations, build_generation_system, build_trend_generation_message,
+    fit_search_context,
+    parse_generated_posts, PostStreamParser,
+    build_factcheck_request, needs_auto_fix, build_auto_fix_request, RevisionSession,
+    diff_focus_text, build_diff_factcheck_request, merge_factcheck_results,
+    extract_factcheck_text, parse_factcheck_findings, apply_factcheck_patches, claim_prepass_enabled,
+    split_sentences, factcheck_context,
+)
+from datetime import datetime
 from pathlib import Path
 
-# 日本時間 (JST = UTC+9)
-JST = timezone(timedelta(hours=9))
-
 # .env ファイルからAPIキーを自動読み込み（既存の空変数も上書き）
 load_dotenv(Path(__file__).parent / ".env", override=True)
 
@@ -34,11 +53,14 @@ load_dotenv(Path(__file__).parent / ".env", override=True)
 # 定数
 # ──────────────────────────────────────
 APP_DIR = Path(__file__).parent
-HISTORY_DIR = APP_DIR / "history"
-HISTORY_DIR.mkdir(exist_ok=True)
-SYSTEM_PROMPT_PATH = APP_DIR / "suasi_system_prompt.md"
-CLAUDE_MODEL = "claude-sonnet-4-20250514"
+CLAUDE_TIMEOUT = httpx.Timeout(180.0, connect=10.0)  # 長文生成を見込んだ読み取りタイムアウト
+CLAUDE_CONNECTION_LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=120)
+CLAUDE_MAX_RETRIES = 0  # 再試行は ClaudeGateway がレート制御と合わせて行う
 X_TRENDS_CACHE = APP_DIR / "x_trends_cache.json"
+GITHUB_TRENDS_API_URL = "https://api.github.com/repos/Kota-kun777/x-post-tool/contents/x_trends_cache.json"
+GITHUB_TRENDS_RAW_URL = "https://raw.githubusercontent.com/Kota-kun777/x-post-tool/HEAD/x_trends_cache.json"
+GITHUB_REVALIDATE_SECONDS = 600  # この間隔を過ぎたらバックグラウンドで再検証
+GITHUB_RETRY_SECONDS = 60  # 取得失敗時の再試行間隔
 
 # ──────────────────────────────────────
 # ページ設定
@@ -204,78 +226,210 @@ def _copy_button(text, key):
 # ユーティリティ
 # ──────────────────────────────────────
 
-def load_system_prompt():
-    if SYSTEM_PROMPT_PATH.exists():
-        return SYSTEM_PROMPT_PATH.read_text(encoding="utf-8")
-    return ""
-
-def save_history(mode, input_data, result):
-    timestamp = datetime.now(JST).strftime("%Y%m%d_%H%M%S")
-    entry = {"timestamp": datetime.now(JST).isoformat(), "mode": mode, "input": input_data, "result": result}
-    filepath = HISTORY_DIR / f"{timestamp}_{mode}.json"
-    with open(filepath, "w", encoding="utf-8") as f:
-        json.dump(entry, f, ensure_ascii=False, indent=2)
-
-def load_history_list():
-    files = sorted(HISTORY_DIR.glob("*.json"), reverse=True)
-    entries = []
-    for f in files:
-        try:
-            with open(f, "r", encoding="utf-8") as fp:
-                data = json.load(fp)
-                entries.append(data)
-        except Exception:
-            pass
-    return entries
+@st.cache_resource(show_spinner=False)
+def get_anthropic_client(api_key):
+    """APIキーごとに1つのAnthropicクライアントを共有（全セッション共通・スレッドセーフ）
+
+    呼び出しのたびにクライアントを作るとコネクションプールとTLSハンドシェイクが毎回発生するため、
+    プロセス内で使い回す。ワーカースレッドにはメインスレッドで取得したクライアントを渡すこと。
+    """
+    return anthropic.Anthropic(
+        api_key=api_key,
+        timeout=CLAUDE_TIMEOUT,
+        max_retries=CLAUDE_MAX_RETRIES,
+        http_client=anthropic.DefaultHttpxClient(limits=CLAUDE_CONNECTION_LIMITS),
+    )
+
+@st.cache_resource(show_spinner=False)
+def get_claude_gateway(api_key):
+    """APIキーごとに1つの呼び出しゲートウェイ（全セッション共通のレート制御・優先度・再試行）
+
+    Claude の呼び出しは必ずこれを通す。ワーカースレッドにはメインスレッドで取得したものを渡すこと。
+    """
+    return ClaudeGateway(get_anthropic_client(api_key))
 
 def get_mode_label(mode):
-    return {"trend": "📰 トレンド起点", "script": "📝 原稿変換", "image": "🖼️ 画像コメント"}.get(mode, mode)
+    return {"trend": "📰 トレンド起点", "script": "📝 原稿変換", "image": "🖼️ 画像コメント", "batch": "🌙 夜間事前生成"}.get(mode, mode)
 
 def get_char_limit_text(char_type):
     return {"standard": "標準ポスト（200〜280文字）", "long": "長文ポスト（400〜600文字）", "data": "データ付きポスト（100〜200文字）"}.get(char_type, "")
 
+def current_profile():
+    """サイドバーで選択中のパイプラインプロファイル"""
+    return st.session_state.get("pipeline_profile", DEFAULT_PROFILE)
+
 
 # ──────────────────────────────────────
 # Xトレンドキャッシュ読み込み（クラウド/同期用）
 # ──────────────────────────────────────
 
-@st.cache_data(ttl=600, show_spinner=False)
-def _fetch_trends_from_github():
-    """GitHubリポジトリからXトレンドキャッシュをAPI経由で取得（リデプロイ不要）
+@st.cache_resource(show_spinner=False)
+def _github_trends_state():
+    """GitHubから取得したトレンドキャッシュの最新版と再検証状態（プロセス全体で共有）"""
+    return {
+        "lock": threading.Lock(),
+        "etags": {},  # URLごとのETag（条件付きリクエスト用）
+        "etag": "",  # 現在の text を返したレスポンスのETag
+        "text": None,  # 最後に取得できたJSON文字列
+        "fetched_at": 0.0,
+        "next_check_at": 0.0,
+        "refreshing": False,
+        "error": None,
+    }
 
+
+def _conditional_get(url, etag, accept=None):
+    """If-None-Match 付きでGETする。304なら (None, etag) を返す"""
+    headers = {"User-Agent": "x-post-tool-streamlit"}
+    if accept:
+        headers["Accept"] = accept
+    if etag:
+        headers["If-None-Match"] = etag
+    req = urllib.request.Request(url, headers=headers)
+    try:
+        with urllib.request.urlopen(req, timeout=10) as resp:
+            return resp.read().decode("utf-8"), resp.headers.get("ETag", "")
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return None, etag
+        raise
+
+
+def _revalidate_github_trends(state):
+    """バックグラウンドで GitHub API → raw CDN の順に条件付き取得して state を更新"""
+    error = None
+    try:
+        sources = [
+            (GITHUB_TRENDS_API_URL, "application/vnd.github.v3.raw"),
+            # API のレート制限（未認証 60回/時）に掛かったときは raw CDN から取得
+            (GITHUB_TRENDS_RAW_URL, None),
+        ]
+        for url, accept in sources:
+            with state["lock"]:
+                etag = state["etags"].get(url, "")
+            try:
+                text, new_etag = _conditional_get(url, etag, accept)
+                if text is not None:
+                    json.loads(text)  # 壊れたデータで最後の正常版を上書きしない
+            except Exception as e:
+                error = e
+                continue
+            with state["lock"]:
+                if text is not None:
+                    state["text"] = text
+                    state["etag"] = new_etag or str(hash(text))
+                state["etags"][url] = new_etag
+                state["fetched_at"] = time.time()
+                state["next_check_at"] = state["fetched_at"] + GITHUB_REVALIDATE_SECONDS
+                state["error"] = None
+            return
+        with state["lock"]:
+            state["error"] = str(error) if error else None
+            state["next_check_at"] = time.time() + GITHUB_RETRY_SECONDS
+    finally:
+        with state["lock"]:
+            state["refreshing"] = False
+
+
+def _fetch_trends_from_github(force=False):
+    """GitHubリポジトリのXトレンドキャッシュを取得（リデプロイ不要・レンダーをブロックしない）
+
+    最後に取得できたデータを即座に返し、古くなっていればバックグラウンドで再検証する
+    （stale-while-revalidate）。初回は取得完了まで None を返し、呼び出し側はローカルファイルを使う。
+
+    Args:
+        force: True なら鮮度に関係なく再検証を開始する（🔄 更新ボタン用）
     Returns:
-        dict: キャッシュデータ（成功時）
-        None: 取得失敗時
+        dict: {"etag": ETag, "text": JSON文字列}（取得済みの場合）
+        None: まだ一度も取得できていない場合
     """
-    GITHUB_API_URL = "https://api.github.com/repos/Kota-kun777/x-post-tool/contents/x_trends_cache.json"
-    try:
-        headers = {
-            "Accept": "application/vnd.github.v3.raw",
-            "User-Agent": "x-post-tool-streamlit",
+    state = _github_trends_state()
+    with state["lock"]:
+        if not state["refreshing"] and (force or time.time() >= state["next_check_at"]):
+            state["refreshing"] = True
+            threading.Thread(target=_revalidate_github_trends, args=(state,), daemon=True).start()
+        if state["text"] is None:
+            return None
+        return {"etag": state["etag"], "text": state["text"]}
+
+
+def _github_trends_status():
+    """GitHub取得の状態（サイドバー表示用）"""
+    state = _github_trends_state()
+    with state["lock"]:
+        return {
+            "refreshing": state["refreshing"],
+            "fetched_at": state["fetched_at"],
+            "error": state["error"],
         }
-        req = urllib.request.Request(GITHUB_API_URL, headers=headers)
-        with urllib.request.urlopen(req, timeout=10) as resp:
-            return json.loads(resp.read().decode("utf-8"))
-    except Exception:
-        return None
 
 
-def _load_cache_data():
-    """キャッシュデータを取得（GitHub API優先 → ローカルファイル）"""
-    # 1. クラウド環境: GitHub API から最新を取得
+@st.cache_resource(show_spinner=False)
+def _trend_snapshot_registry():
+    """パース済みトレンドキャッシュの置き場（プロセス全体・全セッションで共有）
+
+    "local" はファイルの (mtime_ns, size)、"github" は ETag をキーにして、
+    元データが変わったときだけ JSON を再パースする。
+    """
+    return {"lock": threading.Lock(), "entries": {}}
+
+
+def _parse_trend_snapshot(text, source):
+    """キャッシュJSONをパースし、更新時刻を解釈済みのスナップショットにする"""
+    cache = json.loads(text)
+    try:
+        updated_at = datetime.fromisoformat(cache["updated_at"])
+        # 旧キャッシュ互換: タイムゾーン情報がない場合はJSTとして扱う
+        if updated_at.tzinfo is None:
+            updated_at = updated_at.replace(tzinfo=JST)
+    except (KeyError, TypeError, ValueError):
+        updated_at = None
+    return {"cache": cache, "source": source, "updated_at": updated_at}
+
+
+def _get_trend_snapshot(slot, key, load_text, source):
+    """key が前回と同じならパース済みスナップショットを返し、変わっていれば再パース"""
+    registry = _trend_snapshot_registry()
+    with registry["lock"]:
+        entry = registry["entries"].get(slot)
+        if entry and entry[0] == key:
+            return entry[1]
+    snapshot = _parse_trend_snapshot(load_text(), source)
+    with registry["lock"]:
+        registry["entries"][slot] = (key, snapshot)
+    return snapshot
+
+
+def _load_trend_snapshot():
+    """パース済みキャッシュを取得（GitHub API優先 → ローカルファイル）
+
+    Returns:
+        dict: {"cache": キャッシュデータ, "source": 取得元, "updated_at": 更新時刻}
+        None: キャッシュなし
+    """
+    # 1. クラウド環境: GitHub から取得済みの最新版（古ければ裏で再検証）
     if _is_cloud_environment():
-        cache = _fetch_trends_from_github()
-        if cache:
-            return cache, "GitHub"
+        fetched = _fetch_trends_from_github()
+        if fetched:
+            try:
+                key = fetched["etag"] or hash(fetched["text"])
+                return _get_trend_snapshot("github", key, lambda: fetched["text"], "GitHub")
+            except Exception:
+                pass
 
     # 2. フォールバック: ローカルファイル
-    if X_TRENDS_CACHE.exists():
-        try:
-            cache = json.loads(X_TRENDS_CACHE.read_text(encoding="utf-8"))
-            return cache, "ローカル"
-        except Exception:
-            pass
-    return None, None
+    try:
+        stat = X_TRENDS_CACHE.stat()
+        return _get_trend_snapshot(
+            "local", (stat.st_mtime_ns, stat.st_size),
+            lambda: X_TRENDS_CACHE.read_text(encoding="utf-8"), "ローカル",
+        )
+    except Exception:
+        return None
+
+
+def _snapshot_age_hours(snapshot):
+    return (datetime.now(JST) - snapshot["updated_at"]).total_seconds() / 3600
 
 
 def load_cached_x_trends(max_age_hours=24):
@@ -289,44 +443,29 @@ def load_cached_x_trends(max_age_hours=24):
         list: トレンドリスト（有効なキャッシュがある場合）
         None: キャッシュなし or 期限切れ
     """
-    cache, _source = _load_cache_data()
-    if cache is None:
+    snapshot = _load_trend_snapshot()
+    if snapshot is None or snapshot["updated_at"] is None:
         return None
-    try:
-        updated_at = datetime.fromisoformat(cache["updated_at"])
-        # 旧キャッシュ互換: タイムゾーン情報がない場合はJSTとして扱う
-        if updated_at.tzinfo is None:
-            updated_at = updated_at.replace(tzinfo=JST)
-        age_hours = (datetime.now(JST) - updated_at).total_seconds() / 3600
-        if age_hours > max_age_hours:
-            return None
-        return cache.get("trends", [])
-    except Exception:
+    if _snapshot_age_hours(snapshot) > max_age_hours:
         return None
+    return snapshot["cache"].get("trends", [])
 
 
 def get_cached_x_trends_info():
     """キャッシュの情報を取得（サイドバー表示用）"""
-    cache, source = _load_cache_data()
-    if cache is None:
-        return None
-    try:
-        updated_at = datetime.fromisoformat(cache["updated_at"])
-        # 旧キャッシュ互換: タイムゾーン情報がない場合はJSTとして扱う
-        if updated_at.tzinfo is None:
-            updated_at = updated_at.replace(tzinfo=JST)
-        age_hours = (datetime.now(JST) - updated_at).total_seconds() / 3600
-        # 表示はJSTに変換
-        display_time = updated_at.astimezone(JST)
-        return {
-            "updated_at": display_time.strftime("%Y/%m/%d %H:%M"),
-            "count": cache.get("count", 0),
-            "age_hours": round(age_hours, 1),
-            "is_fresh": age_hours <= 24,
-            "source": source,
-        }
-    except Exception:
+    snapshot = _load_trend_snapshot()
+    if snapshot is None or snapshot["updated_at"] is None:
         return None
+    age_hours = _snapshot_age_hours(snapshot)
+    # 表示はJSTに変換
+    display_time = snapshot["updated_at"].astimezone(JST)
+    return {
+        "updated_at": display_time.strftime("%Y/%m/%d %H:%M"),
+        "count": snapshot["cache"].get("count", 0),
+        "age_hours": round(age_hours, 1),
+        "is_fresh": age_hours <= 24,
+        "source": snapshot["source"],
+    }
 
 
 # ──────────────────────────────────────
@@ -414,426 +553,41 @@ def fetch_yahoo_realtime_supplementary():
     return unique[:12]
 
 
-def fetch_google_news():
-    """Google News RSSからトレンドニュースを取得"""
-    all_items = []
-
-    # ===== Google News Japan トップ =====
-    try:
-        feed = feedparser.parse("https://news.google.com/rss?hl=ja&gl=JP&ceid=JP:ja")
-        for entry in feed.entries[:10]:
-            title = entry.get("title", "")
-            source = ""
-            if " - " in title:
-                parts = title.rsplit(" - ", 1)
-                title, source = parts[0], parts[1]
-            item = {"title": title.strip(), "source": f"Google News / {source}".strip(),
-                    "link": entry.get("link", ""), "published": entry.get("published", ""), "origin": "google"}
-            if not any(n["title"] == item["title"] for n in all_items):
-                all_items.append(item)
-    except Exception:
-        pass
-
-    # ===== Google News ビジネス =====
-    try:
-        feed = feedparser.parse("https://news.google.com/rss/topics/CAAqJggKIiBDQkFTRWdvSUwyMHZNRGx6TVdZU0FtcGhHZ0pLVUNnQVAB?hl=ja&gl=JP&ceid=JP:ja")
-        for entry in feed.entries[:6]:
-            title = entry.get("title", "")
-            source = ""
-            if " - " in title:
-                parts = title.rsplit(" - ", 1)
-                title, source = parts[0], parts[1]
-            item = {"title": title.strip(), "source": f"Google News ビジネス / {source}".strip(),
-                    "link": entry.get("link", ""), "published": entry.get("published", ""), "origin": "google_biz"}
-            if not any(n["title"] == item["title"] for n in all_items):
-                all_items.append(item)
-    except Exception:
-        pass
-
-    # ===== Google News テクノロジー =====
-    try:
-        feed = feedparser.parse("https://news.google.com/rss/topics/CAAqJggKIiBDQkFTRWdvSUwyMHZNRGRqTVhZU0FtcGhHZ0pLVUNnQVAB?hl=ja&gl=JP&ceid=JP:ja")
-        for entry in feed.entries[:6]:
-            title = entry.get("title", "")
-            source = ""
-            if " - " in title:
-                parts = title.rsplit(" - ", 1)
-                title, source = parts[0], parts[1]
-            item = {"title": title.strip(), "source": f"Google News テクノロジー / {source}".strip(),
-                    "link": entry.get("link", ""), "published": entry.get("published", ""), "origin": "google_tech"}
-            if not any(n["title"] == item["title"] for n in all_items):
-                all_items.append(item)
-    except Exception:
-        pass
-
-    return all_items
-
-
-def fetch_related_news(keyword, max_results=5):
-    """Google News RSSから特定キーワードの関連ニュースを取得"""
-    try:
-        encoded = urllib.parse.quote(keyword)
-        url = f"https://news.google.com/rss/search?q={encoded}&hl=ja&gl=JP&ceid=JP:ja"
-        feed = feedparser.parse(url)
-        articles = []
-        for entry in feed.entries[:max_results]:
-            title = entry.get("title", "")
-            source = ""
-            if " - " in title:
-                parts = title.rsplit(" - ", 1)
-                title, source = parts[0], parts[1]
-            articles.append({"title": title, "source": source, "link": entry.get("link", ""), "published": entry.get("published", "")})
-        return articles
-    except Exception as e:
-        return []
-
 
 # ──────────────────────────────────────
 # AIによるトピック選定
 # ──────────────────────────────────────
 
-def ai_recommend_topics(news_items, api_key):
-    """Claudeにニュース一覧を渡し、すあし社長向きのトピックを厳選してもらう"""
-    client = anthropic.Anthropic(api_key=api_key)
-
-    # ソースタイプを明示
-    tagged_items = []
-    for i, n in enumerate(news_items):
-        origin = n.get('origin', '')
-        if origin == 'x_news':
-            tag = '[X]'
-        elif origin == 'yahoo_rt':
-            tag = '[Yahoo]'
-        else:
-            tag = '[News]'
-        tagged_items.append(f"{i+1}. {tag} {n['title']}（{n['source']}）")
-    news_list = "\n".join(tagged_items)
-
-    response = client.messages.create(
-        model=CLAUDE_MODEL,
-        max_tokens=2000,
-        system="""あなたはYouTube「大人の学び直しTV」（90万人登録）のすあし社長のX運用アドバイザーです。
-すあし社長の4つの柱は「国際情勢」「経済」「テクノロジー」「人生キャリア論」です。
-
-ニュース一覧から、すあし社長がXで取り上げるべきトピックを厳選してください。
-
-■ 選定基準（すあし社長との相性）
-- 経済・お金・投資に関連する話題 → ◎ 最高
-- AI・テクノロジーの社会的インパクト → ◎ 最高
-- 国際情勢が日本の生活に影響する話題 → ○ 高い
-- 社会構造の変化（人口・雇用・教育） → ○ 高い
-- 「常識だと思っていたことが実は違う」系 → ◎ 最高（常識転覆型のフック）
-- 数字やデータで驚きがある話題 → ◎ 最高（数字ショック型のフック）
-- 芸能・スポーツ・事件事故 → × 対象外
-
-■ 出力: JSON配列で返してください
-```json
-[
-  {
-    "index": 元のニュース番号,
-    "title": "ニュースタイトル",
-    "source_type": "x" または "news"（[X]なら"x"、[News]なら"news"）,
-    "reason": "すあし社長が取り上げるべき理由（1文）",
-    "angle": "切り口の提案（例：『○○と△△の逆説を突く』『過去の□□と比較して構造変化を示す』）",
-    "pillars": ["経済", "テクノロジー"],
-    "hook_type": "常識転覆型",
-    "score": 95
-  }
-]
-```
-scoreは0-100で、すあし社長との相性度。80点以上のもののみ選定（最大5つ）。""",
-        messages=[{"role": "user", "content": f"以下のニュース一覧から、すあし社長向きのトピックを厳選してください：\n\n{news_list}"}],
-    )
-
-    # JSONを抽出（堅牢なパーサー）
-    text = response.content[0].text
 
-    # 方法1: ```json ... ``` ブロックから抽出
-    code_match = re.search(r'```(?:json)?\s*\n?(\[[\s\S]*?\])\s*\n?```', text)
-    if code_match:
-        try:
-            return json.loads(code_match.group(1))
-        except json.JSONDecodeError:
-            pass
+def ai_recommend_topics(news_items, api_key, on_recommendation=None, profile=DEFAULT_PROFILE):
+    """Claudeにニュース一覧を渡し、すあし社長向きのトピックを厳選してもらう
 
-    # 方法2: 最も長い [ ... ] を見つける（貪欲マッチ）
-    bracket_matches = re.findall(r'\[[\s\S]*\]', text)
-    for match in sorted(bracket_matches, key=len, reverse=True):
-        try:
-            result = json.loads(match)
-            if isinstance(result, list) and len(result) > 0:
-                return result
-        except json.JSONDecodeError:
-            continue
+    ツール呼び出し（固定スキーマ）で受け取り、ストリーミング中に1件書き終わるごとに
+    on_recommendation(rec) を呼ぶ（配列の次の要素が始まった時点で前の要素は確定）。
+    """
+    gateway = get_claude_gateway(api_key)
+    request = apply_stage(build_recommend_request(news_items), profile, "recommend")
 
-    # 方法3: 行ごとに [ で始まる行から ] で終わる行までを抽出
-    lines = text.split('\n')
-    json_lines = []
-    in_json = False
-    for line in lines:
-        if line.strip().startswith('['):
-            in_json = True
-            json_lines = []
-        if in_json:
-            json_lines.append(line)
-        if in_json and line.strip().endswith(']'):
-            try:
-                return json.loads('\n'.join(json_lines))
-            except json.JSONDecodeError:
+    emitted = 0
+    with gateway.stream(priority=PRIORITY_INTERACTIVE, stage="recommend", **request) as stream:
+        for event in stream:
+            if event.type != "input_json" or not on_recommendation:
                 continue
+            recs = (event.snapshot or {}).get("recommendations") or []
+            # 最後の要素は書きかけの可能性があるので、それより前を確定として通知
+            for rec in recs[emitted:len(recs) - 1]:
+                on_recommendation(rec)
+            emitted = max(emitted, len(recs) - 1)
+        final = stream.get_final_message()
+    log_usage("recommend", final, request["max_tokens"], profile=profile)
 
-    return []
+    recommendations = extract_recommendations(final)
+    if on_recommendation:
+        for rec in recommendations[emitted:]:
+            on_recommendation(rec)
+    return recommendations
 
 
-# ──────────────────────────────────────
-# 高品質ポスト生成プロンプト
-# ──────────────────────────────────────
-
-ENHANCED_GENERATION_PROMPT = """
-
-## ■ 追加指示：このセッションでの生成品質を最大化する
-
-### すあし社長のトーン（最重要）
-
-すあし社長は**「わかりやすく仕組みを解説する知的な先生」**です。以下のトーンを必ず守ってください：
-- 一人称は必ず**「私」**を使う
-- 基本は**「です」「ます」の丁寧語**をベースに書く（全体の7割）
-- 要所で**「〜なんですよね」「〜だと思います」「〜かもしれません」**のような柔らかい表現を混ぜる（3割）
-- 上から目線ではなく、**「一緒に整理してみましょう」「一緒に考えてみませんか」**という姿勢
-- 読者を「授業に招く」感覚で、**仕組み・構造・メカニズムを順序立てて丁寧に解説する**
-- **含蓄のある一文**を要所に入れる（例:「税制は社会の鏡だと言われます」「課題が明確であることは、実は最大の武器です」）
-- 否定的・悲観的になりすぎず、最後は**読者に考える余地を残す問いかけ**で締める
-- 読後感は「なるほど、そういう仕組みだったのか」という**知的な発見**
-
-### 読みやすさのルール（重要）
-
-- **読点（、）を減らす。** 1文に読点は最大2つまで。読点の代わりに文を分けるか句点（。）で切る。
-  - ❌「石油価格が上がり、物価も上がり、家計が苦しくなる」
-  - ✅「石油価格が上がれば物価も上がる。家計が苦しくなるのは当然です」
-- **1文は短く。** 1文は40〜60文字を目安にする。長い文は2つに分ける。
-- **難しい言葉を使わない。** 専門用語はすぐ後に平易な言い換えを添える。
-  - ❌「地政学的リスクが顕在化している」
-  - ✅「国と国の位置関係が生むリスクが現実になっている」
-- **「つまり」「要するに」を活用。** 複雑な説明の後にひと言でまとめ直す。
-- **具体的な例え・スケール感を入れる。** 数字だけでなく身近なものに置き換える。
-  - ✅「幅33キロ。東京駅から千葉駅ほどの距離です」
-  - ✅「日本の人口が毎年90万人減っている。つまり毎年ほぼ堺市1つ分が消えている計算です」
-
-### 最重要：「前提知識の解説→比較→示唆」の文章構造
-
-すあし社長のポストは「意見表明」ではなく「前提を丁寧に教える→比較で驚きを与える→示唆で考えさせる」の構造が核心です。
-読者が「そもそもこれって何？」という疑問を持たないよう、前段でキーワードの意味や背景知識を分かりやすく説明してから本題に入ること。
-
-以下の6段構成を必ず守ってください：
-
-**① 冒頭フック: スクロールを止める1文**（1文）
-Xのタイムラインでスクロールの手を止めさせる「衝撃の事実」「意外な数字」「常識を覆す一言」で始める。
-良い例: 「幅わずか33キロの海峡が封鎖されただけで、世界の石油価格は一夜にして30%急騰する…」
-良い例: 「年収100億円の人の税率は、年収500万円のサラリーマンより低い。」
-良い例: 「バフェットは言いました。『私の秘書のほうが税率が高い』と。」
-悪い例: ❌「〜を整理してみましょう」（興味を引かない）
-悪い例: ❌「〜が話題になっています」（ニュースの繰り返し）
-冒頭1文で「え、どういうこと？」と思わせてから、解説に入ること。
-
-**② 前提知識+「なぜ？」の解説: そもそもこれは何か？なぜ起きているのか？を丁寧に教える**（4-6文）
-読者の多くが知らない前提知識を説明し、さらに「なぜこれが問題になっているのか」「なぜ今これが起きているのか」の理由を明示する。
-前提 → 理由（なぜ？） → 本題、の順番を守ること。「なぜ」を入れることで読者は「へぇ、そういう理由か」と腹落ちし、続きを読む動機が生まれる。
-
-- 地理的な話題 → 場所・位置関係を説明し → **なぜその場所が世界にとって重要なのか**を理由とセットで解説
-  - 良い例:「ホルムズ海峡は幅33キロ。ペルシャ湾から外海に出る唯一の出口です。なぜこんな狭い海峡が世界を揺るがすのか。世界の石油輸送量の約20%がここを通過しているからなんです」
-- 制度の話題 → 仕組みの基本を説明し → **なぜその制度が今問題になっているのか**を背景とセットで解説
-  - 良い例:「累進課税は収入が上がるほど税率が上がる仕組みです。最高税率は55%。なぜこれが議論になるのか。実は株の利益には別の税率が適用されて、どれだけ儲けても一律20%なんです」
-- 技術の話題 → 何ができるかを説明し → **なぜ今それが急速に広がっているのか**を理由とセットで解説
-
-「なぜ？」に対する答えが出たところで、「ここからが本題です」と自然に次の展開に入ること。
-
-**③ 歴史との比較: 過去の事例で裏付ける**（2-4文）
-過去に同様の出来事がどう起きたか、具体的な年代・数字・事件名で示す。
-歴史的事例があることで主張の説得力が格段に上がる。
-
-**④ 海外・他国との比較: 視野を世界に広げる**（2-4文）
-同じ問題が他の国でどう扱われているかを紹介する。
-具体的な国名・人名・制度名・数字を出す。「海外では〜」のような曖昧な表現はNG。
-日本と海外の違いを対比させて、構造的な差を浮き彫りにする。
-
-**⑤ 構造・メカニズムの解説: なぜそうなるのかを解き明かす**（2-4文）
-「なぜこんなことが起きるのか」→ 背後にある仕組み・力学を説明する。
-ここが最も価値のある部分。表面的な現象ではなく、根本的な構造を読者に見せる。
-**知的なウィット**を効かせること。皮肉・逆説・パラドックスを使って「なるほど、そう繋がるのか」と思わせる。
-- 良い例:「皮肉なことに、少子化という"弱点"が、AI時代には"構造的な強み"に変わるかもしれません」
-- 良い例:「覇権国でさえコントロールできない状況が生まれている。世界秩序の設計図そのものが書き換わりつつあるんです」
-- 避ける: 単調な因果説明だけで終わること。構造を見せた上で「面白い逆転現象」や「意外な帰結」を一言添える。
-
-**⑥ 締め: 含蓄とウィットのある一文で余韻を残す**（1-2文）
-「だからこうすべき」ではなく、読者の知性に委ねるように終わる。
-格言的・箴言的な表現、歴史や文学の知恵を借りた比喩、パラドックスを活かした一文で締める。
-**暗くならず、読後に「知ることって面白い」「まだやれる」と感じさせる余韻を残す。**
-- 良い例:「税制は社会の鏡だと言われます。私たちがどんな社会を目指すのか、その答えがここに現れているような気がします」
-- 良い例:「古い地図では新しい世界を歩けない。しかし地図を描き直せるのもまた、人間だけです」
-- 良い例:「課題が明確であることは、実は最大の武器です」
-- 避ける: ❌「〜に注意が必要です」（評論家の月並みな締め） ❌「今後の動向を注視しましょう」（NHKニュース的）
-
-### 最高品質のお手本（この水準を目指す）
-
-**お手本A: 税制の解説型ポスト**
-> 税制の仕組みを整理してみましょう。給与所得は累進課税で、年収が上がるほど税率も上がります。最高税率は55％（所得税45％+住民税10％）。ところが株式などの金融所得は「分離課税」で、どれだけ儲けても一律20％なんです。つまり年収1000万円のサラリーマンは33％の税率なのに、株で1億円稼いだ人は20％。この構造が「1億円の壁」を生んでいるんですよね。
-> 実際の数字を見てみると、年収5000万円の人は実効税率約40％。ところが年収100億円の人は約23％まで下がっていました。なぜこんなことが起きるのか。答えは「お金持ちほど株で稼ぐから」です。年収1000万円の人は給与が中心ですが、年収100億円の人は収入の大部分が株の売却益や配当になります。
-> アメリカではこれを「バフェット・ルール」と呼んで問題視しています。投資の神様ウォーレン・バフェットが「私の秘書のほうが税率が高いのはおかしい」と発言したことから始まった議論です。まさに今の日本と同じ構造なんですよね。
-> ただし、本当の問題はここからかもしれません。超富裕層の多くはグローバルに資産を分散させている。シンガポールの税率は最高17％、UAEは0％です。日本の競争力を保ちながら格差是正もする、このバランスをどう取るか。税制は社会の鏡だと言われます。私たちがどんな社会を目指すのか、その答えがここに現れているような気がします。
-
-**このポストが最高品質である理由:**
-1. 「整理してみましょう」と解説モードで入る → 読者を授業に招く
-2. 累進課税55％ vs 分離課税20％ → 仕組みを具体的な数字で対比
-3. 「なぜこんなことが起きるのか」→ メカニズムを丁寧に解き明かす
-4. 「バフェット・ルール」→ 他国の具体的な事例で視野を広げる
-5. シンガポール17％、UAE 0％ → 国際比較の数字で議論を立体的にする
-6. 「税制は社会の鏡」→ 含蓄のある一文で余韻を残す締め
-7. 全体が「ニュースの感想」ではなく「構造の解説」になっている
-
-**お手本B: 少子化の逆転発想型ポスト**
-> 出生数70万人。「日本やばい」という声、私もよく耳にします。でもちょっと逆の視点で見てみてほしいんです。これから10年でAIが本格的に仕事を代替し始めたとき、人口14億の中国やインドでは何が起きるか。大量の失業者が溢れるリスクと隣り合わせになるんですよね。
-> 一方で人口が減り続ける日本は、「AIが仕事を奪う速度」と「人口が減る速度」がちょうど噛み合う可能性があります。皮肉なことに、少子化という「弱点」が、AI時代には「構造的な強み」に変わるかもしれません。
-> 課題が明確であることは、実は最大の武器です。少子化を悲観するだけではなく、「AI国家になる」という発想の転換ができるかどうか。そこが分かれ道だと思います。
-
-### 絶対にやってはいけないこと（NGパターン）
-
-- ❌ 「〜が話題になっています」で始める（ニュースのオウム返し）
-- ❌ 感想や意見だけを並べる（「これは大変なことです」「注目すべきです」）
-- ❌ 仕組みの解説なしに結論を述べる（読者が「なぜ？」と思う）
-- ❌ 数字を1つだけ出す（比較対象がなければインパクトがない）
-- ❌ 「〜すべきだ」「〜しなければならない」で上から目線で説教する
-- ❌ 抽象的な表現だけで具体例がない（「経済に影響がある」→ どう影響？）
-
-### 3つの案の方向性について
-
-3つのポスト案は**固定のパターンではなく、選ばれたトレンドに最適な切り口を考えて決める**こと。
-トレンドの内容を分析し、以下の中から最も効果的な3つの方向性を選択する：
-
-- **地理・地政学の切り口** — 地理的な位置関係や地政学的影響を軸に解説
-- **歴史の繰り返し切り口** — 過去の類似事例との比較で未来を示唆
-- **経済インパクト切り口** — 個人の家計・投資・キャリアへの影響を逆算
-- **テクノロジー変革切り口** — 技術革新が構造をどう変えるかを解説
-- **構造暴露切り口** — 表面からは見えない仕組みや力学を解き明かす
-- **逆転発想切り口** — 常識の逆を突いて新しい視点を提供
-- **自分ごと変換切り口** — 遠い話題を読者の日常に結びつける
-
-**重要:** 3案すべてが同じ方向性にならないこと。異なる角度からトレンドを切ることで、最も刺さる案を選べるようにする。
-
-### 絶対ルール: 最新情報の検索は生成前に必ず実施
-
-ポストを生成する前に、必ずWeb検索で最新情報を収集し、その情報を参照して事実に基づいた正確な記述にすること。
-検索結果がない場合でも、自身の知識の範囲で最新の状況を反映し、不確実な情報には留保をつけること。
-
-### 事前ファクトチェック（生成時に必ず実行）
-
-ポストを出力する前に、以下のファクトチェックを内部で実施し、**クリアしたもののみ出力すること**：
-- 引用した数字・統計は信頼できるソースに基づいているか
-- 歴史的事実（年代・人名・事件名）に誤りがないか
-- 国名・地名・制度名が正確か
-- 因果関係の論理に飛躍がないか
-- 不確実な情報には「〜と言われている」「〜の可能性がある」と留保をつけているか
-ファクトチェックで不合格の部分がある場合は、修正してから出力する。
-
-### 今回の生成で必ず守ること
-
-1. **冒頭1文は「スクロールを止める衝撃の事実・数字・問い」で始める**
-   「幅わずか33キロの海峡が封鎖されただけで、石油価格は30%急騰する」のような意外性ある事実。
-   ニュースの要約や「〜してみましょう」からは絶対に始めない。
-
-2. **前提知識を丁寧に解説してから比較に入る**
-   読者が「それって何？」と思うキーワードや概念を、先に分かりやすく説明する。
-   地理→歴史→構造の順序で積み上げていく。
-
-3. **数字は必ず「比較セット」で使う**
-   「A は○％」だけでなく「Aは○％なのに、Bは△％」の対比で驚きを生む。
-
-4. **歴史との比較・海外との比較を必ず入れる**
-   具体的な年代・国名・人名・制度名を出す。抽象的な「海外では〜」はNG。
-
-5. **締めは「示唆」であって「主張」ではない**
-   「〜だと言われます」「〜な気がします」で余韻を残す。
-   読者自身に考えさせる終わり方にする。
-
-6. **500〜800文字を厳守する**
-   短すぎて浅くならず、長すぎてダレない。この範囲に収める。
-
-### 出力フォーマットの注意
-
-- ポスト本文には**マークダウン記法を一切使わないでください**（**太字**、# 見出し、- リスト等は禁止）
-- 装飾なしのプレーンテキストで自然な文章として書いてください
-- 改行は段落の区切りにのみ使ってください（文の途中で改行しない）
-"""
-
-
-# ──────────────────────────────────────
-# ポスト解析
-# ──────────────────────────────────────
-
-def parse_generated_posts(text):
-    posts = []
-    # 【案1】【案2】【案3】 フォーマット
-    pattern = r'【案(\d+)】'
-    parts = re.split(pattern, text)
-
-    # 1000字版/1500字版 フォーマット（互換性）
-    alt_pattern = r'【(1000字版|1500字版|ショート|ミドル|ロング)】'
-    alt_parts = re.split(alt_pattern, text)
-
-    if len(parts) >= 3:
-        # 【案1】【案2】【案3】 フォーマット
-        for i in range(1, len(parts), 2):
-            number = int(parts[i])
-            content = parts[i + 1].strip() if i + 1 < len(parts) else ""
-            lines = content.split("\n")
-            title_line = lines[0].strip() if lines else ""
-
-            # 本文抽出（メタデータ行を除外）
-            body_lines = []
-            meta_started = False
-            for line in lines:
-                s = line.strip()
-                if any(s.startswith(p) or s.startswith(f"**{p}") for p in ["文字数", "投稿タイミング", "品質スコア", "---"]):
-                    meta_started = True
-                if s.startswith("| チェック") or s.startswith("|----"):
-                    meta_started = True
-                if not meta_started and s and s != title_line and not s.startswith("（想定する"):
-                    body_lines.append(line)
-            body = "\n".join(body_lines).strip()
-
-            score_match = re.search(r'品質スコア[：:]\s*\*{0,2}(\d+)\s*/\s*100', content)
-            score = score_match.group(1) if score_match else ""
-
-            posts.append({
-                "number": number, "raw": content, "title": title_line,
-                "body": body, "score": score, "emotion": "", "hook": "", "timing": ""
-            })
-    elif len(alt_parts) >= 3:
-        # 互換フォーマット
-        label_map = {"1000字版": ("📝", 1), "1500字版": ("📖", 2), "ショート": ("📱", 1), "ミドル": ("📝", 2), "ロング": ("📖", 3)}
-        for i in range(1, len(alt_parts), 2):
-            label = alt_parts[i]
-            content = alt_parts[i + 1].strip() if i + 1 < len(alt_parts) else ""
-            emoji, num = label_map.get(label, ("", i))
-            lines = content.split("\n")
-            title_line = lines[0].strip() if lines else ""
-            body_lines = []
-            meta_started = False
-            for line in lines:
-                s = line.strip()
-                if any(s.startswith(p) or s.startswith(f"**{p}") for p in ["文字数", "品質スコア", "---"]):
-                    meta_started = True
-                if not meta_started and s and s != title_line:
-                    body_lines.append(line)
-            body = "\n".join(body_lines).strip()
-            score_match = re.search(r'品質スコア[：:]\s*\*{0,2}(\d+)', content)
-            score = score_match.group(1) if score_match else ""
-            posts.append({"number": num, "raw": content, "title": f"{emoji} {label}",
-                          "body": body, "score": score, "emotion": "", "hook": label, "timing": ""})
-    else:
-        # フォールバック: そのまま表示
-        posts.append({"number": 1, "raw": text, "title": "", "body": text,
-                       "score": "", "emotion": "", "hook": "", "timing": ""})
-    return posts
 
 
 # ──────────────────────────────────────
@@ -865,204 +619,436 @@ def post_to_x(text, image_data=None):
         return {"success": False, "error": str(e)}
 
 
-def generate_with_claude(messages, system_prompt):
+STREAM_RENDER_INTERVAL = 0.25  # ストリーミング表示の再描画間隔（秒）
+
+
+def _render_streaming_posts(text, slots, container):
+    """生成途中のテキストを【案N】ごとに分けてライブ表示"""
+    for post in parse_generated_posts(text):
+        n = post["number"]
+        if n not in slots:
+            slots[n] = container.empty()
+        body_html = post["body"].replace("\n", "<br>")
+        title = f"【案{n}】{post['title']}" if post["title"] else "生成中..."
+        slots[n].markdown(
+            f'<div style="font-weight:600;color:#1DA1F2;">{title}</div>'
+            f'<div style="line-height:1.8;font-size:0.9rem;color:rgba(255,255,255,0.8);'
+            f'padding:0.3rem 0 0.8rem 0;">{body_html}</div>',
+            unsafe_allow_html=True,
+        )
+
+
+def generate_with_claude(messages, system_prompt, on_post_complete=None, max_tokens=None):
+    """ストリーミングで生成し、トークン到着ごとに各案をライブ表示（戻り値は全文）
+
+    Args:
+        on_post_complete: 案が1つ書き終わるたびに呼ばれるコールバック（post dict を受け取る）。
+                          後続のファクトチェックを生成と並行して始めるために使う
+        max_tokens: 出力上限（既定はプロファイルの生成設定＝3案分。1案だけの修正は rewrite_max_tokens で本文の長さから決める）
+    """
     api_key = st.session_state.get("anthropic_api_key", "")
     if not api_key:
         st.error("🔑 サイドバーから Anthropic API Key を設定してください。")
         st.stop()
-    client = anthropic.Anthropic(api_key=api_key)
-    with st.spinner("🤖 すあし社長スタイルのポストを生成中..."):
-        response = client.messages.create(model=CLAUDE_MODEL, max_tokens=8192, system=system_prompt, messages=messages)
-    return response.content[0].text
+    gateway = get_claude_gateway(api_key)
+    profile = current_profile()
+    stage = stage_config(profile, "generate")
+    max_tokens = max_tokens or stage["max_tokens"]
+
+    status = st.empty()
+    status.info("🤖 すあし社長スタイルのポストを生成中...")
+    live = st.container()
+    slots = {}
+    chunks = []
+    parser = PostStreamParser()
+    started = time.perf_counter()
+    ttft = None
+    last_render = 0.0
+
+    try:
+        with gateway.stream(priority=PRIORITY_INTERACTIVE, stage="generate", model=stage["model"],
+                            max_tokens=max_tokens, system=system_prompt, messages=messages) as stream:
+            for text in stream.text_stream:
+                now = time.perf_counter()
+                if ttft is None:
+                    ttft = now - started
+                    status.info(f"✍️ 生成中...（最初のトークンまで {ttft:.1f}秒）")
+                chunks.append(text)
+                if on_post_complete:
+                    for post in parser.feed(text):
+                        on_post_complete(post)
+                if now - last_render >= STREAM_RENDER_INTERVAL:
+                    _render_streaming_posts("".join(chunks), slots, live)
+                    last_render = now
+            final = stream.get_final_message()
+    except anthropic.APIError as e:
+        status.empty()
+        st.error(f"❌ 生成に失敗しました: {describe_error(e)}")
+        st.stop()
+
+    result = "".join(block.text for block in final.content if block.type == "text")
+    if on_post_complete:
+        for post in parser.finish(result):
+            on_post_complete(post)
+    _render_streaming_posts(result, slots, live)
+    elapsed = time.perf_counter() - started
+    usage = log_usage("generate", final, max_tokens, profile=profile)
+    status.caption(
+        f"⚡ 最初のトークンまで {ttft or elapsed:.1f}秒 / 生成完了まで {elapsed:.1f}秒"
+        f" / キャッシュ読込 {usage.get('cache_read', 0):,}トークン"
+    )
+    return result
+
 
 
 # ──────────────────────────────────────
-# Web検索（トピックの最新情報収集）
+# ファクトチェックエージェント
 # ──────────────────────────────────────
 
-def search_topic_facts(topic_title, max_results=5):
-    """Google News RSSとフリーの検索APIでトピックの最新ファクトを収集"""
-    facts = []
+FACTCHECK_MAX_WORKERS = 3  # 並列ファクトチェックの同時実行数
+CLAUDE_MAX_CONCURRENCY = 4  # 並列実行するClaude呼び出しの同時実行数（全セッション共通）
 
-    # Google News RSSで最新記事を取得
-    try:
-        encoded = urllib.parse.quote(topic_title)
-        url = f"https://news.google.com/rss/search?q={encoded}&hl=ja&gl=JP&ceid=JP:ja"
-        feed = feedparser.parse(url)
-        for entry in feed.entries[:max_results]:
-            title = entry.get("title", "")
-            source = ""
-            if " - " in title:
-                parts = title.rsplit(" - ", 1)
-                title, source = parts[0], parts[1]
-            published = entry.get("published", "")
-            facts.append(f"[{source}] {title}（{published}）")
-    except Exception:
-        pass
 
-    # DuckDuckGo Instant Answer API（補足）
-    try:
-        ddg_url = f"https://api.duckduckgo.com/?q={urllib.parse.quote(topic_title)}&format=json&no_html=1&skip_disambig=1"
-        req = urllib.request.Request(ddg_url, headers={
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-        })
-        resp = urllib.request.urlopen(req, timeout=5)
-        data = json.loads(resp.read().decode("utf-8"))
-        # AbstractTextから要約を取得
-        abstract = data.get("AbstractText", "")
-        if abstract and len(abstract) > 20:
-            facts.append(f"[参考] {abstract[:200]}")
-        # RelatedTopicsからも取得
-        for rt in data.get("RelatedTopics", [])[:3]:
-            text = rt.get("Text", "")
-            if text and len(text) > 15:
-                facts.append(f"[関連] {text[:150]}")
-    except Exception:
-        pass
+@st.cache_resource(show_spinner=False)
+def _claude_call_slots():
+    """並列Claude呼び出しで共有する同時実行数の上限（プロセス全体で1つ）"""
+    return threading.BoundedSemaphore(CLAUDE_MAX_CONCURRENCY)
 
-    return facts
 
+def _call_factcheck(gateway, post_body, search_results_text="", profile=DEFAULT_PROFILE, stage="factcheck",
+                    priority=PRIORITY_NORMAL, request=None):
+    """ファクトチェックのAPI呼び出し本体（Streamlitに依存しないのでスレッドから呼べる）
 
-def search_facts_for_topics(selected_topics, progress=None):
-    """選択されたトピック群に対して最新情報を検索"""
-    all_facts = {}
-    for i, topic in enumerate(selected_topics):
-        title = topic if isinstance(topic, str) else topic.get("title", "")
-        # トピック名からポスト数の情報を除去
-        clean_title = re.sub(r'\s*\(\d[\d,]*件のポスト\)', '', title).strip()
-        if not clean_title:
-            continue
-        if progress:
-            progress.info(f"🔍 最新情報を検索中 [{i+1}/{len(selected_topics)}]: {clean_title[:30]}...")
-        facts = search_topic_facts(clean_title)
-        if facts:
-            all_facts[clean_title] = facts
-    return all_facts
+    stage: "factcheck"（初回）/ "recheck"（自動修正後の再チェック）でモデルを切り替える
+    本文・検索コンテキスト・モデルが同じチェック済みの結果があれば Claude を呼ばずにそれを返す。
+    request: 差分チェックなど独自のリクエストを使う場合に指定（post_body はキャッシュキーにだけ使う）
+    全文のチェックでは先に数字・固有名詞を検索結果と照合し、全て見つかれば暫定 ✅ を返す。
+    過去に確認済みの文（claim_store）はプロンプトから外し、残りの文だけを確認させる。
 
+    Returns:
+        (str, datetime | None): チェック結果と、キャッシュから返した場合はそのチェック日時
+    """
+    index = claim_grounding.ClaimIndex(search_results_text)
+    whole_post = request is None  # 差分チェックの抜粋は確認済みの知識に入れない
+    if request is None:
+        try:
+            verified = claim_store.verified_sentences(post_body)
+        except Exception as e:
+            logger.warning("verified sentence lookup failed: %s", e)
+            verified = set()
+        if search_results_text and claim_prepass_enabled(profile):
+            grounding = claim_grounding.ground_post(post_body, index, verified)
+            claim_grounding.record_prepass(grounding["passed"])
+            if grounding["passed"]:
+                logger.info("claude %s: skipped, %d sentence(s) grounded locally", stage, len(grounding["grounded"]))
+                return claim_grounding.provisional_factcheck_text(grounding), None
+        request = apply_stage(build_factcheck_request(post_body, search_results_text), profile, stage)
+        sentences = split_sentences(post_body)
+        unverified = [i for i, s in enumerate(sentences) if s not in verified]
+        # 全ての文が確認済みでも確認済みの知識だけでは ✅ にしない（通常どおり全文をチェック）
+        if unverified and len(unverified) < len(sentences):
+            logger.info("claude %s: %d verified sentence(s) left out of the prompt", stage, len(sentences) - len(unverified))
+            partial = build_diff_factcheck_request(diff_focus_text(post_body, unverified), len(unverified),
+                                                   search_results_text)
+            request = {**partial, "model": request["model"],
+                       "max_tokens": min(partial["max_tokens"], request["max_tokens"])}
+    key = factcheck_cache.cache_key(post_body, search_results_text, request["model"], request["system"])
+    try:
+        cached = factcheck_cache.lookup(key)
+    except Exception as e:
+        logger.warning("factcheck cache lookup failed: %s", e)
+        cached = None
+    if cached:
+        logger.info("claude %s: cache hit (%s)", stage, cached[1].strftime("%Y-%m-%d %H:%M"))
+        return cached
+    check_started = time.perf_counter()
+    response = gateway.create(priority=priority, stage=stage, **request)
+    claim_grounding.record_llm_check(time.perf_counter() - check_started)
+    log_usage(stage, response, request["max_tokens"], profile=profile)
+    fc_text = extract_factcheck_text(response)
+    try:
+        factcheck_cache.store(key, request["model"], fc_text)
+        if whole_post:
+            claim_store.record_factcheck(post_body, fc_text, index, request["model"])
+    except Exception as e:
+        logger.warning("factcheck cache store failed: %s", e)
+    return fc_text, None
 
-# ──────────────────────────────────────
-# ファクトチェックエージェント
-# ──────────────────────────────────────
 
-FACTCHECK_SYSTEM_PROMPT = """あなたは事実確認の専門家です。
-Xに投稿するポスト原稿を受け取り、以下の観点でチェックしてください。
-
-■ チェック観点:
-1. 事実誤認: 数字・人名・政策名・日付・政権名など、明確な事実の誤りがないか
-2. 時制の誤り: 過去の出来事を現在形で書いていないか、現在の状況を過去形で書いていないか
-3. ミスリード: 正確だが文脈を省略することで誤解を生む表現がないか
-4. 偏り・バイアス: 一方的な見方になっていないか
-
-■ 出力フォーマット:
-まず全体の判定を出してください:
-✅ 問題なし / ⚠️ 要確認あり / ❌ 誤りあり
-
-その後、具体的な指摘があれば以下の形式で:
----
-【指摘1】
-- 該当箇所: 「原稿中の該当テキスト」
-- 問題: 具体的に何が問題か
-- 正しい情報: 検索結果に基づく正確な情報
-- 修正案: こう書き換えるべき
-
-【指摘2】
-...
----
-指摘がなければ「具体的な指摘事項はありません。」と書いてください。
-
-■ 重要ルール:
-- 「提供された検索結果」にある情報を根拠にすること
-- 根拠がない推測は避け、判断できない場合は「確認推奨」と明記すること
-- 明確な誤り以外は過度に指摘しないこと（些末な表現の好みは指摘しない）
-"""
+def run_diff_factcheck(post_body, changed, search_results_text="", stage="factcheck"):
+    """修正で変わった文（changed）だけをファクトチェック（戻り値は run_factcheck と同じ形）"""
+    api_key = st.session_state.get("anthropic_api_key", "")
+    profile = current_profile()
+    if not api_key or not stage_config(profile, stage)["enabled"]:
+        return None, None
+    focus_text = diff_focus_text(post_body, changed)
+    search_results_text = factcheck_context(fact_search.FactIndex(search_results_text), focus_text)
+    request = build_diff_factcheck_request(focus_text, len(changed), search_results_text)
+    request = apply_stage(request, profile, stage)
+    with st.spinner(f"🔍 変更された{len(changed)}文をファクトチェック中..."):
+        return _call_factcheck(get_claude_gateway(api_key), focus_text, search_results_text, profile, stage,
+                               priority=PRIORITY_INTERACTIVE, request=request)
 
 
-def run_factcheck(post_body, search_results_text=""):
-    """ファクトチェックエージェントを実行"""
+def run_factcheck(post_body, search_results_text="", stage="factcheck"):
+    """ファクトチェックエージェントを実行
+
+    Returns:
+        (str | None, datetime | None): チェック結果（プロファイルでOFFの段階なら None）と、キャッシュ利用時のチェック日時
+    """
     api_key = st.session_state.get("anthropic_api_key", "")
-    if not api_key:
-        return None
-    client = anthropic.Anthropic(api_key=api_key)
+    profile = current_profile()
+    if not api_key or not stage_config(profile, stage)["enabled"]:
+        return None, None
+    search_results_text = factcheck_context(fact_search.FactIndex(search_results_text), post_body)
+    with st.spinner("🔍 ファクトチェック中..."):
+        return _call_factcheck(get_claude_gateway(api_key), post_body, search_results_text, profile, stage,
+                               priority=PRIORITY_INTERACTIVE)
 
-    user_msg = f"""以下のXポスト原稿をファクトチェックしてください。
 
-■ ポスト原稿:
-{post_body}
+def _call_auto_fix(gateway, post_body, fc_text, search_text, system_prompt, profile=DEFAULT_PROFILE,
+                   priority=PRIORITY_NORMAL):
+    """自動修正の本体（Streamlitに依存しないのでスレッドから呼べる）
 
-■ 検索で得られた最新情報（参考にしてください）:
-{search_results_text if search_results_text else "（検索結果なし — あなたの知識のみで判断してください）"}
+    指摘の該当箇所を修正案で置き換えられればローカルで直し、できない場合だけ Claude に全文を書き直させる。
+    """
+    patched = apply_factcheck_patches(post_body, fc_text)
+    if patched is not None:
+        logger.info("claude auto_fix: patched %d span(s) locally", len(parse_factcheck_findings(fc_text)))
+        return patched
+    request = apply_stage(build_auto_fix_request(post_body, fc_text, search_text, system_prompt), profile, "auto_fix")
+    response = gateway.create(priority=priority, stage="auto_fix", **request)
+    log_usage("auto_fix", response, request["max_tokens"], profile=profile)
+    return response.content[0].text.strip()
 
-■ 現在の日付: {datetime.now(JST).strftime('%Y年%m月%d日')}
-※ 現在のアメリカ大統領はドナルド・トランプ（第2期、2025年1月就任）です。
-"""
 
-    with st.spinner("🔍 ファクトチェック中..."):
-        response = client.messages.create(
-            model=CLAUDE_MODEL,
-            max_tokens=2000,
-            system=FACTCHECK_SYSTEM_PROMPT,
-            messages=[{"role": "user", "content": user_msg}],
-        )
-    return response.content[0].text
+def _factcheck_and_fix(slots, gateway, post_body, search_text, system_prompt, profile=DEFAULT_PROFILE,
+                       priority=PRIORITY_NORMAL):
+    """1案分のファクトチェック → 指摘があれば自動修正 → 再チェック（ワーカースレッド用）
 
+    自動修正・再チェックはプロファイルでONの場合のみ。
 
-def _auto_fix_factcheck_issues(posts, fc_results, search_text, system_prompt, progress=None):
-    """ファクトチェックで要確認・誤りありの案を自動修正して返す"""
-    api_key = st.session_state.get("anthropic_api_key", "")
-    if not api_key:
-        return {}
-    client = anthropic.Anthropic(api_key=api_key)
-    auto_fixed = {}
+    Returns:
+        dict: {"fc": ファクトチェック結果, "fixed": 修正版本文 or None,
+               "recheck": 修正版の再チェック結果 or None, "fix_error": 修正失敗時の例外,
+               "fc_cached" / "recheck_cached": キャッシュから返した場合のチェック日時 or None}
+    """
+    with slots:
+        fc_text, fc_cached = _call_factcheck(gateway, post_body, search_text, profile, priority=priority)
+    result = {"fc": fc_text, "fixed": None, "recheck": None, "fix_error": None,
+              "fc_cached": fc_cached, "recheck_cached": None}
+    if needs_auto_fix(fc_text) and stage_config(profile, "auto_fix")["enabled"]:
+        try:
+            with slots:
+                result["fixed"] = _call_auto_fix(gateway, post_body, fc_text, search_text, system_prompt, profile,
+                                                 priority=priority)
+            if stage_config(profile, "recheck")["enabled"]:
+                with slots:
+                    result["recheck"], result["recheck_cached"] = _call_factcheck(
+                        gateway, result["fixed"], search_text, profile, "recheck", priority=priority,
+                    )
+        except Exception as e:
+            result["fix_error"] = e
+    return result
 
-    for post in posts:
-        fc_text = fc_results.get(post["number"], "")
-        if not fc_text:
-            continue
-        # ⚠️ 要確認あり or ❌ 誤りあり の場合のみ修正
-        if "⚠️" not in fc_text and "❌" not in fc_text:
-            continue
 
-        if progress:
-            progress.info(f"🔧 案{post['number']}のファクトチェック指摘を自動修正中...")
+def _merge_factcheck_result(post, result, fc_results, auto_fixed, fc_cached=None):
+    """1案分の _factcheck_and_fix の結果を fc_results / auto_fixed に反映（自動修正の失敗は例外を返す）
 
-        fix_msg = f"""以下のXポストに対してファクトチェックで指摘がありました。
-指摘内容に基づいて、事実関係を修正した改善版を生成してください。
+    fc_cached: キャッシュから返した案の {案番号: チェック日時の文字列}（FCパネルの表示用）
+    """
+    if result["fc"]:
+        fc_results[post["number"]] = result["fc"]
+        if result["fc_cached"] and fc_cached is not None:
+            fc_cached[post["number"]] = result["fc_cached"].strftime("%m/%d %H:%M")
+    if result["fix_error"]:
+        return result["fix_error"]
+    if result["fixed"]:
+        auto_fixed[post["number"]] = {
+            "original": post["body"],
+            "fixed": result["fixed"],
+            "fc_text": result["fc"],
+            "recheck_text": result["recheck"],
+            "recheck_cached": result["recheck_cached"].strftime("%m/%d %H:%M") if result["recheck_cached"] else None,
+        }
+    return None
 
-■ 元のポスト:
-{post['body']}
 
-■ ファクトチェックの指摘:
-{fc_text}
+class FactcheckPipeline:
+    """生成ストリームの後ろでファクトチェック→自動修正を案ごとに並行して進める
 
-■ 参考情報（最新の検索結果）:
-{search_text if search_text else '（なし）'}
+    generate_with_claude(on_post_complete=pipeline.submit) で書き終わった案から順に投入し、
+    生成完了後に collect() で全案の結果を待ち合わせる。
+    """
 
-■ ルール:
-- ファクトチェックで指摘された箇所のみ修正する（全体の構成やトーンは維持）
-- すあし社長の「解説型」トーンを維持する
-- 不確実な情報には「〜と言われている」「〜の可能性がある」と留保をつける
-- 修正後のポストのみを出力する（タイトルや説明は不要）
-- マークダウン記法は使わない
-- 600〜800文字を目安にする
-"""
+    def __init__(self, search_text, system_prompt):
+        api_key = st.session_state.get("anthropic_api_key", "")
+        self.gateway = get_claude_gateway(api_key) if api_key else None
+        # 検索結果は一度だけ索引化し、案ごとに関連の高い行だけを予算内で渡す
+        self.fact_index = fact_search.FactIndex(search_text)
+        self.system_prompt = system_prompt
+        # プロファイルはメインスレッドで確定させてワーカーに渡す
+        self.profile = current_profile()
+        self.enabled = stage_config(self.profile, "factcheck")["enabled"]
+        self.slots = _claude_call_slots()
+        self.executor = ThreadPoolExecutor(max_workers=FACTCHECK_MAX_WORKERS)
+        self.jobs = {}  # 案番号 → (投入時の本文, future)
+        self.cache_hits = {}  # キャッシュから返した案番号 → チェック日時（collect 後に参照）
+
+    def submit(self, post):
+        """書き終わった案のファクトチェックを開始（同じ本文の再投入は無視）"""
+        if self.gateway is None or not self.enabled or not post.get("body"):
+            return
+        job = self.jobs.get(post["number"])
+        if job and job[0] == post["body"]:
+            return
+        future = self.executor.submit(
+            _factcheck_and_fix, self.slots, self.gateway, post["body"], factcheck_context(self.fact_index, post["body"]),
+            self.system_prompt,
+            self.profile,
+        )
+        self.jobs[post["number"]] = (post["body"], future)
+
+    def collect(self, posts, progress=None):
+        """全案の完了を待ち、(fc_results, auto_fixed) を従来と同じ形で返す"""
+        for post in posts:
+            self.submit(post)  # ストリーム中に確定しなかった案・本文が変わった案を補完
+        if not self.jobs:
+            self.executor.shutdown(wait=False)
+            return {}, {}
+        if progress:
+            progress.info(f"🔍 ファクトチェック・自動修正の完了を待っています（{len(self.jobs)}案）...")
+
+        fc_results, auto_fixed = {}, {}
+        with st.spinner("🔍 ファクトチェック中..."):
+            for post in posts:
+                job = self.jobs.get(post["number"])
+                if not job:
+                    continue
+                try:
+                    result = job[1].result()
+                except Exception as e:
+                    st.warning(f"案{post['number']}のファクトチェックに失敗: {describe_error(e)}")
+                    continue
+                fix_error = _merge_factcheck_result(post, result, fc_results, auto_fixed, self.cache_hits)
+                if fix_error:
+                    st.warning(f"案{post['number']}の自動修正に失敗: {describe_error(fix_error)}")
+                if progress:
+                    progress.info(f"✅ 案{post['number']}のファクトチェック完了")
+        self.executor.shutdown(wait=False)
+        return fc_results, auto_fixed
+
+
+class SpeculativeRun:
+    """おすすめ1位のトピックを、ユーザーが選んでいる間に裏で 検索→生成→FC→自動修正 まで進める
+
+    ワーカースレッドで動くので Streamlit は使わない（ゲートウェイ・プロファイルは生成時に確定させる）。
+    選択が一致すれば wait() の結果をそのまま使い、一致しなければ cancel() で打ち切る
+    （生成中ならストリームを閉じて、以降の呼び出しも行わない）。
+    """
+
+    def __init__(self, topic, related_news, system_prompt):
+        self.topic = topic
+        self.related_news = {topic["title"]: related_news.get(topic["title"], [])}
+        self.system_prompt = system_prompt
+        self.fact_store = st.session_state.get("topic_fact_store")
+        self.profile = current_profile()
+        self.key = self.key_for(topic, self.profile)
+        self.gateway = get_claude_gateway(st.session_state.get("anthropic_api_key", ""))
+        self.slots = _claude_call_slots()
+        self.cancelled = threading.Event()
+        self.done = threading.Event()
+        self.outcome = None
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    @staticmethod
+    def key_for(topic, profile):
+        return (topic["title"], profile)
+
+    def matches(self, selected, extra, modify_instruction):
+        """実際の生成依頼が先読みと同じ内容か（1トピックのみ・追加指示なし・同じプロファイル）"""
+        return (len(selected) == 1 and selected[0]["title"] == self.topic["title"]
+                and not extra.strip() and not modify_instruction.strip()
+                and current_profile() == self.profile and not self.cancelled.is_set())
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def wait(self):
+        """完了を待って結果（{"result", "fc_results", "auto_fixed", "fix_errors", "cache_hits"}）を返す。失敗時は None"""
+        self.done.wait()
+        return self.outcome
+
+    def _run(self):
         try:
-            with st.spinner(f"🔧 案{post['number']}を自動修正中..."):
-                response = client.messages.create(
-                    model=CLAUDE_MODEL,
-                    max_tokens=4096,
-                    system=system_prompt if isinstance(system_prompt, str) else "",
-                    messages=[{"role": "user", "content": fix_msg}],
-                )
-            fixed_body = response.content[0].text.strip()
-            auto_fixed[post["number"]] = {
-                "original": post["body"],
-                "fixed": fixed_body,
-                "fc_text": fc_text,
-            }
+            self.outcome = self._pipeline()
         except Exception as e:
-            st.warning(f"案{post['number']}の自動修正に失敗: {e}")
-
-    return auto_fixed
+            self.error = e
+            logger.warning("speculative run failed (%s): %s", self.topic["title"][:30], describe_error(e))
+        finally:
+            self.done.set()
+
+    def _pipeline(self):
+        topic_facts = search_facts_for_topics([self.topic], store=self.fact_store)
+        if self.cancelled.is_set():
+            return None
+        user_msg = build_trend_generation_message([self.topic], self.related_news, topic_facts)
+        stage = stage_config(self.profile, "generate")
+        with self.gateway.stream(priority=PRIORITY_BACKGROUND, stage="speculative_generate", model=stage["model"],
+                                 max_tokens=stage["max_tokens"], system=self.system_prompt,
+                                 messages=[{"role": "user", "content": user_msg}]) as stream:
+            for _ in stream.text_stream:
+                if self.cancelled.is_set():
+                    return None  # with を抜けるとストリームが閉じて生成も止まる
+            final = stream.get_final_message()
+        log_usage("speculative_generate", final, stage["max_tokens"], profile=self.profile)
+        result = "".join(block.text for block in final.content if block.type == "text")
+
+        posts = [p for p in parse_generated_posts(result) if p["body"]]
+        fact_index = fact_search.FactIndex(join_topic_facts(topic_facts))
+        fc_results, auto_fixed, fix_errors, cache_hits = {}, {}, {}, {}
+        if stage_config(self.profile, "factcheck")["enabled"] and posts:
+            def check(post):
+                if self.cancelled.is_set():
+                    return None
+                return _factcheck_and_fix(self.slots, self.gateway, post["body"], factcheck_context(fact_index, post["body"]),
+                                          self.system_prompt,
+                                          self.profile, priority=PRIORITY_BACKGROUND)
+            with ThreadPoolExecutor(max_workers=FACTCHECK_MAX_WORKERS) as executor:
+                checked = list(executor.map(check, posts))
+            if self.cancelled.is_set():
+                return None
+            for post, r in zip(posts, checked):
+                fix_error = _merge_factcheck_result(post, r, fc_results, auto_fixed, cache_hits)
+                if fix_error:
+                    fix_errors[post["number"]] = fix_error
+        return {"result": result, "fc_results": fc_results, "auto_fixed": auto_fixed, "fix_errors": fix_errors,
+                "cache_hits": cache_hits}
+
+
+def _cancel_speculative_run():
+    """実行中の先読みを打ち切ってセッションから外す"""
+    run = st.session_state.pop("speculative_run", None)
+    if run:
+        run.cancel()
+
+
+def _ensure_speculative_run(recs):
+    """先読みモードなら相性度1位のおすすめを裏で準備する（1位が変わったら前の先読みは打ち切る）"""
+    if not st.session_state.get("speculative_enabled") or not recs or not st.session_state.get("anthropic_api_key"):
+        _cancel_speculative_run()
+        return None
+    run = st.session_state.get("speculative_run")
+    top = max(recs, key=lambda r: r.get("score", 0))
+    if run and run.key == SpeculativeRun.key_for(top, current_profile()) and not run.cancelled.is_set():
+        return run
+    if run:
+        run.cancel()
+    run = SpeculativeRun(top, st.session_state.get("related_news", {}), build_generation_system())
+    st.session_state.speculative_run = run
+    return run
 
 
 # ──────────────────────────────────────
@@ -1397,10 +1383,11 @@ def display_generated_results(result_text, key_prefix="", auto_fixed=None):
         auto_fixed = st.session_state.get(f"{key_prefix}_auto_fixed", {})
 
     # FC結果を取得
-    fc_results = {}
+    fc_results, fc_cached = {}, {}
     for fc_key_candidate in ["trend_factcheck", "script_factcheck", "image_factcheck"]:
         fc_results = st.session_state.get(fc_key_candidate, {})
         if fc_results:
+            fc_cached = st.session_state.get(f"{fc_key_candidate}_cached", {})
             break
 
     # ── 自動修正済みの場合はポスト本文を差し替え（内部で完了済みとして表示） ──
@@ -1444,11 +1431,21 @@ def display_generated_results(result_text, key_prefix="", auto_fixed=None):
                 if fc_text:
                     is_ok = "✅" in fc_text and "⚠️" not in fc_text and "❌" not in fc_text
                     label = "✅ FC: 問題なし" if is_ok else "⚠️ FC結果"
+                    if fc_text.startswith("✅ 問題なし（暫定"):
+                        label = "✅ FC: 暫定OK（照合済み）"
+                    if post["number"] in fc_cached:
+                        label += "（♻️ キャッシュ）"
                     with st.expander(label, expanded=False):
+                        if post["number"] in fc_cached:
+                            st.caption(f"♻️ {fc_cached[post['number']]} にチェック済みの同じ本文のため、前回の結果を表示しています")
                         st.markdown(fc_text)
                 if post.get("_auto_fixed") and auto_fixed and post["number"] in auto_fixed:
                     with st.expander("🔧 自動修正", expanded=False):
                         st.markdown(auto_fixed[post["number"]]["fc_text"])
+                        if auto_fixed[post["number"]].get("recheck_text"):
+                            recheck_cached = auto_fixed[post["number"]].get("recheck_cached")
+                            st.markdown("**🔁 修正版の再チェック:**" + (f"（♻️ {recheck_cached} のキャッシュ）" if recheck_cached else ""))
+                            st.markdown(auto_fixed[post["number"]]["recheck_text"])
 
             # 修正指示入力
             if (st.session_state.get(selected_key, {}).get("number") == post["number"]
@@ -1519,7 +1516,10 @@ def display_generated_results(result_text, key_prefix="", auto_fixed=None):
             # 修正版FC結果（折りたたみ）
             fc = revision.get("factcheck")
             if fc:
-                with st.expander("🔍 修正版FC結果", expanded=False):
+                fc_cached_at = revision.get("factcheck_cached")
+                with st.expander("🔍 修正版FC結果" + ("（♻️ キャッシュ）" if fc_cached_at else ""), expanded=False):
+                    if fc_cached_at:
+                        st.caption(f"♻️ {fc_cached_at} にチェック済みの同じ本文のため、前回の結果を表示しています")
                     st.markdown(fc)
 
         _render_infographic_ui(revised_post, f"{key_prefix}_revised")
@@ -1545,91 +1545,81 @@ def display_generated_results(result_text, key_prefix="", auto_fixed=None):
 
 
 
+REVISION_VERIFIED_NOTE = "✅ 問題なし\n\n変更後の文はすべて前回までのファクトチェックで確認済みのため、再チェックを省略しました。"
+
+
+def _revision_factcheck(session, body, progress, stage="factcheck"):
+    """修正版のファクトチェック（確認済みの文だけなら省略、変更が少なければ変わった文だけ確認）"""
+    if session.is_verified(body):
+        return REVISION_VERIFIED_NOTE, None
+    changed = session.diff_plan(body)
+    if changed is None:
+        progress.info("🔍 ファクトチェック中..." if stage == "factcheck" else "🔍 修正版を再チェック中...")
+        fc_result, fc_cached_at = run_factcheck(body, session.search_text, stage=stage)
+        session.record_factcheck(body, fc_result)
+        return fc_result, fc_cached_at
+    progress.info(f"🔍 変更された{len(changed)}文をファクトチェック中...")
+    diff_fc, fc_cached_at = run_diff_factcheck(body, changed, session.search_text, stage=stage)
+    if diff_fc is None:
+        return None, None
+    fc_result = merge_factcheck_results(session.fc_text, diff_fc, body, changed)
+    session.record_factcheck(body, fc_result, changed=changed, diff_fc=diff_fc)
+    return fc_result, fc_cached_at
+
+
 def _do_revision(original_post, instruction, key_prefix):
-    """選択された案に対して修正を実行（検索→生成→FC→要確認なら再修正）"""
-    system_prompt = load_system_prompt() + ENHANCED_GENERATION_PROMPT
+    """選択された案に対して修正を実行（検索→生成→FC→要確認なら再修正）
+
+    同じ案への2回目以降の修正は RevisionSession を引き継ぎ、検索をせず、
+    プロンプトの固定部分はキャッシュから読ませ、確認済みの文だけなら再チェックもしない。
+    """
+    profile = current_profile()
+    started = time.perf_counter()
     progress = st.empty()
+    revision_key = f"{key_prefix}_revision"
+    prev = st.session_state.get(revision_key)
 
-    # ── STEP 1: 修正に必要な最新情報を検索 ──
-    progress.info("🔍 修正に必要な最新情報を検索中...")
-    search_keywords = original_post["body"][:150].replace("\n", " ")
-    search_facts = search_topic_facts(search_keywords, max_results=5)
-    search_text = "\n".join(search_facts) if search_facts else ""
+    # ── STEP 1: 修正に必要な最新情報を検索（同じ案の修正の続きなら前回の検索結果を使う） ──
+    session = prev.get("session") if prev else None
+    if session is None or session.post_number != original_post["number"]:
+        session = RevisionSession(original_post, progress=progress)
+    system_prompt = session.system_prompt
+    search_text = session.search_text
 
     # ── STEP 2: 修正版を生成 ──
     progress.info("🤖 修正版を生成中...")
-    search_section = f"\n■ 最新のWeb検索結果（正確な記述の参考にすること）:\n{search_text}\n" if search_text else ""
-    msg = f"""以下のXポストを、修正指示に従って修正してください。
-
-■ 元のポスト（案{original_post['number']}）:
-{original_post['body']}
-
-■ 修正指示:
-{instruction}
-{search_section}
-■ ルール:
-- 修正指示に忠実に従ってください
-- すあし社長の「解説型」トーンを維持してください（仕組みの解説 → 数字の比較 → メカニズムの解明 → 他国比較 → 示唆で締め）
-- 修正後のポストのみを出力してください（タイトルや案番号は不要）
-- 600〜800文字を目安にしてください
-- マークダウン記法は使わないでください（太字、見出し、リスト等は禁止）
-- 検索結果の情報を参照し、数字や事実を正確に記述してください
-"""
     result = generate_with_claude(
-        messages=[{"role": "user", "content": msg}],
+        messages=session.build_messages(original_post["body"], instruction),
         system_prompt=system_prompt,
+        max_tokens=rewrite_max_tokens(original_post["body"]),
     )
     body = result.strip()
 
-    # ── STEP 3: ファクトチェック ──
-    progress.info("🔍 ファクトチェック中...")
-    fc_result = run_factcheck(body, search_text)
+    # ── STEP 3: ファクトチェック（確認済みの文だけなら省略、変更が少なければ差分のみ） ──
+    fc_result, fc_cached_at = _revision_factcheck(session, body, progress)
 
-    # ── STEP 4: 要確認ありなら自動再修正 ──
-    if fc_result and ("⚠️" in fc_result or "❌" in fc_result):
+    # ── STEP 4: 要確認ありなら自動再修正（該当箇所の置き換えで済めばローカルで直す） ──
+    api_key = st.session_state.get("anthropic_api_key", "")
+    if needs_auto_fix(fc_result) and stage_config(profile, "auto_fix")["enabled"] and api_key:
         progress.info("🔧 ファクトチェック指摘を自動修正中...")
-        api_key = st.session_state.get("anthropic_api_key", "")
-        if api_key:
-            client = anthropic.Anthropic(api_key=api_key)
-            fix_msg = f"""以下のXポストに対してファクトチェックで指摘がありました。
-指摘内容に基づいて事実関係を修正してください。
-
-■ ポスト:
-{body}
-
-■ ファクトチェックの指摘:
-{fc_result}
-
-■ 参考情報:
-{search_text if search_text else '（なし）'}
-
-■ ルール:
-- 指摘された箇所のみ修正する（構成やトーンは維持）
-- 不確実な情報には「〜と言われている」等の留保をつける
-- 修正後のポストのみを出力する
-- マークダウン記法は使わない
-- 600〜800文字を目安にする
-"""
-            try:
-                with st.spinner("🔧 自動修正中..."):
-                    response = client.messages.create(
-                        model=CLAUDE_MODEL,
-                        max_tokens=4096,
-                        system=system_prompt,
-                        messages=[{"role": "user", "content": fix_msg}],
-                    )
-                body = response.content[0].text.strip()
-                # 修正版を再度ファクトチェック
-                progress.info("🔍 修正版を再チェック中...")
-                fc_result = run_factcheck(body, search_text)
-            except Exception:
-                pass  # 自動修正に失敗した場合は元の版を使用
+        try:
+            with st.spinner("🔧 自動修正中..."):
+                body = _call_auto_fix(
+                    get_claude_gateway(api_key), body, fc_result,
+                    factcheck_context(fact_search.FactIndex(search_text), body), system_prompt, profile,
+                    priority=PRIORITY_INTERACTIVE,
+                )
+            # 修正版を再度ファクトチェック
+            if stage_config(profile, "recheck")["enabled"]:
+                fc_result, fc_cached_at = _revision_factcheck(session, body, progress, stage="recheck")
+        except Exception as e:
+            # 自動修正に失敗した場合は修正前の版を使用（理由は画面に出す）
+            st.warning(f"⚠️ 自動修正に失敗したため、修正前の版を表示します: {describe_error(e)}")
 
+    record_run(profile, time.perf_counter() - started)
     progress.empty()
 
     # 修正履歴を保持
-    revision_key = f"{key_prefix}_revision"
-    prev = st.session_state.get(revision_key)
     history = prev["history"].copy() if prev else []
     history.append({"instruction": instruction, "before": original_post["body"]})
 
@@ -1648,6 +1638,8 @@ def _do_revision(original_post, instruction, key_prefix):
         "post": revised_post,
         "history": history,
         "factcheck": fc_result,
+        "factcheck_cached": fc_cached_at.strftime("%m/%d %H:%M") if fc_cached_at else None,
+        "session": session,
     }
     st.session_state.pop(f"{key_prefix}_selected_post", None)
     st.rerun()
@@ -1673,6 +1665,44 @@ with st.sidebar:
     if ak: st.success("✅ 接続済み")
     else: st.warning("⚠️ APIキーを入力")
 
+    st.markdown("---")
+    st.markdown("## 🧭 生成パイプライン")
+    profile_names = list(PIPELINE_PROFILES.keys())
+    st.session_state.pipeline_profile = st.selectbox(
+        "プロファイル",
+        options=profile_names,
+        index=profile_names.index(current_profile()),
+        format_func=lambda p: PIPELINE_PROFILES[p]["label"],
+        key="pipeline_profile_select",
+    )
+    with st.expander("段階ごとの設定", expanded=False):
+        for stage_name, stage_label in [("recommend", "トピック選定"), ("generate", "生成"), ("factcheck", "ファクトチェック"),
+                                        ("auto_fix", "自動修正"), ("recheck", "再チェック")]:
+            cfg = stage_config(current_profile(), stage_name)
+            st.caption(f"{stage_label}: {cfg['model']}（max {cfg['max_tokens']:,}）" if cfg["enabled"] else f"{stage_label}: OFF")
+    st.checkbox(
+        "⚡ おすすめ1位を先読み生成",
+        key="speculative_enabled",
+        help="トピックを選んでいる間に、相性度1位のおすすめを裏で生成・ファクトチェックしておきます。"
+             "1位をそのまま選べば待ち時間なしで結果が出ます（選ばなければ打ち切り。API利用量は増えます）",
+    )
+    prepass = claim_grounding.prepass_summary()
+    if prepass["checked"]:
+        st.caption(
+            f"🧮 ローカル照合: {prepass['passed']}/{prepass['checked']}案が通過（{prepass['pass_rate']:.0%}）"
+            f" / ファクトチェック短縮 約{prepass['saved_seconds']:.0f}秒"
+        )
+    usage_summary = profile_usage_summary()
+    if usage_summary:
+        with st.expander("📈 プロファイル別の実績", expanded=False):
+            for p, u in usage_summary.items():
+                avg_latency = f"{u['run_seconds'] / u['runs']:.1f}秒" if u["runs"] else "-"
+                avg_cost = f"${u['cost'] / u['runs']:.3f}" if u["runs"] else "-"
+                st.caption(
+                    f"{PIPELINE_PROFILES.get(p, {}).get('label', p)}\n\n"
+                    f"生成 {u['runs']}回 / 平均 {avg_latency} / 1回あたり {avg_cost} / 累計 ${u['cost']:.3f}（{u['calls']}呼び出し）"
+                )
+
     st.markdown("---")
     st.markdown("## 🎨 図解生成 (Gemini)")
     if "google_api_key" not in st.session_state:
@@ -1755,11 +1785,16 @@ with st.sidebar:
             st.warning(f"📦 キャッシュ期限切れ（{cache_info['age_hours']}時間前）\n\nWindows PCで sync_x_trends.bat を実行してください")
 
     if _is_cloud_environment():
+        gh_status = _github_trends_status()
+        if gh_status["refreshing"]:
+            st.caption("🔄 GitHubの最新データをバックグラウンドで確認中...（表示中のデータはそのまま使えます）")
+        elif gh_status["error"] and not gh_status["fetched_at"]:
+            st.caption(f"⚠️ GitHubから取得できませんでした: {gh_status['error'][:60]}")
         if not cache_info:
             st.info("☁️ Xトレンドを下の入力欄から追加できます")
-        # 🔄 最新取得ボタン（GitHub APIキャッシュをクリアして再取得）
+        # 🔄 最新取得ボタン（GitHubへの再検証をバックグラウンドで開始）
         if st.button("🔄 Xトレンドを最新に更新", key="refresh_x_trends", use_container_width=True):
-            _fetch_trends_from_github.clear()
+            _fetch_trends_from_github(force=True)
             st.rerun()
         # 📝 手動入力フォーム
         with st.expander("📝 Xトレンドを手動入力", expanded=not bool(cache_info)):
@@ -1794,7 +1829,6 @@ with st.sidebar:
                         encoding="utf-8",
                     )
                     st.success(f"✅ {len(new_trends)}件のXトレンドを保存しました")
-                    _fetch_trends_from_github.clear()
                     st.rerun()
                 else:
                     st.warning("トレンドを入力してください")
@@ -1866,7 +1900,16 @@ if st.session_state.get("view_history"):
         st.session_state.view_history = None; st.rerun()
     st.markdown(f"**📜 {ts.strftime('%Y/%m/%d %H:%M')} — {get_mode_label(entry['mode'])}**")
     with st.expander("📥 入力"): st.json(entry.get("input", {}))
-    st.markdown(entry.get("result", "")); st.stop()
+    st.markdown(entry.get("result", ""))
+    # 夜間事前生成の履歴はファクトチェック・自動修正の結果も保存されている
+    for num, fc_text in entry.get("factcheck", {}).items():
+        with st.expander(f"🔍 案{num}のファクトチェック結果"):
+            st.markdown(fc_text)
+            fixed = entry.get("auto_fixed", {}).get(num)
+            if fixed:
+                st.markdown("**🔧 自動修正版:**")
+                st.code(fixed["fixed"], language=None)
+    st.stop()
 
 
 # ──────────────────────────────────────
@@ -1918,7 +1961,8 @@ with tab1:
                 st.error("🔑 APIキーを設定してください")
             else:
                 # 前回の結果をクリア
-                for key in ["ai_recommendations", "x_trend_items", "related_news", "raw_news", "trend_step"]:
+                _cancel_speculative_run()
+                for key in ["ai_recommendations", "x_trend_items", "related_news", "raw_news", "trend_step", "topic_fact_store"]:
                     if key in st.session_state:
                         del st.session_state[key]
 
@@ -1933,6 +1977,14 @@ with tab1:
                 cached_trends = load_cached_x_trends(max_age_hours=24)
                 if cached_trends:
                     progress.info("📱 【1/3】Xトレンドをキャッシュから読み込み中...")
+                    # 旧キャッシュ（勢い未付与）はローカルの時系列ストアから補完
+                    if not any("velocity" in item for item in cached_trends):
+                        momentum = trend_store.momentum_for([item["title"] for item in cached_trends])
+                        cached_trends = [
+                            {**item, **dict(zip(("velocity", "acceleration"),
+                                                momentum.get(trend_store.normalize_title(item["title"]), (None, None))))}
+                            for item in cached_trends
+                        ]
                     for item in cached_trends:
                         count_str = f" ({item['post_count']:,}件のポスト)" if item.get('post_count') else ""
                         x_news_items.append({
@@ -1942,6 +1994,8 @@ with tab1:
                             "published": item.get("time_ago", ""),
                             "origin": "x_news",
                             "post_count": item.get("post_count", 0),
+                            "velocity": item.get("velocity"),
+                            "acceleration": item.get("acceleration"),
                         })
                     progress.info(f"✅ Xニュース（キャッシュ）: {len(x_news_items)}件")
                 elif is_logged_in():
@@ -1951,6 +2005,10 @@ with tab1:
                     if x_news == "login_required":
                         x_login_warning = "⚠️ Xのセッションが切れています。サイドバーから再ログインしてください"
                     elif x_news and isinstance(x_news, list):
+                        try:
+                            x_news = trend_store.record_snapshot(x_news)
+                        except Exception:
+                            pass  # 時系列ストアへの記録に失敗しても取得結果は使う
                         for item in x_news:
                             count_str = f" ({item['post_count']:,}件のポスト)" if item['post_count'] else ""
                             x_news_items.append({
@@ -1960,6 +2018,8 @@ with tab1:
                                 "published": item.get("time_ago", ""),
                                 "origin": "x_news",
                                 "post_count": item.get("post_count", 0),
+                                "velocity": item.get("velocity"),
+                                "acceleration": item.get("acceleration"),
                             })
                         progress.info(f"✅ Xニュース: {len(x_news_items)}件取得")
                     else:
@@ -1998,27 +2058,40 @@ with tab1:
                 else:
                     st.session_state.raw_news = all_items
 
-                    # AIにはGoogle Newsのみ送信して選定
-                    if google_items:
-                        progress.info("🤖 Google Newsからすあし社長向きのトピックをAIが選定中...")
+                    # AIにはXトレンド（勢いつき）とGoogle Newsを送信して選定（上昇中のXトレンドが上位に並ぶ）
+                    if (x_news_items or google_items) and stage_config(current_profile(), "recommend")["enabled"]:
+                        progress.info("🤖 XトレンドとGoogle Newsからすあし社長向きのトピックをAIが選定中...")
+                        rec_live = st.container()
+
+                        def _show_streamed_rec(rec):
+                            """選定結果を1件ずつ即座に表示"""
+                            rec_live.markdown(f"""<div class="trend-card">
+    <div class="trend-title">{rec.get('title', '')}</div>
+    <div class="trend-source">📊 相性度: {rec.get('score', 0)}/100　｜　🎣 {rec.get('hook_type', '')}</div>
+    <div class="trend-reason">💡 {rec.get('angle', '')}</div>
+</div>""", unsafe_allow_html=True)
+
                         try:
-                            recommendations = ai_recommend_topics(google_items, st.session_state.anthropic_api_key)
+                            recommendations = ai_recommend_topics(
+                                x_news_items + google_items, st.session_state.anthropic_api_key,
+                                on_recommendation=_show_streamed_rec, profile=current_profile(),
+                            )
                         except Exception as e:
                             recommendations = []
-                            st.error(f"AI選定エラー: {str(e)}")
+                            st.error(f"AI選定エラー: {describe_error(e)}")
                     else:
                         recommendations = []
 
                     if recommendations:
                         st.session_state.ai_recommendations = recommendations
-                        # 関連ニュースも先に取得
+                        # 関連ニュースも先に取得（同じ検索結果を生成時のファクトにも使う）
                         progress.info("📰 関連ニュースを収集中...")
+                        fact_store = TopicFactStore()
                         related = {}
                         for rec in recommendations:
-                            keyword = rec.get("title", "")[:20]
-                            articles = fetch_related_news(keyword, max_results=3)
-                            related[rec["title"]] = articles
+                            related[rec["title"]] = fact_store.related_news(rec.get("title", ""))
                         st.session_state.related_news = related
+                        st.session_state.topic_fact_store = fact_store
                         progress.empty()
                         st.session_state.trend_step = 2
                         st.rerun()
@@ -2071,13 +2144,23 @@ with tab1:
 
             # ── 🐦 Xニューストレンド（メイン） ──
             if has_x:
-                x_items = st.session_state.x_trend_items
+                # 並び替えてもチェック状態が付いてくるよう、取得順の番号をキーに使う
+                x_items = list(enumerate(st.session_state.x_trend_items))
                 st.markdown(f"#### 🐦 Xニューストレンド（{len(x_items)}件）")
                 st.caption("Xの「話題を検索」→ ニュースタブから取得。今X上で最も話題になっているニュースです。")
 
-                for item in x_items:
+                if any(item.get("velocity") is not None for _, item in x_items):
+                    x_sort = st.radio("並び順", ["📊 ポスト数順", "🚀 勢い順（増加ペース）"],
+                                      horizontal=True, key="x_trend_sort")
+                    if "勢い順" in x_sort:
+                        x_items = sorted(x_items, key=lambda x: trend_store.momentum_sort_key(x[1]), reverse=True)
+
+                for x_idx, item in x_items:
                     label = f"🐦 {item['title']}"
-                    checked = st.checkbox(label, key=f"x_news_{rec_idx}", value=False)
+                    if item.get("velocity"):
+                        label += f"　🚀 {item['velocity']:+,.0f}件/時"
+                    checked = st.checkbox(label, key=f"x_news_{x_idx}_{trend_store.normalize_title(item['title'])}",
+                                          value=False)
                     if checked:
                         selected.append({
                             "title": item["title"],
@@ -2092,7 +2175,7 @@ with tab1:
             if has_ai:
                 recs = st.session_state.ai_recommendations
                 st.markdown(f"#### 🌐 世の中のトレンド（AI厳選 {len(recs)}件）")
-                st.caption("Google Newsからすあし社長向きのトピックをAIが厳選。")
+                st.caption("XトレンドとGoogle Newsからすあし社長向きのトピックをAIが厳選。")
 
                 def _show_rec(rec, idx, default_checked=False):
                     """推薦カードを表示して選択状態を返す"""
@@ -2121,6 +2204,12 @@ with tab1:
                         selected.append(rec)
                     rec_idx += 1
 
+                if not st.session_state.get("trend_result"):
+                    spec_run = _ensure_speculative_run(recs)
+                    if spec_run:
+                        state = "準備完了" if spec_run.done.is_set() else "準備中"
+                        st.caption(f"⚡ 先読み{state}: 「{spec_run.topic['title']}」（このトピックだけを選び、追加指示なしで生成すると即座に結果が出ます）")
+
             # ── 🔍 Yahoo!リアルタイム補足 ──
             if has_yahoo:
                 yahoo_items = st.session_state.yahoo_items
@@ -2162,92 +2251,58 @@ with tab1:
 
             if selected:
                 if st.button("🤖 すあし社長スタイルのポストを生成", type="primary", use_container_width=True, key="gen_btn"):
-                    system_prompt = load_system_prompt()
                     gen_progress = st.empty()
-
-                    # ── STEP A: 選択トピックの最新情報をWeb検索 ──
-                    gen_progress.info("🔍 選択トピックの最新情報をWeb検索中...")
-                    topic_facts = search_facts_for_topics(selected, progress=gen_progress)
-
-                    # 選択トピックの情報を構築（検索結果付き）
-                    topics_context = ""
-                    for s in selected:
-                        topics_context += f"\n### トピック: {s['title']}\n"
-                        if s.get("angle"):
-                            topics_context += f"- 切り口: {s['angle']}\n"
-                        if s.get("pillars"):
-                            topics_context += f"- 柱の組合せ: {' × '.join(s['pillars'])}\n"
-                        if s.get("hook_type"):
-                            topics_context += f"- フック型: {s['hook_type']}\n"
-                        # 関連ニュース
-                        rel = st.session_state.get("related_news", {}).get(s["title"], [])
-                        if rel:
-                            topics_context += "- 関連ニュース:\n"
-                            for art in rel:
-                                topics_context += f"  - {art['title']}（{art['source']}）\n"
-                        # Web検索結果を追加
-                        clean_title = re.sub(r'\s*\(\d[\d,]*件のポスト\)', '', s['title']).strip()
-                        facts = topic_facts.get(clean_title, [])
-                        if facts:
-                            topics_context += "- 最新のWeb検索結果（事実確認用）:\n"
-                            for fact in facts:
-                                topics_context += f"  - {fact}\n"
-
-                    # ── STEP B: ポスト生成 ──
-                    gen_progress.info("🤖 すあし社長スタイルのポストを生成中...")
-                    user_msg = f"""以下のトピックについて、すあし社長スタイルのXポストを3案生成してください。
-各案600〜800文字で、それぞれ異なる切り口で仕組み・構造を解説するスタイルにしてください。
-
-■ 生成する3案（各600〜800文字）:
-【案1】仕組み解説型 — テーマの基本構造を整理して「なぜそうなるのか」を解き明かす
-【案2】国際比較型 — 他国の事例と比較して日本の状況を立体的に見せる
-【案3】逆説・発見型 — 「一見〜だが、実は〜」という意外な構造を提示する
-
-■ 選定されたトピック:
-{topics_context}
-
-■ 重要な指示（必ず守ること）:
-- 「ニュースの感想」ではなく「仕組み・構造の解説」として書くこと
-- 冒頭は「〜を整理してみましょう」「〜の構造はこうなっています」等の解説導入で始める
-- 具体的な数字は必ず比較セットで使う（「Aは○％なのに、Bは△％」）
-- 「なぜそうなるのか」のメカニズムを必ず解説すること
-- 他国の具体的な国名・人名・制度名を入れること
-- 締めは主張ではなく、示唆・問いかけで余韻を残すこと
-- 「最新のWeb検索結果」の情報を必ず参照し、事実に基づいた正確な記述にすること
-- 現在の米国大統領はドナルド・トランプ（第2期、2025年1月就任）です
-- 人名・政権名・数値などの事実情報は検索結果に基づき正確に記述すること
-"""
-                    if extra.strip():
-                        user_msg += f"\n■ 追加コンテキスト:\n{extra}\n"
-                    if modify_instruction.strip():
-                        user_msg += f"\n■ 修正指示（これを最優先で反映してください）:\n{modify_instruction}\n"
-
-                    enhanced_system = system_prompt + ENHANCED_GENERATION_PROMPT
-                    result = generate_with_claude(
-                        messages=[{"role": "user", "content": user_msg}],
-                        system_prompt=enhanced_system,
-                    )
-
-                    # ── STEP C: ファクトチェック ──
-                    gen_progress.info("🔍 ファクトチェック中...")
-                    # 各案を解析してファクトチェック
-                    posts = parse_generated_posts(result)
-                    all_search_text = ""
-                    for facts_list in topic_facts.values():
-                        all_search_text += "\n".join(facts_list) + "\n"
-
-                    fc_results = {}
-                    for post in posts:
-                        fc = run_factcheck(post["body"], all_search_text)
-                        if fc:
-                            fc_results[post["number"]] = fc
-
-                    # ── STEP D: 要確認ありの案を自動修正 ──
-                    auto_fixed = _auto_fix_factcheck_issues(posts, fc_results, all_search_text, enhanced_system, gen_progress)
+                    run_started = time.perf_counter()
+
+                    # ── 先読みと同じ依頼ならその結果を使う（違えば打ち切る） ──
+                    outcome = None
+                    spec_run = st.session_state.pop("speculative_run", None)
+                    if spec_run and spec_run.matches(selected, extra, modify_instruction):
+                        gen_progress.info("⚡ 先読みした結果を使います...")
+                        outcome = spec_run.wait()
+                        if spec_run.error:
+                            st.warning(f"先読みに失敗したため通常どおり生成します: {describe_error(spec_run.error)}")
+                    elif spec_run:
+                        spec_run.cancel()
+
+                    if outcome:
+                        result = outcome["result"]
+                        fc_results, auto_fixed = outcome["fc_results"], outcome["auto_fixed"]
+                        fc_cached = outcome["cache_hits"]
+                        for number, fix_error in outcome["fix_errors"].items():
+                            st.warning(f"案{number}の自動修正に失敗: {describe_error(fix_error)}")
+                        record_run(spec_run.profile, time.perf_counter() - run_started)
+                    else:
+                        # ── STEP A: 選択トピックの最新情報をWeb検索 ──
+                        gen_progress.info("🔍 選択トピックの最新情報をWeb検索中...")
+                        topic_facts = search_facts_for_topics(selected, progress=gen_progress,
+                                                              store=st.session_state.get("topic_fact_store"))
+
+                        # ── STEP B: ポスト生成 ──
+                        gen_progress.info("🤖 すあし社長スタイルのポストを生成中...")
+                        user_msg = build_trend_generation_message(
+                            selected, st.session_state.get("related_news", {}), topic_facts,
+                            extra=extra, modify_instruction=modify_instruction,
+                        )
+                        enhanced_system = build_generation_system()
+                        all_search_text = join_topic_facts(topic_facts)
+
+                        # ── STEP C/D: 書き終わった案から順にファクトチェック → 要確認なら自動修正 ──
+                        pipeline = FactcheckPipeline(all_search_text, enhanced_system)
+                        result = generate_with_claude(
+                            messages=[{"role": "user", "content": user_msg}],
+                            system_prompt=enhanced_system,
+                            on_post_complete=pipeline.submit,
+                        )
+                        posts = parse_generated_posts(result)
+                        fc_results, auto_fixed = pipeline.collect(posts, gen_progress)
+                        fc_cached = pipeline.cache_hits
+                        record_run(pipeline.profile, time.perf_counter() - run_started)
 
                     gen_progress.empty()
                     st.session_state.trend_result = result
                     st.session_state.trend_factcheck = fc_results
+                    st.session_state.trend_factcheck_cached = fc_cached
                     st.session_state.trend_auto_fixed = auto_fixed
                     st.session_state.trend_step = 3
                     save_history("trend", {
@@ -2270,8 +2325,8 @@ with tab1:
         c1, c2 = st.columns(2)
         _trend_clear_keys = [
             "trend_result", "ai_recommendations", "raw_news", "related_news",
-            "trend_step", "manual_topics", "x_trend_items", "yahoo_items",
-            "trend_revision", "trend_selected_post", "trend_factcheck",
+            "trend_step", "manual_topics", "x_trend_items", "yahoo_items", "topic_fact_store",
+            "trend_revision", "trend_selected_post", "trend_factcheck", "trend_factcheck_cached",
             "trend_auto_fixed",
         ]
         # 図解のセッションも削除
@@ -2280,11 +2335,13 @@ with tab1:
                 _trend_clear_keys.append(sk)
         with c1:
             if st.button("🗑️ クリア", key="cl_t"):
+                _cancel_speculative_run()
                 for k in _trend_clear_keys:
                     st.session_state.pop(k, None)
                 st.rerun()
         with c2:
             if st.button("🔄 新しいトレンド", key="new_t"):
+                _cancel_speculative_run()
                 for k in _trend_clear_keys:
                     st.session_state.pop(k, None)
                 st.rerun()
@@ -2301,7 +2358,7 @@ with tab2:
         if not script_text.strip():
             st.warning("原稿を入力してください。")
         else:
-            sp = load_system_prompt() + ENHANCED_GENERATION_PROMPT
+            sp = build_generation_system()
             gen_prog = st.empty()
 
             # ── Web検索で最新情報を収集 ──
@@ -2324,26 +2381,22 @@ with tab2:
 ■ 原稿:
 {script_text}
 """
-            if search_text:
-                msg += f"\n■ 最新のWeb検索結果（事実確認用。必ず参照して正確な記述にすること）:\n{search_text}\n"
+            prompt_facts = fit_search_context(search_text, (script_text, script_ctx), name="script_context")
+            if prompt_facts:
+                msg += f"\n■ 最新のWeb検索結果（事実確認用。必ず参照して正確な記述にすること）:\n{prompt_facts}\n"
             if script_ctx.strip(): msg += f"\n■ 追加コンテキスト:\n{script_ctx}\n"
-            result = generate_with_claude([{"role": "user", "content": msg}], sp)
-
-            # ── ファクトチェック ──
-            gen_prog.info("🔍 ファクトチェック中...")
+            # ── 書き終わった案から順にファクトチェック → 要確認なら自動修正 ──
+            run_started = time.perf_counter()
+            pipeline = FactcheckPipeline(search_text, sp)
+            result = generate_with_claude([{"role": "user", "content": msg}], sp, on_post_complete=pipeline.submit)
             posts = parse_generated_posts(result)
-            fc_results = {}
-            for post in posts:
-                fc = run_factcheck(post["body"], search_text)
-                if fc:
-                    fc_results[post["number"]] = fc
-
-            # ── 要確認ありの案を自動修正 ──
-            auto_fixed = _auto_fix_factcheck_issues(posts, fc_results, search_text, sp, gen_prog)
+            fc_results, auto_fixed = pipeline.collect(posts, gen_prog)
+            record_run(pipeline.profile, time.perf_counter() - run_started)
 
             gen_prog.empty()
             st.session_state.script_result = result
             st.session_state.script_factcheck = fc_results
+            st.session_state.script_factcheck_cached = pipeline.cache_hits
             st.session_state.script_auto_fixed = auto_fixed
             save_history("script", {"script": script_text[:200], "context": script_ctx}, result)
     if st.session_state.get("script_result"):
@@ -2353,7 +2406,7 @@ with tab2:
             auto_fixed=st.session_state.get("script_auto_fixed", {}),
         )
         if st.button("🗑️ クリア", key="cl_s"):
-            clear_keys = ["script_result", "scr_revision", "scr_selected_post", "script_factcheck", "script_auto_fixed"]
+            clear_keys = ["script_result", "scr_revision", "scr_selected_post", "script_factcheck", "script_factcheck_cached", "script_auto_fixed"]
             for sk in list(st.session_state.keys()):
                 if sk.startswith("infographic_scr_"):
                     clear_keys.append(sk)
@@ -2374,7 +2427,7 @@ with tab3:
         if not img:
             st.warning("画像をアップロードしてください。")
         else:
-            sp = load_system_prompt() + ENHANCED_GENERATION_PROMPT
+            sp = build_generation_system()
             gen_prog = st.empty()
 
             # ── Web検索で最新情報を収集 ──
@@ -2392,7 +2445,8 @@ with tab3:
             ext = img.name.rsplit(".",1)[-1].lower()
             mime = {"jpg":"image/jpeg","jpeg":"image/jpeg","png":"image/png","gif":"image/gif","webp":"image/webp"}.get(ext,"image/png")
             desc = f"\n■ 説明:\n{img_desc}\n" if img_desc.strip() else ""
-            search_section = f"\n■ 最新のWeb検索結果（事実確認用）:\n{search_text}\n" if search_text else ""
+            prompt_facts = fit_search_context(search_text, (img_desc,), name="image_context")
+            search_section = f"\n■ 最新のWeb検索結果（事実確認用）:\n{prompt_facts}\n" if prompt_facts else ""
             content = [
                 {"type": "text", "text": f"""以下の画像について、すあし社長スタイルのXポストを3案生成してください。
 それぞれ600〜800文字で、切り口を変えてバリエーションを付けてください。
@@ -2404,23 +2458,18 @@ with tab3:
 画像添付前提のポストにしてください。"""},
                 {"type": "image", "source": {"type": "base64", "media_type": mime, "data": img_b64}},
             ]
-            result = generate_with_claude([{"role": "user", "content": content}], sp)
-
-            # ── ファクトチェック ──
-            gen_prog.info("🔍 ファクトチェック中...")
+            # ── 書き終わった案から順にファクトチェック → 要確認なら自動修正 ──
+            run_started = time.perf_counter()
+            pipeline = FactcheckPipeline(search_text, sp)
+            result = generate_with_claude([{"role": "user", "content": content}], sp, on_post_complete=pipeline.submit)
             posts = parse_generated_posts(result)
-            fc_results = {}
-            for post in posts:
-                fc = run_factcheck(post["body"], search_text)
-                if fc:
-                    fc_results[post["number"]] = fc
-
-            # ── 要確認ありの案を自動修正 ──
-            auto_fixed = _auto_fix_factcheck_issues(posts, fc_results, search_text, sp, gen_prog)
+            fc_results, auto_fixed = pipeline.collect(posts, gen_prog)
+            record_run(pipeline.profile, time.perf_counter() - run_started)
 
             gen_prog.empty()
             st.session_state.image_result = result
             st.session_state.image_factcheck = fc_results
+            st.session_state.image_factcheck_cached = pipeline.cache_hits
             st.session_state.image_auto_fixed = auto_fixed
             save_history("image", {"image_name": img.name, "desc": img_desc}, result)
     if st.session_state.get("image_result"):
@@ -2430,7 +2479,7 @@ with tab3:
             auto_fixed=st.session_state.get("image_auto_fixed", {}),
         )
         if st.button("🗑️ クリア", key="cl_i"):
-            clear_keys = ["image_result", "img_revision", "img_selected_post", "image_factcheck", "image_auto_fixed"]
+            clear_keys = ["image_result", "img_revision", "img_selected_post", "image_factcheck", "image_factcheck_cached", "image_auto_fixed"]
             for sk in list(st.session_state.keys()):
                 if sk.startswith("infographic_img_"):
                     clear_keys.append(sk)
@@ -0,0 +1,188 @@
+"""
+ファクトチェック前のローカル照合（数字・固有名詞の裏取り）
+
+ポスト案は「％」「兆円」「倍」などの数字だらけだが、その数字が検索結果に
+そのまま載っていることも多い。Claude に送る前に本文を文ごとに分け、文の数字・固有名詞が
+取得済みの検索結果の同じ行（同じ記事）にそろって載っているかを調べる。数字・固有名詞を含む文が
+全て確認できた案は暫定 ✅ として LLM のチェックを省き、1文でも確認できない案は通常のファクトチェックに回す。
+数字も固有名詞も無い文（感想・呼びかけなど）は照合の対象にしない。
+
+- 索引は主張 → 載っている行番号の集合。文の主張ごとの行の集合の共通部分を取る
+  （索引に無い主張だけ、正規化した行の部分一致で引く。直前が数字でない位置に限る）
+- 数字と固有名詞は同じ行に載っている必要がある（別々の記事に載っているだけでは組み合わせが正しいとは限らない）
+- 「2025年」「1位」のような年月日・順位や固有名詞だけでは、ほとんどの記事に当たるので文の裏付けにならない。
+  裏付けになる数字（金額・割合など）が無いまま主張を含む文は照合できないので LLM に回す
+- 人名・組織名（石破首相、日銀、自民党など）を含む文は漢字の固有名詞を照合できないので LLM に回す
+- 過去に確認済みの文（claim_store）は、文全体が一致する場合だけ照合から外す。
+  確認済みの知識だけで ✅ にはしない（検索結果で確認できた文が必要）
+"""
+
+import re
+import threading
+import unicodedata
+
+from post_pipeline import split_sentences
+
+NUMBER_UNITS = (
+    "％|%|兆円|億円|万円|千円|円|兆ドル|億ドル|万ドル|ドル|万人|千人|人|倍|年度|年|か月|ヶ月|カ月|月|日|"
+    "件|位|歳|ポイント|bp|度|社|カ国|か国|ヵ国|台|本|回|時間|分"
+)
+_NUMBER_RE = re.compile(
+    rf"(?:\d[\d,.]*(?:兆|億|千万|百万|万|千)?)+\s*(?:{NUMBER_UNITS})"
+)
+_WEAK_UNITS = ("年度", "年", "か月", "ヶ月", "カ月", "月", "日", "位")  # ほとんどの記事に当たる数字
+_KATAKANA_RE = re.compile(r"[ァ-ヴー・]{3,}")
+_KANJI_PLACE_RE = re.compile(r"日本|米国|中国|韓国|北朝鮮|台湾|英国|欧州|豪州|東京|大阪")
+# 肩書き・組織の語尾が付いた漢字の語と、よく出る略称（照合できないので LLM に回す）
+_KANJI_NAME_RE = re.compile(
+    r"[一-龥々]+(?:元首相|前首相|首相|総理|大臣|大統領|総裁|知事|市長|社長|会長|議員|長官|議長|政権|内閣|氏|"
+    r"党|省|庁|銀行|銀|機構|委員会|協会|大学|証券|自動車|電機|商事|物産|製作所)"
+    r"|日銀|自民|立憲|公明|維新|共産|経団連|東証"
+)
+_LATIN_RE = re.compile(r"\b[A-Z][A-Za-z0-9&.\-]{1,}\b")
+_GENERIC_WORDS = {"ポスト", "ニュース", "トレンド", "データ", "ランキング", "メカニズム", "システム", "インフレ", "コスト"}
+
+
+def normalize_claim(text):
+    """主張を照合用に正規化（全角半角・カンマ・空白の揺れを吸収）"""
+    t = unicodedata.normalize("NFKC", text or "")
+    return re.sub(r"[\s,，]", "", t).lower()
+
+
+def extract_claims(text):
+    """本文から数字・固有名詞の主張を取り出す
+
+    Returns:
+        dict: {"numbers": [...], "entities": [...]}（出現順・重複なし）
+    """
+    text = unicodedata.normalize("NFKC", text or "")
+    numbers = list(dict.fromkeys(m.group(0).strip() for m in _NUMBER_RE.finditer(text)))
+    found = _KATAKANA_RE.findall(text) + _LATIN_RE.findall(text) + _KANJI_PLACE_RE.findall(text)
+    entities = [w for w in dict.fromkeys(found) if w not in _GENERIC_WORDS]
+    return {"numbers": numbers, "entities": entities}
+
+
+class ClaimIndex:
+    """検索結果（1行1件）の主張の索引"""
+
+    def __init__(self, facts_text):
+        self.lines = [line for line in (facts_text or "").split("\n") if line.strip()]
+        self.index = {}  # 正規化した主張 → 載っている行番号の集合
+        for i, line in enumerate(self.lines):
+            claims = extract_claims(line)
+            for claim in claims["numbers"] + claims["entities"]:
+                self.index.setdefault(normalize_claim(claim), set()).add(i)
+        self.normalized_lines = [normalize_claim(line) for line in self.lines]
+
+    def postings(self, claim):
+        """主張が載っている行番号の集合"""
+        key = normalize_claim(claim)
+        if key not in self.index:
+            # 索引に無い主張（「アップルジャパン」の中の「アップル」など）は部分一致で引いて索引に足す。
+            # 直前に数字が続かない位置のみ（「5%」が「25%」に当たらないように）
+            pattern = re.compile(r"(?<![\d.])" + re.escape(key))
+            self.index[key] = {i for i, normalized in enumerate(self.normalized_lines) if pattern.search(normalized)}
+        return self.index[key]
+
+    def lookup(self, claim):
+        """主張が載っている検索結果の行（見つからなければ None）"""
+        return self.lookup_together([claim])
+
+    def lookup_together(self, claims):
+        """全ての主張が載っている検索結果の行（同じ行に無ければ None）"""
+        rows = None
+        for posting in sorted((self.postings(c) for c in claims), key=len):
+            rows = posting if rows is None else rows & posting
+            if not rows:
+                return None
+        return self.lines[min(rows)] if rows else None
+
+
+def has_kanji_name(text):
+    """照合できない漢字の人名・組織名（肩書き・組織の語尾つき、略称）を含むか"""
+    return bool(_KANJI_NAME_RE.search(unicodedata.normalize("NFKC", text or "")))
+
+
+def ground_post(post_body, index, verified=()):
+    """本文を文ごとに検索結果の索引で照合する
+
+    数字・固有名詞を含む文だけを照合し、それらが全て同じ行に載っていれば確認済みとする。
+    裏付けになる数字が無いまま主張を含む文、漢字の人名・組織名を含む文は照合できない（LLM に回す）。
+    主張を含まない文（感想・呼びかけ）は確認済みにも未確認にも数えない。
+
+    Args:
+        verified: 過去のファクトチェックで確認済みの文（claim_store.verified_sentences）。
+                  正規化した文がそのまま一致する文だけを照合の対象から外す（主張単位では信頼しない）
+    Returns:
+        dict: {"grounded": {文: 出典の行}, "ungrounded": [照合できなかった文], "skipped": 外した文の数,
+               "claim_free": 主張を含まない文の数,
+               "passed": 索引で確認できた文があり、主張を含む残りの文が全て確認できたか}
+    """
+    verified_keys = {normalize_claim(s) for s in verified}
+    grounded, ungrounded, skipped, claim_free = {}, [], 0, 0
+    for sentence in split_sentences(post_body):
+        if normalize_claim(sentence) in verified_keys:
+            skipped += 1
+            continue
+        claims = extract_claims(sentence)
+        if not claims["numbers"] and not claims["entities"] and not has_kanji_name(sentence):
+            claim_free += 1
+            continue
+        strong = [n for n in claims["numbers"] if not n.endswith(_WEAK_UNITS)]
+        source = None
+        if strong and not has_kanji_name(sentence):
+            source = index.lookup_together(claims["numbers"] + claims["entities"])
+        if source is None:
+            ungrounded.append(sentence)
+        else:
+            grounded[sentence] = source
+    return {
+        "grounded": grounded,
+        "ungrounded": ungrounded,
+        "skipped": skipped,
+        "claim_free": claim_free,
+        "passed": bool(grounded) and not ungrounded,
+    }
+
+
+def provisional_factcheck_text(grounding):
+    """照合を通過した案の暫定ファクトチェック結果（画面・履歴用）"""
+    lines = ["✅ 問題なし（暫定・ローカル照合）", "",
+             "本文の数字・固有名詞を含む各文が検索結果の同じ記事で確認できたため、AIによるファクトチェックを省略しました。", "---"]
+    for sentence, source in grounding["grounded"].items():
+        lines.append(f"- 「{sentence[:40]}」← {source[:80]}")
+    lines.append("---")
+    return "\n".join(lines)
+
+
+# ── 照合の通過率・短縮時間の集計（プロセス全体） ──
+
+_stats_lock = threading.Lock()
+_stats = {"checked": 0, "passed": 0, "llm_calls": 0, "llm_seconds": 0.0}
+
+
+def record_prepass(passed):
+    """ローカル照合を1件実施したことを記録"""
+    with _stats_lock:
+        _stats["checked"] += 1
+        _stats["passed"] += int(bool(passed))
+
+
+def record_llm_check(seconds):
+    """LLMによるファクトチェック1回の所要時間を記録（短縮時間の見積もりに使う）"""
+    with _stats_lock:
+        _stats["llm_calls"] += 1
+        _stats["llm_seconds"] += seconds
+
+
+def prepass_summary():
+    """{"checked", "passed", "pass_rate", "saved_seconds"}（LLMチェックの平均時間 × 省略件数で見積もる）"""
+    with _stats_lock:
+        stats = dict(_stats)
+    avg = stats["llm_seconds"] / stats["llm_calls"] if stats["llm_calls"] else 0.0
+    return {
+        "checked": stats["checked"],
+        "passed": stats["passed"],
+        "pass_rate": stats["passed"] / stats["checked"] if stats["checked"] else 0.0,
+        "saved_seconds": stats["passed"] * avg,
+    }
@@ -0,0 +1,105 @@
+"""
+確認済みの文の知識キャッシュ（SQLite・セッションをまたいで共有）
+
+「現在のアメリカ大統領」「直近の政策金利」のような背景の事実は、どのセッションでも毎回
+ファクトチェックし直されている。ファクトチェックで問題なしとなった文を正規化して、
+出典と有効期限つきで保存し、次からはファクトチェックのプロンプトから確認済みの文を外し、
+残りの文だけを確認させる。
+
+- 信頼するのは正規化した文全体が一致する場合だけ（文から取り出した数字・固有名詞を
+  別の文で信頼すると、確認済みの数字や名前を使った誤った文まで素通りするため）
+- 確認済みの文だけで ✅ にはしない（本文の全ての文が確認済みでも通常どおりチェックする）
+- 数字を含む文は変わりやすいので VERIFIED_NUMBER_DAYS 日、固有名詞だけの文は VERIFIED_ENTITY_DAYS 日で期限切れ
+"""
+
+import sqlite3
+import time
+from pathlib import Path
+
+import claim_grounding
+import token_budget
+from post_pipeline import split_sentences, parse_factcheck_findings, needs_auto_fix
+
+DB_PATH = Path(__file__).parent / "verified_claims.db"
+NUMBER_CLAIM_DAYS = token_budget.budget_from_env("VERIFIED_NUMBER_DAYS", 3)
+ENTITY_CLAIM_DAYS = token_budget.budget_from_env("VERIFIED_ENTITY_DAYS", 30)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS statements (
+    statement_key  TEXT PRIMARY KEY,
+    statement      TEXT NOT NULL,
+    source         TEXT NOT NULL,
+    verified_ts    REAL NOT NULL,
+    expires_ts     REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_statements_expires ON statements(expires_ts);
+"""
+
+
+def connect(db_path=DB_PATH):
+    """ストアに接続（テーブルが無ければ作成）"""
+    conn = sqlite3.connect(str(db_path), timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _in_clause(keys):
+    return ",".join("?" * len(keys))
+
+
+def verified_sentences(post_body, db_path=DB_PATH):
+    """本文中の、期限内に確認済みの文（本文中の表記のまま）"""
+    sentences = split_sentences(post_body)
+    if not sentences or not Path(db_path).exists():
+        return set()
+    keys = {claim_grounding.normalize_claim(s): s for s in sentences}
+    conn = connect(db_path)
+    try:
+        rows = conn.execute(
+            f"SELECT statement_key FROM statements WHERE statement_key IN ({_in_clause(keys)}) AND expires_ts >= ?",
+            [*keys, time.time()],
+        ).fetchall()
+    finally:
+        conn.close()
+    return {keys[row["statement_key"]] for row in rows}
+
+
+def record_factcheck(post_body, fc_text, index=None, model="", db_path=DB_PATH):
+    """ファクトチェック結果から、問題なしと確認できた文を保存する
+
+    ✅ なら数字・固有名詞を含む全ての文、⚠️/❌ なら指摘の該当箇所を含まない文だけを保存する。
+    出典は検索結果の索引で見つかった行（無ければ確認したモデル）。
+    """
+    if not fc_text:
+        return 0
+    spans = [f["span"] for f in parse_factcheck_findings(fc_text) if f["span"]] if needs_auto_fix(fc_text) else []
+    if needs_auto_fix(fc_text) and not spans:
+        return 0  # どの文への指摘か分からないので何も信頼しない
+    now = time.time()
+    statements = []
+    for sentence in split_sentences(post_body):
+        if any(span in sentence or sentence in span for span in spans):
+            continue
+        claims = claim_grounding.extract_claims(sentence)
+        if not claims["numbers"] and not claims["entities"]:
+            continue
+        source = next((index.lookup(c) for c in claims["numbers"] + claims["entities"]
+                       if index is not None and index.lookup(c)), None) or f"ファクトチェック（{model}）"
+        days = NUMBER_CLAIM_DAYS if claims["numbers"] else ENTITY_CLAIM_DAYS
+        statements.append((claim_grounding.normalize_claim(sentence), sentence, source, now, now + days * 86400))
+    if not statements:
+        return 0
+
+    conn = connect(db_path)
+    try:
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO statements (statement_key, statement, source, verified_ts, expires_ts) "
+                "VALUES (?, ?, ?, ?, ?)",
+                statements,
+            )
+            conn.execute("DELETE FROM statements WHERE expires_ts < ?", (now,))
+    finally:
+        conn.close()
+    return len(statements)
@@ -0,0 +1,236 @@
+"""
+Claude API 呼び出しゲートウェイ（APIキーごとにプロセス全体で1つ）
+
+複数のオペレーターが同じキーを使うと、セッションごとの呼び出しが無秩序に競合して
+429（レート制限）や 529（過負荷）になる。全ての Claude 呼び出しをここに通し、
+- リクエスト数/分・トークン数/分のトークンバケットで送出ペースを揃える
+- 待ち行列は優先度順（対話中の生成 → 並行FC → バックグラウンド）
+- サーバーが再試行を許す失敗はジッター付き指数バックオフで再試行（retry-after を尊重）
+- 429/529 を受けたらキー全体の送出を一時停止して、他の呼び出しも一緒に待たせる
+"""
+
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+import anthropic
+
+import token_budget
+
+logger = logging.getLogger("x_post_tool")
+
+# 優先度（小さいほど先に送る）
+PRIORITY_INTERACTIVE = 0  # 画面の前で待っている生成・選定・修正
+PRIORITY_NORMAL = 1  # 生成と並行して走るファクトチェック・自動修正
+PRIORITY_BACKGROUND = 2  # 先読み生成など、誰も待っていない処理
+
+# レート上限（Anthropicの利用枠に合わせて環境変数で上書き）
+REQUESTS_PER_MINUTE = token_budget.budget_from_env("CLAUDE_REQUESTS_PER_MINUTE", 50)
+TOKENS_PER_MINUTE = token_budget.budget_from_env("CLAUDE_TOKENS_PER_MINUTE", 100000)
+
+# 再試行
+MAX_ATTEMPTS = 4
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 30.0
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+IMAGE_TOKEN_ESTIMATE = 1600  # 画像1枚あたりの入力トークン概算
+
+
+class _TokenBucket:
+    """1分あたり per_minute 個まで補充されるバケット（残量は負にもなる＝借り越し）"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        amount = min(amount, self.capacity)  # 上限を超える大きな依頼も満タンなら通す
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount):
+        self.level -= amount
+
+    def give(self, amount):
+        self.level = min(self.capacity, self.level + amount)
+
+
+def estimate_request_tokens(params):
+    """リクエストが消費するトークン数の見積もり（入力の概算＋max_tokens）"""
+    def text_of(content):
+        if isinstance(content, str):
+            return content, 0
+        texts, images = [], 0
+        for block in content or []:
+            if block.get("type") == "text":
+                texts.append(block.get("text", ""))
+            elif block.get("type") == "image":
+                images += 1
+        return "\n".join(texts), images
+
+    system_text, _ = text_of(params.get("system", ""))
+    total = token_budget.estimate_tokens(system_text)
+    for message in params.get("messages", []):
+        text, images = text_of(message.get("content", ""))
+        total += token_budget.estimate_tokens(text) + images * IMAGE_TOKEN_ESTIMATE
+    return total + params.get("max_tokens", 0)
+
+
+def _used_tokens(message):
+    usage = getattr(message, "usage", None)
+    if usage is None:
+        return None
+    return (usage.input_tokens + usage.output_tokens
+            + (getattr(usage, "cache_creation_input_tokens", 0) or 0))
+
+
+def _stream_snapshot(stream):
+    """ストリームの現時点のメッセージ（途中で失敗した場合は None）"""
+    try:
+        return stream.current_message_snapshot
+    except Exception:
+        return None
+
+
+def _retry_delay(error, attempt):
+    """再試行までの待ち時間（秒）。再試行すべきでなければ None"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    should_retry = headers.get("x-should-retry")
+    if should_retry == "false":
+        return None
+    if not isinstance(error, anthropic.APIConnectionError):
+        status = getattr(error, "status_code", None)
+        if status not in RETRYABLE_STATUS and should_retry != "true":
+            return None
+    delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+    try:
+        delay = max(delay, float(headers.get("retry-after", 0)))
+    except (TypeError, ValueError):
+        pass
+    return delay
+
+
+def describe_error(error):
+    """画面表示用のエラーメッセージ（レート制限・過負荷は再実行を促す）"""
+    status = getattr(error, "status_code", None)
+    if status == 429:
+        return "Claude APIのレート制限に達しました（429）。少し時間をおいて再実行してください"
+    if status in (500, 502, 503, 504, 529):
+        return f"Claude APIが混み合っています（{status}）。少し時間をおいて再実行してください"
+    if isinstance(error, anthropic.APITimeoutError):
+        return "Claude APIの応答がタイムアウトしました。再実行してください"
+    if isinstance(error, anthropic.APIConnectionError):
+        return "Claude APIに接続できませんでした。ネットワークを確認してください"
+    return str(error)
+
+
+class ClaudeGateway:
+    """1つのAPIキーに対する全 Claude 呼び出しの窓口（スレッドセーフ）
+
+    client は再試行なし（max_retries=0）で作ること。再試行はゲートウェイが行う。
+    """
+
+    def __init__(self, client, requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE,
+                 max_attempts=MAX_ATTEMPTS):
+        self.client = client
+        self.max_attempts = max_attempts
+        self._requests = _TokenBucket(requests_per_minute)
+        self._tokens = _TokenBucket(tokens_per_minute)
+        self._cond = threading.Condition()
+        self._waiting = []  # (優先度, 受付順) のヒープ
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+
+    def _acquire(self, priority, tokens):
+        """優先度順に並んでレート枠を確保する（確保したトークン数を返す）"""
+        ticket = (priority, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self._waiting[0] != ticket:
+                        self._cond.wait()
+                        continue
+                    self._requests.refill(now)
+                    self._tokens.refill(now)
+                    wait = max(self._paused_until - now, self._requests.wait_time(1), self._tokens.wait_time(tokens))
+                    if wait <= 0:
+                        self._requests.take(1)
+                        self._tokens.take(tokens)
+                        return tokens
+                    self._cond.wait(timeout=wait)
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+
+    def _settle(self, reserved, used):
+        """見積もりと実際の消費の差をバケットに反映"""
+        if used is None:
+            return
+        with self._cond:
+            if used < reserved:
+                self._tokens.give(reserved - used)
+            else:
+                self._tokens.take(used - reserved)
+            self._cond.notify_all()
+
+    def _should_retry(self, error, attempt, stage):
+        """失敗時の処理。再試行するなら待ってから True を返す"""
+        delay = _retry_delay(error, attempt)
+        if delay is None or attempt + 1 >= self.max_attempts:
+            return False
+        logger.warning("claude %s: %s → %.1f秒後に再試行（%d/%d）",
+                       stage, describe_error(error), delay, attempt + 1, self.max_attempts - 1)
+        if getattr(error, "status_code", None) in (429, 529):
+            # キー全体が混んでいるので、並んでいる他の呼び出しも一緒に待たせる
+            with self._cond:
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                self._cond.notify_all()
+        time.sleep(delay)
+        return True
+
+    def create(self, priority=PRIORITY_NORMAL, stage="", **params):
+        """messages.create をレート制御・再試行付きで呼ぶ"""
+        tokens = estimate_request_tokens(params)
+        for attempt in itertools.count():
+            reserved = self._acquire(priority, tokens)
+            try:
+                response = self.client.messages.create(**params)
+            except anthropic.APIError as e:
+                self._settle(reserved, 0)
+                if not self._should_retry(e, attempt, stage):
+                    raise
+                continue
+            self._settle(reserved, _used_tokens(response))
+            return response
+
+    @contextmanager
+    def stream(self, priority=PRIORITY_INTERACTIVE, stage="", **params):
+        """messages.stream をレート制御付きで開く（再試行は接続〜最初の応答までの失敗のみ）"""
+        tokens = estimate_request_tokens(params)
+        with ExitStack() as stack:
+            for attempt in itertools.count():
+                reserved = self._acquire(priority, tokens)
+                try:
+                    stream = stack.enter_context(self.client.messages.stream(**params))
+                    break
+                except anthropic.APIError as e:
+                    self._settle(reserved, 0)
+                    if not self._should_retry(e, attempt, stage):
+                        raise
+            try:
+                yield stream
+            finally:
+                self._settle(reserved, _used_tokens(_stream_snapshot(stream)))
@@ -0,0 +1,67 @@
+"""
+検索結果の関連度選択（文字バイグラムの BM25）
+
+複数トピックを選ぶと、検索結果（1行1件）は全トピック分がつながった1つのテキストになり、
+どの案のファクトチェック・自動修正にも同じ全文が渡っていた。案の本文をクエリにして
+検索結果の各行を BM25 で採点し、関連の高い上位 k 行だけをその案のプロンプトに入れる。
+
+- 日本語は分かち書きしないので、NFKC・小文字化した文字バイグラムを語として扱う
+- クエリ（案の本文）のバイグラムは重複を数えない（長い案ほど有利になるのを防ぐ）
+"""
+
+import math
+import re
+import unicodedata
+from collections import Counter
+
+import token_budget
+
+TOP_K = token_budget.budget_from_env("FACTCHECK_TOP_K", 8)
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def bigrams(text):
+    """照合用の文字バイグラム（空白・記号は区切りとして扱う）"""
+    t = unicodedata.normalize("NFKC", text or "").lower()
+    grams = []
+    for chunk in re.split(r"[\s、。，,.!?！？「」『』()（）\[\]【】・:：/]+", t):
+        grams.extend(chunk[i:i + 2] for i in range(len(chunk) - 1))
+        if len(chunk) == 1:
+            grams.append(chunk)
+    return grams
+
+
+class FactIndex:
+    """検索結果の行に対する BM25 索引（生成1回分のメモリ上のみ）"""
+
+    def __init__(self, facts_text):
+        self.lines = list(dict.fromkeys(line for line in (facts_text or "").split("\n") if line.strip()))
+        self.term_freqs = [Counter(bigrams(line)) for line in self.lines]
+        self.lengths = [sum(tf.values()) for tf in self.term_freqs]
+        self.avg_length = sum(self.lengths) / len(self.lengths) if self.lines else 0.0
+        doc_freq = Counter(term for tf in self.term_freqs for term in tf)
+        n = len(self.lines)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freq.items()}
+
+    def scores(self, query):
+        """各行の BM25 スコア"""
+        terms = set(bigrams(query)) & self.idf.keys()
+        result = []
+        for tf, length in zip(self.term_freqs, self.lengths):
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / self.avg_length) if self.avg_length else BM25_K1
+            result.append(sum(
+                self.idf[t] * tf[t] * (BM25_K1 + 1) / (tf[t] + norm) for t in terms if t in tf
+            ))
+        return result
+
+    def top_text(self, query, k=TOP_K):
+        """クエリに関連の高い上位 k 行を関連度順に並べたテキスト（関連する行が無ければ先頭 k 行）"""
+        if len(self.lines) <= k:
+            return "\n".join(self.lines)
+        scored = sorted(
+            ((score, i) for i, score in enumerate(self.scores(query)) if score > 0),
+            key=lambda x: (-x[0], x[1]),
+        )
+        picked = [i for _, i in scored[:k]] or list(range(k))
+        return "\n".join(self.lines[i] for i in picked)
@@ -0,0 +1,95 @@
+"""
+ファクトチェック結果の永続キャッシュ（SQLite）
+
+修正フローでは同じ本文を何度もチェックし（修正版 → 自動修正後の再チェック）、再生成や
+履歴からの読み込みでもチェック済みの文章が再び送られる。本文・検索コンテキスト・モデル・
+チェック用プロンプトが同じなら結果も同じとみなし、Claude を呼ばずに前回の結果を返す。
+
+- 本文は NFKC・空白の正規化をしてからハッシュ化する（改行位置や全角半角の揺れで外さない）
+- 検索結果が変われば別キーになるので、新しい情報が入れば自然に再チェックされる
+- 古い結果は FACTCHECK_CACHE_DAYS 日で期限切れ（事実関係は時間とともに変わる）
+"""
+
+import hashlib
+import re
+import sqlite3
+import time
+import unicodedata
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import token_budget
+
+DB_PATH = Path(__file__).parent / "factcheck_cache.db"
+MAX_AGE_DAYS = token_budget.budget_from_env("FACTCHECK_CACHE_DAYS", 7)
+JST = timezone(timedelta(hours=9))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS factchecks (
+    cache_key   TEXT PRIMARY KEY,
+    model       TEXT NOT NULL,
+    result      TEXT NOT NULL,
+    created_ts  REAL NOT NULL,
+    hits        INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_factchecks_created ON factchecks(created_ts);
+"""
+
+
+def normalize_body(text):
+    """ポスト本文をキャッシュ照合用に正規化"""
+    t = unicodedata.normalize("NFKC", text or "")
+    return re.sub(r"\s+", " ", t).strip()
+
+
+def cache_key(post_body, search_text, model, system_prompt=""):
+    """本文・検索コンテキスト・モデル（＋チェック用プロンプト）からキャッシュキーを作る"""
+    h = hashlib.sha256()
+    for part in (normalize_body(post_body), (search_text or "").strip(), model, system_prompt):
+        h.update(part.encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+def connect(db_path=DB_PATH):
+    """キャッシュに接続（テーブルが無ければ作成）"""
+    conn = sqlite3.connect(str(db_path), timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def lookup(key, db_path=DB_PATH):
+    """キャッシュ済みの結果を取得
+
+    Returns:
+        (str, datetime) | None: 結果テキストとチェックした日時（JST）。無いか期限切れなら None
+    """
+    conn = connect(db_path)
+    try:
+        with conn:
+            row = conn.execute(
+                "SELECT result, created_ts FROM factchecks WHERE cache_key = ? AND created_ts >= ?",
+                (key, time.time() - MAX_AGE_DAYS * 86400),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE factchecks SET hits = hits + 1 WHERE cache_key = ?", (key,))
+        return row["result"], datetime.fromtimestamp(row["created_ts"], JST)
+    finally:
+        conn.close()
+
+
+def store(key, model, result, db_path=DB_PATH):
+    """チェック結果を保存し、期限切れの行を掃除する"""
+    now = time.time()
+    conn = connect(db_path)
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO factchecks (cache_key, model, result, created_ts, hits) VALUES (?, ?, ?, ?, 0)",
+                (key, model, result, now),
+            )
+            conn.execute("DELETE FROM factchecks WHERE created_ts < ?", (now - MAX_AGE_DAYS * 86400,))
+    finally:
+        conn.close()
@@ -0,0 +1,1260 @@
+"""
+ポスト生成パイプラインの共通部品（Streamlitに依存しない）
+
+app.py（対話UI）と pregenerate_drafts.py（夜間バッチ）の両方から使う。
+- プロンプト（トピック選定・生成・ファクトチェック・自動修正）とリクエストの組み立て
+- 生成結果の解析、ニュース・Web検索、履歴の保存、トークン使用量の記録
+"""
+
+import difflib
+import json
+import logging
+import re
+import threading
+import urllib.parse
+import urllib.request
+import feedparser
+import trend_store
+import token_budget
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+
+# 日本時間 (JST = UTC+9)
+JST = timezone(timedelta(hours=9))
+
+# Claude呼び出しごとのトークン使用量などを記録するロガー（プロセス全体・スレッドセーフ）
+logger = logging.getLogger("x_post_tool")
+if not logger.handlers:
+    _log_handler = logging.StreamHandler()
+    _log_handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s"))
+    logger.addHandler(_log_handler)
+    logger.setLevel(logging.INFO)
+
+APP_DIR = Path(__file__).parent
+HISTORY_DIR = APP_DIR / "history"
+HISTORY_DIR.mkdir(exist_ok=True)
+SYSTEM_PROMPT_PATH = APP_DIR / "suasi_system_prompt.md"
+CLAUDE_MODEL = "claude-sonnet-4-20250514"
+
+# トークン予算（環境変数で上書き可）
+TOPICS_CONTEXT_BUDGET = token_budget.budget_from_env("TOPICS_CONTEXT_BUDGET", 6000)  # 生成依頼のトピック情報
+FACTCHECK_CONTEXT_BUDGET = token_budget.budget_from_env("FACTCHECK_CONTEXT_BUDGET", 2500)  # FC・自動修正に渡す検索結果
+POST_MAX_CHARS = 800  # 1案の想定文字数の上限
+GENERATION_MAX_TOKENS = token_budget.max_tokens_for(POST_MAX_CHARS, count=3, extra_chars=1000)  # 3案＋見出し・メタ情報
+FACTCHECK_MAX_TOKENS = token_budget.max_tokens_for(1000)  # 判定＋指摘数件
+RECOMMEND_MAX_TOKENS = token_budget.max_tokens_for(200, count=5)  # 推薦5件分のツール入力
+
+# 段階ごとに使い分けるモデルと料金（USD / 100万トークン: 入力, 出力, キャッシュ書き込み, キャッシュ読み込み）
+FAST_MODEL = "claude-3-5-haiku-20241022"
+THOROUGH_MODEL = "claude-opus-4-20250514"
+MODEL_PRICES = {
+    FAST_MODEL: (0.80, 4.00, 1.00, 0.08),
+    CLAUDE_MODEL: (3.00, 15.00, 3.75, 0.30),
+    THOROUGH_MODEL: (15.00, 75.00, 18.75, 1.50),
+}
+BATCH_PRICE_FACTOR = 0.5  # Message Batches API は通常料金の半額
+
+# パイプラインプロファイル: 段階ごとのモデル・max_tokens・ON/OFF（省略時は CLAUDE_MODEL・既定の max_tokens・ON）
+PIPELINE_STAGES = ("recommend", "generate", "factcheck", "auto_fix", "recheck")
+STAGE_MAX_TOKENS = {
+    "recommend": RECOMMEND_MAX_TOKENS,
+    "generate": GENERATION_MAX_TOKENS,
+    "factcheck": FACTCHECK_MAX_TOKENS,
+    "auto_fix": token_budget.OUTPUT_MAX_TOKENS,  # 上限のみ。実際の値は元の本文の長さから決める（rewrite_max_tokens）
+    "recheck": FACTCHECK_MAX_TOKENS,
+}
+PIPELINE_PROFILES = {
+    "fast": {
+        "label": "⚡ 高速（選定・FCは軽量モデル、自動修正なし）",
+        "recommend": {"model": FAST_MODEL},
+        "factcheck": {"model": FAST_MODEL},
+        "auto_fix": {"enabled": False},
+        "recheck": {"enabled": False},
+    },
+    "standard": {
+        "label": "⚖️ 標準（選定は軽量モデル、指摘があれば自動修正→再チェック）",
+        "recommend": {"model": FAST_MODEL},
+        "recheck": {"model": FAST_MODEL},
+    },
+    "thorough": {
+        "label": "🔬 徹底（生成は最上位モデル、自動修正→再チェック、ローカル照合なしで全案をAIがチェック）",
+        "claim_prepass": False,
+        "generate": {"model": THOROUGH_MODEL},
+        "auto_fix": {"model": THOROUGH_MODEL},
+    },
+}
+DEFAULT_PROFILE = "standard"
+
+
+# ──────────────────────────────────────
+# ユーティリティ
+# ──────────────────────────────────────
+
+def load_system_prompt():
+    if SYSTEM_PROMPT_PATH.exists():
+        return SYSTEM_PROMPT_PATH.read_text(encoding="utf-8")
+    return ""
+
+def stage_config(profile, stage):
+    """プロファイルの1段階分の設定 {"enabled", "model", "max_tokens"}"""
+    cfg = PIPELINE_PROFILES.get(profile, PIPELINE_PROFILES[DEFAULT_PROFILE]).get(stage, {})
+    return {
+        "enabled": cfg.get("enabled", True),
+        "model": cfg.get("model", CLAUDE_MODEL),
+        "max_tokens": cfg.get("max_tokens", STAGE_MAX_TOKENS[stage]),
+    }
+
+def claim_prepass_enabled(profile):
+    """数字・固有名詞のローカル照合でファクトチェックを省略してよいプロファイルか"""
+    return PIPELINE_PROFILES.get(profile, PIPELINE_PROFILES[DEFAULT_PROFILE]).get("claim_prepass", True)
+
+def apply_stage(request, profile, stage):
+    """リクエストパラメータのモデルをプロファイルの設定に差し替え、max_tokens をプロファイルの上限に収める"""
+    cfg = stage_config(profile, stage)
+    return {**request, "model": cfg["model"], "max_tokens": min(request.get("max_tokens", cfg["max_tokens"]), cfg["max_tokens"])}
+
+def rewrite_max_tokens(post_body):
+    """1案の修正・自動修正の max_tokens（元の本文の長さ＋書き足し分から決める）"""
+    return token_budget.max_tokens_for(len(post_body or ""), extra_chars=200)
+
+def estimate_cost(model, stats, price_factor=1.0):
+    """トークン使用量から料金（USD）を概算"""
+    prices = MODEL_PRICES.get(model)
+    if not prices or not stats:
+        return 0.0
+    per_input, per_output, per_write, per_read = prices
+    total = (stats["input"] * per_input + stats["output"] * per_output
+             + stats["cache_write"] * per_write + stats["cache_read"] * per_read)
+    return total / 1_000_000 * price_factor
+
+# プロファイルごとの累計（プロセス全体・スレッドセーフ）
+_profile_usage_lock = threading.Lock()
+_profile_usage = {}
+
+def _profile_bucket(profile):
+    return _profile_usage.setdefault(profile, {"calls": 0, "cost": 0.0, "input": 0, "output": 0, "runs": 0, "run_seconds": 0.0})
+
+def log_usage(stage, response, max_tokens=None, profile=None, price_factor=1.0):
+    """API呼び出し1回分のトークン使用量（プロンプトキャッシュのヒット数を含む）と概算料金を記録して返す"""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return {}
+    stats = {
+        "input": usage.input_tokens,
+        "output": usage.output_tokens,
+        "cache_read": getattr(usage, "cache_read_input_tokens", 0) or 0,
+        "cache_write": getattr(usage, "cache_creation_input_tokens", 0) or 0,
+        "max_tokens": max_tokens,
+        "model": getattr(response, "model", "") or "",
+    }
+    stats["cost"] = estimate_cost(stats["model"], stats, price_factor)
+    logger.info(
+        "claude %s: profile=%s model=%s input=%d output=%d/%s cache_read=%d cache_write=%d cost=$%.4f",
+        stage, profile or "-", stats["model"], stats["input"], stats["output"], max_tokens or "-",
+        stats["cache_read"], stats["cache_write"], stats["cost"],
+    )
+    if profile:
+        with _profile_usage_lock:
+            bucket = _profile_bucket(profile)
+            bucket["calls"] += 1
+            bucket["cost"] += stats["cost"]
+            bucket["input"] += stats["input"]
+            bucket["output"] += stats["output"]
+    return stats
+
+def record_run(profile, seconds):
+    """生成1回（生成→FC→自動修正まで）の所要時間をプロファイルごとに記録"""
+    logger.info("pipeline run: profile=%s latency=%.1fs", profile, seconds)
+    with _profile_usage_lock:
+        bucket = _profile_bucket(profile)
+        bucket["runs"] += 1
+        bucket["run_seconds"] += seconds
+
+def profile_usage_summary():
+    """プロファイルごとの累計（呼び出し数・料金・トークン数・生成回数・所要時間）のコピー"""
+    with _profile_usage_lock:
+        return {p: dict(b) for p, b in _profile_usage.items()}
+
+def save_history(mode, input_data, result, extra=None):
+    """履歴を1件保存（extra: ファクトチェック結果など追加で残す項目）"""
+    timestamp = datetime.now(JST).strftime("%Y%m%d_%H%M%S")
+    entry = {"timestamp": datetime.now(JST).isoformat(), "mode": mode, "input": input_data, "result": result}
+    if extra:
+        entry.update(extra)
+    filepath = HISTORY_DIR / f"{timestamp}_{mode}.json"
+    # 同じ秒に複数件保存する場合（バッチ）は連番を付けて上書きを防ぐ
+    n = 2
+    while filepath.exists():
+        filepath = HISTORY_DIR / f"{timestamp}_{mode}_{n}.json"
+        n += 1
+    with open(filepath, "w", encoding="utf-8") as f:
+        json.dump(entry, f, ensure_ascii=False, indent=2)
+    return filepath
+
+def load_history_list():
+    files = sorted(HISTORY_DIR.glob("*.json"), reverse=True)
+    entries = []
+    for f in files:
+        try:
+            with open(f, "r", encoding="utf-8") as fp:
+                data = json.load(fp)
+                entries.append(data)
+        except Exception:
+            pass
+    return entries
+
+# ──────────────────────────────────────
+# ニュース取得
+# ──────────────────────────────────────
+
+def fetch_google_news():
+    """Google News RSSからトレンドニュースを取得"""
+    all_items = []
+
+    # ===== Google News Japan トップ =====
+    try:
+        feed = feedparser.parse("https://news.google.com/rss?hl=ja&gl=JP&ceid=JP:ja")
+        for entry in feed.entries[:10]:
+            title = entry.get("title", "")
+            source = ""
+            if " - " in title:
+                parts = title.rsplit(" - ", 1)
+                title, source = parts[0], parts[1]
+            item = {"title": title.strip(), "source": f"Google News / {source}".strip(),
+                    "link": entry.get("link", ""), "published": entry.get("published", ""), "origin": "google"}
+            if not any(n["title"] == item["title"] for n in all_items):
+                all_items.append(item)
+    except Exception:
+        pass
+
+    # ===== Google News ビジネス =====
+    try:
+        feed = feedparser.parse("https://news.google.com/rss/topics/CAAqJggKIiBDQkFTRWdvSUwyMHZNRGx6TVdZU0FtcGhHZ0pLVUNnQVAB?hl=ja&gl=JP&ceid=JP:ja")
+        for entry in feed.entries[:6]:
+            title = entry.get("title", "")
+            source = ""
+            if " - " in title:
+                parts = title.rsplit(" - ", 1)
+                title, source = parts[0], parts[1]
+            item = {"title": title.strip(), "source": f"Google News ビジネス / {source}".strip(),
+                    "link": entry.get("link", ""), "published": entry.get("published", ""), "origin": "google_biz"}
+            if not any(n["title"] == item["title"] for n in all_items):
+                all_items.append(item)
+    except Exception:
+        pass
+
+    # ===== Google News テクノロジー =====
+    try:
+        feed = feedparser.parse("https://news.google.com/rss/topics/CAAqJggKIiBDQkFTRWdvSUwyMHZNRGRqTVhZU0FtcGhHZ0pLVUNnQVAB?hl=ja&gl=JP&ceid=JP:ja")
+        for entry in feed.entries[:6]:
+            title = entry.get("title", "")
+            source = ""
+            if " - " in title:
+                parts = title.rsplit(" - ", 1)
+                title, source = parts[0], parts[1]
+            item = {"title": title.strip(), "source": f"Google News テクノロジー / {source}".strip(),
+                    "link": entry.get("link", ""), "published": entry.get("published", ""), "origin": "google_tech"}
+            if not any(n["title"] == item["title"] for n in all_items):
+                all_items.append(item)
+    except Exception:
+        pass
+
+    return all_items
+
+
+def _search_google_news(query, max_results=5):
+    """Google News RSS検索の結果を記事リストで取得（失敗時は空リスト）"""
+    try:
+        encoded = urllib.parse.quote(query)
+        url = f"https://news.google.com/rss/search?q={encoded}&hl=ja&gl=JP&ceid=JP:ja"
+        feed = feedparser.parse(url)
+        articles = []
+        for entry in feed.entries[:max_results]:
+            title = entry.get("title", "")
+            source = ""
+            if " - " in title:
+                parts = title.rsplit(" - ", 1)
+                title, source = parts[0], parts[1]
+            articles.append({"title": title, "source": source, "link": entry.get("link", ""), "published": entry.get("published", "")})
+        return articles
+    except Exception:
+        return []
+
+def _news_facts(articles):
+    """記事リストをファクト行（[出典] 見出し（日時））にする"""
+    return [f"[{a['source']}] {a['title']}（{a['published']}）" for a in articles]
+
+def fetch_related_news(keyword, max_results=5):
+    """Google News RSSから特定キーワードの関連ニュースを取得"""
+    return _search_google_news(keyword, max_results)
+
+# ──────────────────────────────────────
+# AIによるトピック選定
+# ──────────────────────────────────────
+
+RECOMMEND_SYSTEM_PROMPT = """あなたはYouTube「大人の学び直しTV」（90万人登録）のすあし社長のX運用アドバイザーです。
+すあし社長の4つの柱は「国際情勢」「経済」「テクノロジー」「人生キャリア論」です。
+
+ニュース一覧から、すあし社長がXで取り上げるべきトピックを厳選してください。
+
+■ 選定基準（すあし社長との相性）
+- 経済・お金・投資に関連する話題 → ◎ 最高
+- AI・テクノロジーの社会的インパクト → ◎ 最高
+- 国際情勢が日本の生活に影響する話題 → ○ 高い
+- 社会構造の変化（人口・雇用・教育） → ○ 高い
+- 「常識だと思っていたことが実は違う」系 → ◎ 最高（常識転覆型のフック）
+- 数字やデータで驚きがある話題 → ◎ 最高（数字ショック型のフック）
+- 芸能・スポーツ・事件事故 → × 対象外
+
+■ 出力: submit_recommendations ツールで提出してください
+- index: 元のニュース番号
+- source_type: [X]なら"x"、[News]なら"news"
+- reason: すあし社長が取り上げるべき理由（1文）
+- angle: 切り口の提案（例：『○○と△△の逆説を突く』『過去の□□と比較して構造変化を示す』）
+- score: 0-100で、すあし社長との相性度。80点以上のもののみ選定（最大5つ）。相性度の高い順に並べる"""
+
+RECOMMEND_TOOL = {
+    "name": "submit_recommendations",
+    "description": "すあし社長向きに厳選したトピックを提出する",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "recommendations": {
+                "type": "array",
+                "maxItems": 5,
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "index": {"type": "integer"},
+                        "title": {"type": "string"},
+                        "source_type": {"type": "string", "enum": ["x", "news"]},
+                        "reason": {"type": "string"},
+                        "angle": {"type": "string"},
+                        "pillars": {
+                            "type": "array",
+                            "items": {"type": "string", "enum": ["国際情勢", "経済", "テクノロジー", "人生キャリア論"]},
+                        },
+                        "hook_type": {"type": "string"},
+                        "score": {"type": "integer", "minimum": 0, "maximum": 100},
+                    },
+                    "required": ["index", "title", "reason", "angle", "pillars", "hook_type", "score"],
+                },
+            },
+        },
+        "required": ["recommendations"],
+    },
+}
+
+def build_recommend_request(news_items):
+    """トピック選定のリクエストパラメータ（messages.create / stream / バッチ共通）
+
+    勢い（速度）の情報があれば勢い順に並べ、上昇中のトピックを上位に見せる。
+    """
+    if any(n.get("velocity") is not None for n in news_items):
+        news_items = sorted(news_items, key=trend_store.momentum_sort_key, reverse=True)
+
+    # ソースタイプを明示
+    tagged_items = []
+    for i, n in enumerate(news_items):
+        origin = n.get('origin', '')
+        if origin == 'x_news':
+            tag = '[X]'
+        elif origin == 'yahoo_rt':
+            tag = '[Yahoo]'
+        else:
+            tag = '[News]'
+        momentum = f" [勢い +{n['velocity']:,.0f}件/時]" if n.get("velocity") else ""
+        tagged_items.append(f"{i+1}. {tag} {n['title']}（{n['source']}）{momentum}")
+    news_list = "\n".join(tagged_items)
+
+    return {
+        "model": CLAUDE_MODEL,
+        "max_tokens": RECOMMEND_MAX_TOKENS,
+        "system": RECOMMEND_SYSTEM_PROMPT,
+        "tools": [RECOMMEND_TOOL],
+        "tool_choice": {"type": "tool", "name": RECOMMEND_TOOL["name"]},
+        "messages": [{"role": "user", "content": f"以下のニュース一覧から、すあし社長向きのトピックを厳選してください：\n\n{news_list}"}],
+    }
+
+
+def extract_recommendations(message):
+    """選定レスポンスのツール入力から推薦リストを取り出す"""
+    for block in message.content:
+        if block.type == "tool_use" and block.name == RECOMMEND_TOOL["name"]:
+            return block.input.get("recommendations", [])
+    return []
+
+
+# ──────────────────────────────────────
+# 高品質ポスト生成プロンプト
+# ──────────────────────────────────────
+
+ENHANCED_GENERATION_PROMPT = """
+
+## ■ 追加指示：このセッションでの生成品質を最大化する
+
+### すあし社長のトーン（最重要）
+
+すあし社長は**「わかりやすく仕組みを解説する知的な先生」**です。以下のトーンを必ず守ってください：
+- 一人称は必ず**「私」**を使う
+- 基本は**「です」「ます」の丁寧語**をベースに書く（全体の7割）
+- 要所で**「〜なんですよね」「〜だと思います」「〜かもしれません」**のような柔らかい表現を混ぜる（3割）
+- 上から目線ではなく、**「一緒に整理してみましょう」「一緒に考えてみませんか」**という姿勢
+- 読者を「授業に招く」感覚で、**仕組み・構造・メカニズムを順序立てて丁寧に解説する**
+- **含蓄のある一文**を要所に入れる（例:「税制は社会の鏡だと言われます」「課題が明確であることは、実は最大の武器です」）
+- 否定的・悲観的になりすぎず、最後は**読者に考える余地を残す問いかけ**で締める
+- 読後感は「なるほど、そういう仕組みだったのか」という**知的な発見**
+
+### 読みやすさのルール（重要）
+
+- **読点（、）を減らす。** 1文に読点は最大2つまで。読点の代わりに文を分けるか句点（。）で切る。
+  - ❌「石油価格が上がり、物価も上がり、家計が苦しくなる」
+  - ✅「石油価格が上がれば物価も上がる。家計が苦しくなるのは当然です」
+- **1文は短く。** 1文は40〜60文字を目安にする。長い文は2つに分ける。
+- **難しい言葉を使わない。** 専門用語はすぐ後に平易な言い換えを添える。
+  - ❌「地政学的リスクが顕在化している」
+  - ✅「国と国の位置関係が生むリスクが現実になっている」
+- **「つまり」「要するに」を活用。** 複雑な説明の後にひと言でまとめ直す。
+- **具体的な例え・スケール感を入れる。** 数字だけでなく身近なものに置き換える。
+  - ✅「幅33キロ。東京駅から千葉駅ほどの距離です」
+  - ✅「日本の人口が毎年90万人減っている。つまり毎年ほぼ堺市1つ分が消えている計算です」
+
+### 最重要：「前提知識の解説→比較→示唆」の文章構造
+
+すあし社長のポストは「意見表明」ではなく「前提を丁寧に教える→比較で驚きを与える→示唆で考えさせる」の構造が核心です。
+読者が「そもそもこれって何？」という疑問を持たないよう、前段でキーワードの意味や背景知識を分かりやすく説明してから本題に入ること。
+
+以下の6段構成を必ず守ってください：
+
+**① 冒頭フック: スクロールを止める1文**（1文）
+Xのタイムラインでスクロールの手を止めさせる「衝撃の事実」「意外な数字」「常識を覆す一言」で始める。
+良い例: 「幅わずか33キロの海峡が封鎖されただけで、世界の石油価格は一夜にして30%急騰する…」
+良い例: 「年収100億円の人の税率は、年収500万円のサラリーマンより低い。」
+良い例: 「バフェットは言いました。『私の秘書のほうが税率が高い』と。」
+悪い例: ❌「〜を整理してみましょう」（興味を引かない）
+悪い例: ❌「〜が話題になっています」（ニュースの繰り返し）
+冒頭1文で「え、どういうこと？」と思わせてから、解説に入ること。
+
+**② 前提知識+「なぜ？」の解説: そもそもこれは何か？なぜ起きているのか？を丁寧に教える**（4-6文）
+読者の多くが知らない前提知識を説明し、さらに「なぜこれが問題になっているのか」「なぜ今これが起きているのか」の理由を明示する。
+前提 → 理由（なぜ？） → 本題、の順番を守ること。「なぜ」を入れることで読者は「へぇ、そういう理由か」と腹落ちし、続きを読む動機が生まれる。
+
+- 地理的な話題 → 場所・位置関係を説明し → **なぜその場所が世界にとって重要なのか**を理由とセットで解説
+  - 良い例:「ホルムズ海峡は幅33キロ。ペルシャ湾から外海に出る唯一の出口です。なぜこんな狭い海峡が世界を揺るがすのか。世界の石油輸送量の約20%がここを通過しているからなんです」
+- 制度の話題 → 仕組みの基本を説明し → **なぜその制度が今問題になっているのか**を背景とセットで解説
+  - 良い例:「累進課税は収入が上がるほど税率が上がる仕組みです。最高税率は55%。なぜこれが議論になるのか。実は株の利益には別の税率が適用されて、どれだけ儲けても一律20%なんです」
+- 技術の話題 → 何ができるかを説明し → **なぜ今それが急速に広がっているのか**を理由とセットで解説
+
+「なぜ？」に対する答えが出たところで、「ここからが本題です」と自然に次の展開に入ること。
+
+**③ 歴史との比較: 過去の事例で裏付ける**（2-4文）
+過去に同様の出来事がどう起きたか、具体的な年代・数字・事件名で示す。
+歴史的事例があることで主張の説得力が格段に上がる。
+
+**④ 海外・他国との比較: 視野を世界に広げる**（2-4文）
+同じ問題が他の国でどう扱われているかを紹介する。
+具体的な国名・人名・制度名・数字を出す。「海外では〜」のような曖昧な表現はNG。
+日本と海外の違いを対比させて、構造的な差を浮き彫りにする。
+
+**⑤ 構造・メカニズムの解説: なぜそうなるのかを解き明かす**（2-4文）
+「なぜこんなことが起きるのか」→ 背後にある仕組み・力学を説明する。
+ここが最も価値のある部分。表面的な現象ではなく、根本的な構造を読者に見せる。
+**知的なウィット**を効かせること。皮肉・逆説・パラドックスを使って「なるほど、そう繋がるのか」と思わせる。
+- 良い例:「皮肉なことに、少子化という"弱点"が、AI時代には"構造的な強み"に変わるかもしれません」
+- 良い例:「覇権国でさえコントロールできない状況が生まれている。世界秩序の設計図そのものが書き換わりつつあるんです」
+- 避ける: 単調な因果説明だけで終わること。構造を見せた上で「面白い逆転現象」や「意外な帰結」を一言添える。
+
+**⑥ 締め: 含蓄とウィットのある一文で余韻を残す**（1-2文）
+「だからこうすべき」ではなく、読者の知性に委ねるように終わる。
+格言的・箴言的な表現、歴史や文学の知恵を借りた比喩、パラドックスを活かした一文で締める。
+**暗くならず、読後に「知ることって面白い」「まだやれる」と感じさせる余韻を残す。**
+- 良い例:「税制は社会の鏡だと言われます。私たちがどんな社会を目指すのか、その答えがここに現れているような気がします」
+- 良い例:「古い地図では新しい世界を歩けない。しかし地図を描き直せるのもまた、人間だけです」
+- 良い例:「課題が明確であることは、実は最大の武器です」
+- 避ける: ❌「〜に注意が必要です」（評論家の月並みな締め） ❌「今後の動向を注視しましょう」（NHKニュース的）
+
+### 最高品質のお手本（この水準を目指す）
+
+**お手本A: 税制の解説型ポスト**
+> 税制の仕組みを整理してみましょう。給与所得は累進課税で、年収が上がるほど税率も上がります。最高税率は55％（所得税45％+住民税10％）。ところが株式などの金融所得は「分離課税」で、どれだけ儲けても一律20％なんです。つまり年収1000万円のサラリーマンは33％の税率なのに、株で1億円稼いだ人は20％。この構造が「1億円の壁」を生んでいるんですよね。
+> 実際の数字を見てみると、年収5000万円の人は実効税率約40％。ところが年収100億円の人は約23％まで下がっていました。なぜこんなことが起きるのか。答えは「お金持ちほど株で稼ぐから」です。年収1000万円の人は給与が中心ですが、年収100億円の人は収入の大部分が株の売却益や配当になります。
+> アメリカではこれを「バフェット・ルール」と呼んで問題視しています。投資の神様ウォーレン・バフェットが「私の秘書のほうが税率が高いのはおかしい」と発言したことから始まった議論です。まさに今の日本と同じ構造なんですよね。
+> ただし、本当の問題はここからかもしれません。超富裕層の多くはグローバルに資産を分散させている。シンガポールの税率は最高17％、UAEは0％です。日本の競争力を保ちながら格差是正もする、このバランスをどう取るか。税制は社会の鏡だと言われます。私たちがどんな社会を目指すのか、その答えがここに現れているような気がします。
+
+**このポストが最高品質である理由:**
+1. 「整理してみましょう」と解説モードで入る → 読者を授業に招く
+2. 累進課税55％ vs 分離課税20％ → 仕組みを具体的な数字で対比
+3. 「なぜこんなことが起きるのか」→ メカニズムを丁寧に解き明かす
+4. 「バフェット・ルール」→ 他国の具体的な事例で視野を広げる
+5. シンガポール17％、UAE 0％ → 国際比較の数字で議論を立体的にする
+6. 「税制は社会の鏡」→ 含蓄のある一文で余韻を残す締め
+7. 全体が「ニュースの感想」ではなく「構造の解説」になっている
+
+**お手本B: 少子化の逆転発想型ポスト**
+> 出生数70万人。「日本やばい」という声、私もよく耳にします。でもちょっと逆の視点で見てみてほしいんです。これから10年でAIが本格的に仕事を代替し始めたとき、人口14億の中国やインドでは何が起きるか。大量の失業者が溢れるリスクと隣り合わせになるんですよね。
+> 一方で人口が減り続ける日本は、「AIが仕事を奪う速度」と「人口が減る速度」がちょうど噛み合う可能性があります。皮肉なことに、少子化という「弱点」が、AI時代には「構造的な強み」に変わるかもしれません。
+> 課題が明確であることは、実は最大の武器です。少子化を悲観するだけではなく、「AI国家になる」という発想の転換ができるかどうか。そこが分かれ道だと思います。
+
+### 絶対にやってはいけないこと（NGパターン）
+
+- ❌ 「〜が話題になっています」で始める（ニュースのオウム返し）
+- ❌ 感想や意見だけを並べる（「これは大変なことです」「注目すべきです」）
+- ❌ 仕組みの解説なしに結論を述べる（読者が「なぜ？」と思う）
+- ❌ 数字を1つだけ出す（比較対象がなければインパクトがない）
+- ❌ 「〜すべきだ」「〜しなければならない」で上から目線で説教する
+- ❌ 抽象的な表現だけで具体例がない（「経済に影響がある」→ どう影響？）
+
+### 3つの案の方向性について
+
+3つのポスト案は**固定のパターンではなく、選ばれたトレンドに最適な切り口を考えて決める**こと。
+トレンドの内容を分析し、以下の中から最も効果的な3つの方向性を選択する：
+
+- **地理・地政学の切り口** — 地理的な位置関係や地政学的影響を軸に解説
+- **歴史の繰り返し切り口** — 過去の類似事例との比較で未来を示唆
+- **経済インパクト切り口** — 個人の家計・投資・キャリアへの影響を逆算
+- **テクノロジー変革切り口** — 技術革新が構造をどう変えるかを解説
+- **構造暴露切り口** — 表面からは見えない仕組みや力学を解き明かす
+- **逆転発想切り口** — 常識の逆を突いて新しい視点を提供
+- **自分ごと変換切り口** — 遠い話題を読者の日常に結びつける
+
+**重要:** 3案すべてが同じ方向性にならないこと。異なる角度からトレンドを切ることで、最も刺さる案を選べるようにする。
+
+### 絶対ルール: 最新情報の検索は生成前に必ず実施
+
+ポストを生成する前に、必ずWeb検索で最新情報を収集し、その情報を参照して事実に基づいた正確な記述にすること。
+検索結果がない場合でも、自身の知識の範囲で最新の状況を反映し、不確実な情報には留保をつけること。
+
+### 事前ファクトチェック（生成時に必ず実行）
+
+ポストを出力する前に、以下のファクトチェックを内部で実施し、**クリアしたもののみ出力すること**：
+- 引用した数字・統計は信頼できるソースに基づいているか
+- 歴史的事実（年代・人名・事件名）に誤りがないか
+- 国名・地名・制度名が正確か
+- 因果関係の論理に飛躍がないか
+- 不確実な情報には「〜と言われている」「〜の可能性がある」と留保をつけているか
+ファクトチェックで不合格の部分がある場合は、修正してから出力する。
+
+### 今回の生成で必ず守ること
+
+1. **冒頭1文は「スクロールを止める衝撃の事実・数字・問い」で始める**
+   「幅わずか33キロの海峡が封鎖されただけで、石油価格は30%急騰する」のような意外性ある事実。
+   ニュースの要約や「〜してみましょう」からは絶対に始めない。
+
+2. **前提知識を丁寧に解説してから比較に入る**
+   読者が「それって何？」と思うキーワードや概念を、先に分かりやすく説明する。
+   地理→歴史→構造の順序で積み上げていく。
+
+3. **数字は必ず「比較セット」で使う**
+   「A は○％」だけでなく「Aは○％なのに、Bは△％」の対比で驚きを生む。
+
+4. **歴史との比較・海外との比較を必ず入れる**
+   具体的な年代・国名・人名・制度名を出す。抽象的な「海外では〜」はNG。
+
+5. **締めは「示唆」であって「主張」ではない**
+   「〜だと言われます」「〜な気がします」で余韻を残す。
+   読者自身に考えさせる終わり方にする。
+
+6. **500〜800文字を厳守する**
+   短すぎて浅くならず、長すぎてダレない。この範囲に収める。
+
+### 出力フォーマットの注意
+
+- ポスト本文には**マークダウン記法を一切使わないでください**（**太字**、# 見出し、- リスト等は禁止）
+- 装飾なしのプレーンテキストで自然な文章として書いてください
+- 改行は段落の区切りにのみ使ってください（文の途中で改行しない）
+"""
+
+
+def build_generation_system():
+    """生成・自動修正・修正版で共通のsystemプロンプト
+
+    ペルソナ（suasi_system_prompt.md）と追加指示は毎回同じなので、
+    プロンプトキャッシュ対象の固定ブロックとして先頭に置く（依頼ごとの内容は messages 側）。
+    """
+    blocks = []
+    persona = load_system_prompt()
+    if persona:
+        blocks.append({"type": "text", "text": persona, "cache_control": {"type": "ephemeral"}})
+    blocks.append({"type": "text", "text": ENHANCED_GENERATION_PROMPT, "cache_control": {"type": "ephemeral"}})
+    return blocks
+
+def build_trend_context(selected, related_news, topic_facts):
+    """選択トピックの情報（見出し・関連ニュース・検索結果）を予算内に収めて組み立てる
+
+    予算を超える場合は 関連ニュース → 検索結果 の順に末尾から削る（トピック見出しは残す）。
+    """
+    context_sections = []
+    for s in selected:
+        header = f"\n### トピック: {s['title']}\n"
+        if s.get("angle"):
+            header += f"- 切り口: {s['angle']}\n"
+        if s.get("pillars"):
+            header += f"- 柱の組合せ: {' × '.join(s['pillars'])}\n"
+        if s.get("hook_type"):
+            header += f"- フック型: {s['hook_type']}\n"
+        context_sections.append({"name": f"{s['title'][:20]}/見出し", "text": header, "priority": 3, "trim": False})
+        # 関連ニュース
+        rel = related_news.get(s["title"], [])
+        if rel:
+            context_sections.append({
+                "name": f"{s['title'][:20]}/関連ニュース",
+                "text": "- 関連ニュース:\n" + "\n".join(f"  - {art['title']}（{art['source']}）" for art in rel) + "\n",
+                "priority": 1,
+            })
+        # Web検索結果を追加
+        clean_title = re.sub(r'\s*\(\d[\d,]*件のポスト\)', '', s['title']).strip()
+        facts = topic_facts.get(clean_title, [])
+        if facts:
+            context_sections.append({
+                "name": f"{s['title'][:20]}/検索結果",
+                "text": "- 最新のWeb検索結果（事実確認用）:\n" + "\n".join(f"  - {fact}" for fact in facts) + "\n",
+                "priority": 2,
+            })
+    context_texts, budget_report = token_budget.fit_sections(context_sections, TOPICS_CONTEXT_BUDGET)
+    logger.info("prompt budget topics_context: %s (budget=%d)", budget_report, TOPICS_CONTEXT_BUDGET)
+    # 見出し行だけが残ったセクションは落とす
+    return "".join(
+        t if sec.get("trim") is False or len(t.strip().split("\n")) > 1 else ""
+        for sec, t in zip(context_sections, context_texts)
+    )
+
+
+def fit_search_context(search_text, fixed_texts=(), name="search"):
+    """原稿・画像の説明などと一緒に貼る検索結果を予算内に収める
+
+    原稿・説明（fixed_texts）は削らず、検索結果だけを末尾の行から削る。
+    """
+    sections = [{"name": f"{name}/入力{i + 1}", "text": t or "", "priority": 3, "trim": False}
+                for i, t in enumerate(fixed_texts)]
+    sections.append({"name": f"{name}/検索結果", "text": search_text or "", "priority": 1})
+    texts, budget_report = token_budget.fit_sections(sections, TOPICS_CONTEXT_BUDGET)
+    logger.info("prompt budget %s: %s (budget=%d)", name, budget_report, TOPICS_CONTEXT_BUDGET)
+    return texts[-1]
+
+
+def build_trend_generation_message(selected, related_news, topic_facts, extra="", modify_instruction=""):
+    """トレンド起点の生成依頼（3案）のユーザーメッセージ"""
+    topics_context = build_trend_context(selected, related_news, topic_facts)
+    user_msg = f"""以下のトピックについて、すあし社長スタイルのXポストを3案生成してください。
+各案600〜800文字で、それぞれ異なる切り口で仕組み・構造を解説するスタイルにしてください。
+
+■ 生成する3案（各600〜800文字）:
+【案1】仕組み解説型 — テーマの基本構造を整理して「なぜそうなるのか」を解き明かす
+【案2】国際比較型 — 他国の事例と比較して日本の状況を立体的に見せる
+【案3】逆説・発見型 — 「一見〜だが、実は〜」という意外な構造を提示する
+
+■ 選定されたトピック:
+{topics_context}
+
+■ 重要な指示（必ず守ること）:
+- 「ニュースの感想」ではなく「仕組み・構造の解説」として書くこと
+- 冒頭は「〜を整理してみましょう」「〜の構造はこうなっています」等の解説導入で始める
+- 具体的な数字は必ず比較セットで使う（「Aは○％なのに、Bは△％」）
+- 「なぜそうなるのか」のメカニズムを必ず解説すること
+- 他国の具体的な国名・人名・制度名を入れること
+- 締めは主張ではなく、示唆・問いかけで余韻を残すこと
+- 「最新のWeb検索結果」の情報を必ず参照し、事実に基づいた正確な記述にすること
+- 現在の米国大統領はドナルド・トランプ（第2期、2025年1月就任）です
+- 人名・政権名・数値などの事実情報は検索結果に基づき正確に記述すること
+"""
+    if extra.strip():
+        user_msg += f"\n■ 追加コンテキスト:\n{extra}\n"
+    if modify_instruction.strip():
+        user_msg += f"\n■ 修正指示（これを最優先で反映してください）:\n{modify_instruction}\n"
+    return user_msg
+
+
+def build_generation_request(user_msg, system_prompt=None, max_tokens=GENERATION_MAX_TOKENS):
+    """生成のリクエストパラメータ（ストリーミング・バッチ共通）"""
+    return {
+        "model": CLAUDE_MODEL,
+        "max_tokens": max_tokens,
+        "system": system_prompt if system_prompt is not None else build_generation_system(),
+        "messages": [{"role": "user", "content": user_msg}],
+    }
+
+
+# ──────────────────────────────────────
+# ポスト解析
+# ──────────────────────────────────────
+
+def parse_generated_posts(text):
+    posts = []
+    # 【案1】【案2】【案3】 フォーマット
+    pattern = r'【案(\d+)】'
+    parts = re.split(pattern, text)
+
+    # 1000字版/1500字版 フォーマット（互換性）
+    alt_pattern = r'【(1000字版|1500字版|ショート|ミドル|ロング)】'
+    alt_parts = re.split(alt_pattern, text)
+
+    if len(parts) >= 3:
+        # 【案1】【案2】【案3】 フォーマット
+        for i in range(1, len(parts), 2):
+            number = int(parts[i])
+            content = parts[i + 1].strip() if i + 1 < len(parts) else ""
+            lines = content.split("\n")
+            title_line = lines[0].strip() if lines else ""
+
+            # 本文抽出（メタデータ行を除外）
+            body_lines = []
+            meta_started = False
+            for line in lines:
+                s = line.strip()
+                if any(s.startswith(p) or s.startswith(f"**{p}") for p in ["文字数", "投稿タイミング", "品質スコア", "---"]):
+                    meta_started = True
+                if s.startswith("| チェック") or s.startswith("|----"):
+                    meta_started = True
+                if not meta_started and s and s != title_line and not s.startswith("（想定する"):
+                    body_lines.append(line)
+            body = "\n".join(body_lines).strip()
+
+            score_match = re.search(r'品質スコア[：:]\s*\*{0,2}(\d+)\s*/\s*100', content)
+            score = score_match.group(1) if score_match else ""
+
+            posts.append({
+                "number": number, "raw": content, "title": title_line,
+                "body": body, "score": score, "emotion": "", "hook": "", "timing": ""
+            })
+    elif len(alt_parts) >= 3:
+        # 互換フォーマット
+        label_map = {"1000字版": ("📝", 1), "1500字版": ("📖", 2), "ショート": ("📱", 1), "ミドル": ("📝", 2), "ロング": ("📖", 3)}
+        for i in range(1, len(alt_parts), 2):
+            label = alt_parts[i]
+            content = alt_parts[i + 1].strip() if i + 1 < len(alt_parts) else ""
+            emoji, num = label_map.get(label, ("", i))
+            lines = content.split("\n")
+            title_line = lines[0].strip() if lines else ""
+            body_lines = []
+            meta_started = False
+            for line in lines:
+                s = line.strip()
+                if any(s.startswith(p) or s.startswith(f"**{p}") for p in ["文字数", "品質スコア", "---"]):
+                    meta_started = True
+                if not meta_started and s and s != title_line:
+                    body_lines.append(line)
+            body = "\n".join(body_lines).strip()
+            score_match = re.search(r'品質スコア[：:]\s*\*{0,2}(\d+)', content)
+            score = score_match.group(1) if score_match else ""
+            posts.append({"number": num, "raw": content, "title": f"{emoji} {label}",
+                          "body": body, "score": score, "emotion": "", "hook": label, "timing": ""})
+    else:
+        # フォールバック: そのまま表示
+        posts.append({"number": 1, "raw": text, "title": "", "body": text,
+                       "score": "", "emotion": "", "hook": "", "timing": ""})
+    return posts
+
+
+class PostStreamParser:
+    """ストリーミング中のテキストから、書き終わった案を順に取り出すパーサー
+
+    【案N】/【ショート】等の見出しが次に現れた時点で、その直前の案は書き終わったとみなす。
+    最後の案はストリーム終了時（finish）に確定する。
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._emitted = set()
+
+    def _take(self, posts):
+        new = [p for p in posts if p["number"] not in self._emitted]
+        self._emitted.update(p["number"] for p in new)
+        return new
+
+    def feed(self, chunk):
+        """チャンクを追加し、新たに書き終わった案のリストを返す"""
+        self.text += chunk
+        # 見出しは「】」で閉じるので、それを含むチャンクのときだけ再解析する
+        if "】" not in chunk:
+            return []
+        return self._take(parse_generated_posts(self.text)[:-1])
+
+    def finish(self, text=None):
+        """ストリーム終了時に残りの案（最後の案を含む）を返す"""
+        if text is not None:
+            self.text = text
+        return self._take(parse_generated_posts(self.text))
+
+# ──────────────────────────────────────
+# Web検索（トピックの最新情報収集）
+# ──────────────────────────────────────
+
+def search_topic_facts(topic_title, max_results=5):
+    """Google News RSSとフリーの検索APIでトピックの最新ファクトを収集"""
+    # Google News RSSの最新記事 ＋ DuckDuckGo の補足
+    return _news_facts(_search_google_news(topic_title, max_results)) + _search_duckduckgo(topic_title)
+
+
+def _search_duckduckgo(topic_title):
+    """DuckDuckGo Instant Answer API から要約・関連トピックをファクト行で取得（補足）"""
+    facts = []
+    try:
+        ddg_url = f"https://api.duckduckgo.com/?q={urllib.parse.quote(topic_title)}&format=json&no_html=1&skip_disambig=1"
+        req = urllib.request.Request(ddg_url, headers={
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+        })
+        resp = urllib.request.urlopen(req, timeout=5)
+        data = json.loads(resp.read().decode("utf-8"))
+        # AbstractTextから要約を取得
+        abstract = data.get("AbstractText", "")
+        if abstract and len(abstract) > 20:
+            facts.append(f"[参考] {abstract[:200]}")
+        # RelatedTopicsからも取得
+        for rt in data.get("RelatedTopics", [])[:3]:
+            text = rt.get("Text", "")
+            if text and len(text) > 15:
+                facts.append(f"[関連] {text[:150]}")
+    except Exception:
+        pass
+
+    return facts
+
+
+def clean_topic_title(title):
+    """トピック名からポスト数の情報を除去"""
+    return re.sub(r'\s*\(\d[\d,]*件のポスト\)', '', title or "").strip()
+
+
+class TopicFactStore:
+    """1回のトレンド取得〜生成で共有するトピックごとの検索結果
+
+    以前は STEP 1 の関連ニュース（タイトル先頭20文字で検索）と生成時の最新情報検索
+    （タイトル全体で検索）が同じ Google News 検索を別々に呼んでいた。ここでトピックごとに
+    1回だけ検索し、関連ニュースの表示とファクトの両方をその結果から作る。
+    ワーカースレッド（先読み生成）からも読むのでスレッドセーフにしてある。
+    """
+
+    NEWS_PER_TOPIC = 5  # ファクト用に5件、関連ニュースの表示はそのうち先頭3件
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._news = {}  # 正規化タイトル → 記事リスト
+        self._extra = {}  # 正規化タイトル → DuckDuckGo の補足ファクト
+
+    def news(self, title):
+        """トピックの Google News 記事（初回のみ検索。全体で見つからなければ先頭20文字で検索し直す）"""
+        key = clean_topic_title(title)
+        with self._lock:
+            if key in self._news:
+                return self._news[key]
+        articles = _search_google_news(key, self.NEWS_PER_TOPIC) if key else []
+        if not articles and len(key) > 20:
+            articles = _search_google_news(key[:20], self.NEWS_PER_TOPIC)
+        with self._lock:
+            return self._news.setdefault(key, articles)
+
+    def related_news(self, title, max_results=3):
+        """STEP 1 の関連ニュース表示用"""
+        return self.news(title)[:max_results]
+
+    def facts(self, title):
+        """生成・ファクトチェック用のファクト行（search_topic_facts と同じ形）"""
+        key = clean_topic_title(title)
+        lines = _news_facts(self.news(key))
+        with self._lock:
+            extra = self._extra.get(key)
+        if extra is None:
+            extra = _search_duckduckgo(key) if key else []
+            with self._lock:
+                extra = self._extra.setdefault(key, extra)
+        return lines + extra
+
+
+def search_facts_for_topics(selected_topics, progress=None, store=None):
+    """選択されたトピック群に対して最新情報を検索
+
+    store: STEP 1 で作った TopicFactStore（あれば関連ニュース取得時の検索結果を使い回す）
+    """
+    all_facts = {}
+    for i, topic in enumerate(selected_topics):
+        title = topic if isinstance(topic, str) else topic.get("title", "")
+        clean_title = clean_topic_title(title)
+        if not clean_title:
+            continue
+        if progress:
+            progress.info(f"🔍 最新情報を検索中 [{i+1}/{len(selected_topics)}]: {clean_title[:30]}...")
+        facts = store.facts(clean_title) if store is not None else search_topic_facts(clean_title)
+        if facts:
+            all_facts[clean_title] = facts
+    return all_facts
+
+def factcheck_context(fact_index, post_body):
+    """1案分のファクトチェック・自動修正に渡す検索結果（関連の高い行だけを予算内で）
+
+    fact_index: 全トピックの検索結果から作った fact_search.FactIndex（生成1回につき1つ）
+    """
+    return token_budget.trim_lines(fact_index.top_text(post_body), FACTCHECK_CONTEXT_BUDGET)
+
+def join_topic_facts(topic_facts):
+    """トピックごとの検索結果を、ファクトチェック・自動修正に渡す1つのテキストにまとめる"""
+    all_search_text = ""
+    for facts_list in topic_facts.values():
+        all_search_text += "\n".join(facts_list) + "\n"
+    return all_search_text
+
+
+# ──────────────────────────────────────
+# ファクトチェックエージェント
+# ──────────────────────────────────────
+
+FACTCHECK_SYSTEM_PROMPT = """あなたは事実確認の専門家です。
+Xに投稿するポスト原稿を受け取り、以下の観点でチェックしてください。
+
+■ チェック観点:
+1. 事実誤認: 数字・人名・政策名・日付・政権名など、明確な事実の誤りがないか
+2. 時制の誤り: 過去の出来事を現在形で書いていないか、現在の状況を過去形で書いていないか
+3. ミスリード: 正確だが文脈を省略することで誤解を生む表現がないか
+4. 偏り・バイアス: 一方的な見方になっていないか
+
+■ 出力:
+結果は report_factcheck ツールで提出してください。
+- verdict: 全体の判定（ok = ✅ 問題なし / warning = ⚠️ 要確認あり / error = ❌ 誤りあり）
+- findings: 具体的な指摘（なければ空の配列）
+  - span: 原稿中の該当テキスト。原稿から一字一句そのままコピーし、原稿中で1箇所に特定できる長さにする
+  - problem: 具体的に何が問題か
+  - correct_info: 検索結果に基づく正確な情報
+  - replacement: span をそのまま置き換える修正後のテキスト（前後の文とつながる形で。書き換え方を決められない場合は空文字）
+  - severity: この指摘の重さ（error = 明確な誤り / warning = 要確認）
+
+■ 重要ルール:
+- 「提供された検索結果」にある情報を根拠にすること
+- 根拠がない推測は避け、判断できない場合は「確認推奨」と明記すること
+- 明確な誤り以外は過度に指摘しないこと（些末な表現の好みは指摘しない）
+"""
+
+FACTCHECK_TOOL = {
+    "name": "report_factcheck",
+    "description": "ポスト原稿のファクトチェック結果を提出する",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "verdict": {"type": "string", "enum": ["ok", "warning", "error"]},
+            "findings": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "span": {"type": "string"},
+                        "problem": {"type": "string"},
+                        "correct_info": {"type": "string"},
+                        "replacement": {"type": "string"},
+                        "severity": {"type": "string", "enum": ["warning", "error"]},
+                    },
+                    "required": ["span", "problem", "correct_info", "replacement", "severity"],
+                },
+            },
+        },
+        "required": ["verdict", "findings"],
+    },
+}
+FACTCHECK_VERDICTS = {"ok": "✅", "warning": "⚠️", "error": "❌"}
+VERDICT_LABELS = {"✅": "✅ 問題なし", "⚠️": "⚠️ 要確認あり", "❌": "❌ 誤りあり"}
+# 指摘ごとの重さ（全体判定の絵文字と混ざらないよう、本文には言葉で書く）
+FINDING_SEVERITIES = {"warning": "要確認", "error": "誤り"}
+
+
+def _factcheck_tool_params():
+    return {"tools": [FACTCHECK_TOOL], "tool_choice": {"type": "tool", "name": FACTCHECK_TOOL["name"]}}
+
+
+def render_factcheck(verdict, findings):
+    """構造化されたファクトチェック結果を、画面・履歴・キャッシュ共通のテキストにする
+
+    各指摘は parse_factcheck_findings で span / replacement を取り出せる形で書く。
+    """
+    lines = [VERDICT_LABELS[FACTCHECK_VERDICTS.get(verdict, "⚠️")], ""]
+    if not findings:
+        lines.append("具体的な指摘事項はありません。")
+        return "\n".join(lines)
+    lines.append("---")
+    for n, f in enumerate(findings, 1):
+        lines += [
+            f"【指摘{n}】",
+            f"- 該当箇所: 「{f.get('span', '')}」",
+            f"- 問題: {f.get('problem', '')}",
+            f"- 正しい情報: {f.get('correct_info', '')}",
+            f"- 修正案: 「{f.get('replacement', '')}」" if f.get("replacement") else "- 修正案: （要確認・書き換え案なし）",
+            f"- 重さ: {FINDING_SEVERITIES.get(f.get('severity'), FINDING_SEVERITIES['error' if verdict == 'error' else 'warning'])}",
+            "",
+        ]
+    lines.append("---")
+    return "\n".join(lines)
+
+
+def extract_factcheck_text(message):
+    """ファクトチェックのレスポンスから結果テキストを取り出す（ツール入力が無ければ本文をそのまま使う）"""
+    for block in message.content:
+        if block.type == "tool_use" and block.name == FACTCHECK_TOOL["name"]:
+            return render_factcheck(block.input.get("verdict", "warning"), block.input.get("findings", []))
+    return "".join(block.text for block in message.content if block.type == "text")
+
+
+def build_factcheck_request(post_body, search_results_text=""):
+    """ファクトチェックのリクエストパラメータ（検索結果は呼び出し側で予算内に切り詰めておく）"""
+    user_msg = f"""以下のXポスト原稿をファクトチェックしてください。
+
+■ ポスト原稿:
+{post_body}
+
+■ 検索で得られた最新情報（参考にしてください）:
+{search_results_text if search_results_text else "（検索結果なし — あなたの知識のみで判断してください）"}
+
+■ 現在の日付: {datetime.now(JST).strftime('%Y年%m月%d日')}
+※ 現在のアメリカ大統領はドナルド・トランプ（第2期、2025年1月就任）です。
+"""
+    return {
+        "model": CLAUDE_MODEL,
+        "max_tokens": FACTCHECK_MAX_TOKENS,
+        "system": FACTCHECK_SYSTEM_PROMPT,
+        **_factcheck_tool_params(),
+        "messages": [{"role": "user", "content": user_msg}],
+    }
+
+
+def needs_auto_fix(fc_text):
+    """⚠️ 要確認あり or ❌ 誤りあり の場合のみ修正対象"""
+    return bool(fc_text) and ("⚠️" in fc_text or "❌" in fc_text)
+
+
+# ── 差分ファクトチェック（修正で変わった文だけを確認して、前回の判定とマージ） ──
+
+DIFF_FACTCHECK_MAX_RATIO = 0.5  # 変わった文がこれを超える割合なら全文をチェックする
+DIFF_FACTCHECK_CONTEXT = 1  # 変わった文の前後に添える文の数
+
+
+def factcheck_verdict(fc_text):
+    """ファクトチェック結果の全体判定（"❌" / "⚠️" / "✅"）"""
+    if not fc_text:
+        return "✅"
+    if "❌" in fc_text:
+        return "❌"
+    return "⚠️" if "⚠️" in fc_text else "✅"
+
+
+def parse_factcheck_findings(fc_text):
+    """ファクトチェック結果の【指摘N】ブロックを
+    [{"span": 該当箇所, "replacement": 修正案, "severity": "❌" / "⚠️", "text": 指摘本文}] に分解
+
+    replacement は「」で囲まれた置き換えテキストが無ければ None（ローカルでは直せない指摘）。
+    severity は「重さ」の行が無い古い結果では "⚠️"（要確認として扱う）。
+    """
+    findings = []
+    for block in re.split(r"【指摘\d+】", fc_text or "")[1:]:
+        block = block.split("\n---")[0].strip()
+        span = re.search(r"該当箇所[:：]\s*「(.+?)」\s*$", block, re.M)
+        replacement = re.search(r"修正案[:：]\s*「(.*)」\s*$", block, re.M)
+        severity = re.search(r"重さ[:：]\s*(\S+)\s*$", block, re.M)
+        findings.append({
+            "span": span.group(1) if span else "",
+            "replacement": replacement.group(1) if replacement else None,
+            "severity": "❌" if severity and severity.group(1) == FINDING_SEVERITIES["error"] else "⚠️",
+            "text": block,
+        })
+    return findings
+
+
+def apply_factcheck_patches(post_body, fc_text):
+    """指摘の該当箇所だけを修正案で置き換えた本文を返す（Claude を呼ばないローカル修正）
+
+    全ての指摘に置き換えテキストがあり、該当箇所が本文中にちょうど1回・互いに重ならずに
+    見つかる場合のみ適用する。1つでも当てはまらなければ None（全文の書き直しにフォールバック）。
+    """
+    findings = parse_factcheck_findings(fc_text)
+    if not findings:
+        return None
+    edits = []
+    for f in findings:
+        if not f["span"] or f["replacement"] is None or post_body.count(f["span"]) != 1:
+            return None
+        start = post_body.index(f["span"])
+        edits.append((start, start + len(f["span"]), f["replacement"]))
+    edits.sort()
+    if any(prev[1] > cur[0] for prev, cur in zip(edits, edits[1:])):
+        return None
+    for start, end, replacement in reversed(edits):
+        post_body = post_body[:start] + replacement + post_body[end:]
+    return post_body
+
+
+def split_sentences(text):
+    """本文を文単位に分割（句点・感嘆符・疑問符・改行で区切り、区切り文字は文に含める）"""
+    sentences = re.findall(r"[^。！？!?\n]+[。！？!?]*|[。！？!?]+", text or "")
+    return [s.strip() for s in sentences if s.strip()]
+
+
+def changed_sentence_indices(old_body, new_body):
+    """新しい本文のうち、前の本文から追加・変更された文の番号"""
+    old, new = split_sentences(old_body), split_sentences(new_body)
+    changed = []
+    for op, _, _, j1, j2 in difflib.SequenceMatcher(a=old, b=new, autojunk=False).get_opcodes():
+        if op in ("replace", "insert"):
+            changed.extend(range(j1, j2))
+    return changed
+
+
+def diff_focus_text(new_body, changed, context=DIFF_FACTCHECK_CONTEXT):
+    """変わった文を【確認対象】、前後の文を（文脈）として並べたテキスト"""
+    sentences = split_sentences(new_body)
+    targets = set(changed)
+    shown = sorted({k for i in changed for k in range(i - context, i + context + 1) if 0 <= k < len(sentences)})
+    lines, last = [], None
+    for k in shown:
+        if last is not None and k != last + 1:
+            lines.append("……")
+        lines.append(f"【確認対象】{sentences[k]}" if k in targets else f"（文脈）{sentences[k]}")
+        last = k
+    return "\n".join(lines)
+
+
+def build_diff_factcheck_request(focus_text, changed_count, search_results_text=""):
+    """一部の文（修正で変わった文・未確認の文）だけのファクトチェックのリクエストパラメータ（出力も件数に応じて小さくする）"""
+    user_msg = f"""以下はXポスト原稿のうち、まだ確認されていない文の抜粋です。
+【確認対象】の文だけをファクトチェックしてください。（文脈）の文は確認済みなので指摘しないでください。
+
+■ 抜粋:
+{focus_text}
+
+■ 検索で得られた最新情報（参考にしてください）:
+{search_results_text if search_results_text else "（検索結果なし — あなたの知識のみで判断してください）"}
+
+■ 現在の日付: {datetime.now(JST).strftime('%Y年%m月%d日')}
+※ 現在のアメリカ大統領はドナルド・トランプ（第2期、2025年1月就任）です。
+"""
+    return {
+        "model": CLAUDE_MODEL,
+        "max_tokens": token_budget.max_tokens_for(200, count=changed_count, extra_chars=200),
+        "system": FACTCHECK_SYSTEM_PROMPT,
+        **_factcheck_tool_params(),
+        "messages": [{"role": "user", "content": user_msg}],
+    }
+
+
+def merge_factcheck_results(prev_fc, diff_fc, new_body, changed):
+    """前回の判定（変わっていない文への指摘）と差分チェックの判定を1つの結果にまとめる"""
+    sentences = split_sentences(new_body)
+    # 文をまたいだ偶然の一致を拾わないよう、変わっていない文ごとに照合する
+    unchanged = [s for i, s in enumerate(sentences) if i not in set(changed)]
+    kept = [f for f in parse_factcheck_findings(prev_fc)
+            if f["span"] and any(f["span"] in s for s in unchanged)]
+    findings = kept + parse_factcheck_findings(diff_fc)
+
+    # 全体判定は引き継いだ指摘の重さと差分チェックの判定から決める（前回の全体判定は引き継がない）
+    order = ["✅", "⚠️", "❌"]
+    verdict = max([factcheck_verdict(diff_fc)] + [f["severity"] for f in kept], key=order.index)
+    lines = [VERDICT_LABELS[verdict], "",
+             f"（修正で変わった{len(changed)}文のみ再チェックし、変わっていない文への指摘は前回から引き継ぎました）"]
+    if findings:
+        lines.append("---")
+        for n, f in enumerate(findings, 1):
+            lines += [f"【指摘{n}】", f["text"], ""]
+        lines.append("---")
+    else:
+        lines.append("具体的な指摘事項はありません。")
+    return "\n".join(lines)
+
+
+def build_auto_fix_request(post_body, fc_text, search_text, system_prompt):
+    """ファクトチェック指摘に基づく自動修正のリクエストパラメータ"""
+    fix_msg = f"""以下のXポストに対してファクトチェックで指摘がありました。
+指摘内容に基づいて、事実関係を修正した改善版を生成してください。
+
+■ 元のポスト:
+{post_body}
+
+■ ファクトチェックの指摘:
+{fc_text}
+
+■ 参考情報（最新の検索結果）:
+{search_text if search_text else '（なし）'}
+
+■ ルール:
+- ファクトチェックで指摘された箇所のみ修正する（全体の構成やトーンは維持）
+- すあし社長の「解説型」トーンを維持する
+- 不確実な情報には「〜と言われている」「〜の可能性がある」と留保をつける
+- 修正後のポストのみを出力する（タイトルや説明は不要）
+- マークダウン記法は使わない
+- 600〜800文字を目安にする
+"""
+    return {
+        "model": CLAUDE_MODEL,
+        "max_tokens": rewrite_max_tokens(post_body),
+        "system": system_prompt if isinstance(system_prompt, (str, list)) else "",
+        "messages": [{"role": "user", "content": fix_msg}],
+    }
+
+
+# ──────────────────────────────────────
+# 修正セッション（同じ案への連続した修正で文脈を使い回す）
+# ──────────────────────────────────────
+
+REVISION_RULES = """■ ルール:
+- 修正指示に忠実に従ってください
+- すあし社長の「解説型」トーンを維持してください（仕組みの解説 → 数字の比較 → メカニズムの解明 → 他国比較 → 示唆で締め）
+- 修正後のポストのみを出力してください（タイトルや案番号は不要）
+- 600〜800文字を目安にしてください
+- マークダウン記法は使わないでください（太字、見出し、リスト等は禁止）
+- 検索結果の情報を参照し、数字や事実を正確に記述してください
+"""
+
+
+class RevisionSession:
+    """1つの案に対する修正の連鎖で共有する文脈
+
+    初回の修正で一度だけ検索し、検索結果・ルールを固定のプロンプト先頭（cache_control 付き）にまとめる。
+    2回目以降の修正は検索をせず、同じ先頭部分をプロンプトキャッシュから読ませる。
+    ファクトチェックで問題なしと確認できた文を覚えておき、確認済みの文だけで構成された本文
+    （「もう少し短く」で文を削っただけの場合など）は再チェックしない。
+    """
+
+    def __init__(self, original_post, progress=None):
+        self.post_number = original_post["number"]
+        self.system_prompt = build_generation_system()
+        if progress:
+            progress.info("🔍 修正に必要な最新情報を検索中...")
+        search_keywords = original_post["body"][:150].replace("\n", " ")
+        search_facts = search_topic_facts(search_keywords, max_results=5)
+        self.search_text = token_budget.trim_lines("\n".join(search_facts), FACTCHECK_CONTEXT_BUDGET) if search_facts else ""
+        search_section = f"■ 最新のWeb検索結果（正確な記述の参考にすること）:\n{self.search_text}\n\n" if self.search_text else ""
+        self.prefix = f"以下のXポストを、修正指示に従って修正してください。\n\n{search_section}{REVISION_RULES}"
+        self.verified_sentences = set()
+        self.fc_text = None  # 直近のファクトチェック結果
+        self.checked_body = None  # fc_text の対象になった本文
+
+    def build_messages(self, current_body, instruction):
+        """修正依頼のメッセージ（固定の先頭部分＋今回の本文・指示）"""
+        findings = ""
+        if needs_auto_fix(self.fc_text):
+            findings = f"\n■ 前回のファクトチェックの指摘（同じ誤りを書かないこと）:\n{self.fc_text}\n"
+        return [{"role": "user", "content": [
+            {"type": "text", "text": self.prefix, "cache_control": {"type": "ephemeral"}},
+            {"type": "text", "text": f"■ 元のポスト（案{self.post_number}）:\n{current_body}\n\n■ 修正指示:\n{instruction}\n{findings}"},
+        ]}]
+
+    def is_verified(self, body):
+        """本文の全ての文が、以前のファクトチェックで問題なしと確認済みか"""
+        sentences = split_sentences(body)
+        return bool(sentences) and all(s in self.verified_sentences for s in sentences)
+
+    def diff_plan(self, body):
+        """差分チェックで済むなら変わった文の番号を返す（前回の結果が無い・変更が多いなら None＝全文チェック）"""
+        if not self.fc_text or not self.checked_body:
+            return None
+        changed = changed_sentence_indices(self.checked_body, body)
+        if not changed or len(changed) > len(split_sentences(body)) * DIFF_FACTCHECK_MAX_RATIO:
+            return None
+        return changed
+
+    def record_factcheck(self, body, fc_text, changed=None, diff_fc=None):
+        """ファクトチェック結果を記録（問題なしと確認できた文を確認済みにする）
+
+        差分チェックの場合は changed（変わった文の番号）と diff_fc（差分チェック自体の結果）も渡す。
+        """
+        if fc_text is None:
+            return
+        self.fc_text = fc_text
+        self.checked_body = body
+        sentences = split_sentences(body)
+        if not needs_auto_fix(fc_text):
+            self.verified_sentences.update(sentences)
+        elif changed is not None and not needs_auto_fix(diff_fc):
+            self.verified_sentences.update(sentences[i] for i in changed)
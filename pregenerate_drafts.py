@@ -0,0 +1,259 @@
+"""
+夜間バッチ: 最新のトレンドからおすすめトピックを選び、ポスト案を事前生成して履歴に保存
+
+対話UIと同じプロンプト（post_pipeline）を使い、重い生成・ファクトチェックは
+Message Batches API（通常料金の半額・非同期）で処理する。朝には履歴タブに下書きが並ぶ。
+
+流れ:
+  1. x_trends_cache.json（最新スナップショット）＋ Google News からトピック選定
+  2. 相性度の高い上位N件について関連ニュース・Web検索 → 生成（1トピック3案）
+  3. 全案をファクトチェック → ⚠️/❌ の案は自動修正（該当箇所の置き換えで済めばバッチを使わずに直す）
+  4. 1トピック1件として history/ に保存（mode="batch"）
+
+使い方:
+  python pregenerate_drafts.py              # 上位3トピック
+  python pregenerate_drafts.py --no-news    # Google Newsを使わずXトレンドのみから選定
+
+環境変数:
+  ANTHROPIC_API_KEY      APIキー（.env から読み込み）
+  ANTHROPIC_BASE_URL     APIの接続先（ローカルのスタブサーバーで試すときに指定）
+  PREGENERATE_TOP_N      事前生成するトピック数（既定 3）
+  BATCH_POLL_SECONDS     バッチ完了の確認間隔（既定 60秒）
+  BATCH_MAX_WAIT_HOURS   バッチ完了を待つ上限（既定 24時間）
+  PIPELINE_PROFILE       段階ごとのモデル・ON/OFF（fast / standard / thorough、既定 standard）
+"""
+
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import anthropic
+from dotenv import load_dotenv
+
+# Windows cp932 でエモジが出力できない問題を回避
+try:
+    sys.stdout.reconfigure(encoding="utf-8", errors="replace")
+    sys.stderr.reconfigure(encoding="utf-8", errors="replace")
+except Exception:
+    pass
+
+import claim_grounding
+import claim_store
+import fact_search
+import token_budget
+from post_pipeline import (
+    BATCH_PRICE_FACTOR, PIPELINE_PROFILES, DEFAULT_PROFILE,
+    stage_config, apply_stage, claim_prepass_enabled, record_run, log_usage, save_history,
+    fetch_google_news, TopicFactStore, search_facts_for_topics, join_topic_facts, factcheck_context,
+    build_recommend_request, extract_recommendations, build_generation_system,
+    build_trend_generation_message, build_generation_request, parse_generated_posts,
+    build_factcheck_request, extract_factcheck_text, needs_auto_fix, apply_factcheck_patches,
+    build_auto_fix_request,
+)
+
+SCRIPT_DIR = Path(__file__).parent
+CACHE_FILE = SCRIPT_DIR / "x_trends_cache.json"
+
+TOP_N = token_budget.budget_from_env("PREGENERATE_TOP_N", 3)
+POLL_SECONDS = token_budget.budget_from_env("BATCH_POLL_SECONDS", 60)
+MAX_WAIT_HOURS = token_budget.budget_from_env("BATCH_MAX_WAIT_HOURS", 24)
+PROFILE = os.environ.get("PIPELINE_PROFILE", DEFAULT_PROFILE)
+if PROFILE not in PIPELINE_PROFILES:
+    PROFILE = DEFAULT_PROFILE
+
+
+def load_latest_trends():
+    """同期済みのXトレンドキャッシュ（最新スナップショット）を読み込む"""
+    try:
+        with open(CACHE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f).get("trends", [])
+    except Exception as e:
+        print(f"⚠️ トレンドキャッシュを読み込めません: {e}")
+        return []
+
+
+def run_batch(client, stage, requests):
+    """リクエスト群をバッチで投入し、完了まで待って custom_id → Message を返す
+
+    Args:
+        stage: パイプラインの段階名（プロファイルでOFFなら何もしない）
+        requests: {custom_id: messages.create と同じパラメータ}（モデル・max_tokens はプロファイルで差し替える）
+    """
+    if not requests or not stage_config(PROFILE, stage)["enabled"]:
+        return {}
+    requests = {cid: apply_stage(params, PROFILE, stage) for cid, params in requests.items()}
+    batch = client.messages.batches.create(
+        requests=[{"custom_id": cid, "params": params} for cid, params in requests.items()],
+    )
+    print(f"   📦 {stage}: {len(requests)}件を投入（batch {batch.id}）")
+
+    deadline = time.time() + MAX_WAIT_HOURS * 3600
+    while batch.processing_status != "ended":
+        if time.time() > deadline:
+            client.messages.batches.cancel(batch.id)
+            raise TimeoutError(f"{stage} バッチが {MAX_WAIT_HOURS} 時間以内に終わりませんでした")
+        time.sleep(POLL_SECONDS)
+        batch = client.messages.batches.retrieve(batch.id)
+
+    messages = {}
+    for entry in client.messages.batches.results(batch.id):
+        if entry.result.type == "succeeded":
+            message = entry.result.message
+            messages[entry.custom_id] = message
+            log_usage(f"batch_{stage}", message, requests[entry.custom_id]["max_tokens"],
+                      profile=PROFILE, price_factor=BATCH_PRICE_FACTOR)
+        else:
+            print(f"   ⚠️ {entry.custom_id}: {entry.result.type}")
+    print(f"   ✅ {stage}: {len(messages)}/{len(requests)}件完了")
+    return messages
+
+
+def _text(message):
+    return "".join(block.text for block in message.content if block.type == "text").strip()
+
+
+def main():
+    print("=" * 50)
+    print("🌙 ポスト案 夜間事前生成")
+    print("=" * 50)
+    print(f"プロファイル: {PIPELINE_PROFILES[PROFILE]['label']}")
+    started = time.time()
+
+    load_dotenv(SCRIPT_DIR / ".env", override=True)
+    api_key = os.environ.get("ANTHROPIC_API_KEY", "")
+    if not api_key:
+        print("❌ ANTHROPIC_API_KEY が設定されていません")
+        sys.exit(1)
+    client = anthropic.Anthropic(api_key=api_key, base_url=os.environ.get("ANTHROPIC_BASE_URL") or None)
+
+    # ── 1. トピック選定（対話UIと同じ選定プロンプト） ──
+    news_items = load_latest_trends()
+    if "--no-news" not in sys.argv:
+        news_items += fetch_google_news()
+    if not news_items:
+        print("\n⚠️ 選定対象のトレンドがありません")
+        sys.exit(1)
+    print(f"\n🤖 {len(news_items)}件からトピックを選定中...")
+    selected = run_batch(client, "recommend", {"recommend": build_recommend_request(news_items)})
+    recommendations = extract_recommendations(selected["recommend"]) if selected else []
+    topics = sorted(recommendations, key=lambda r: r.get("score", 0), reverse=True)[:TOP_N]
+    if not topics:
+        print("\n⚠️ おすすめトピックがありませんでした")
+        sys.exit(1)
+    for t in topics:
+        print(f"   🔥 {t['title']}（相性度 {t.get('score', 0)}）")
+
+    # ── 2. 関連情報の収集 → 生成 ──
+    print("\n🔍 関連ニュース・最新情報を収集中...")
+    system_prompt = build_generation_system()
+    jobs = []
+    fact_store = TopicFactStore()  # 関連ニュースとファクトで同じ検索結果を使う（1トピック1回）
+    for t in topics:
+        related = {t["title"]: fact_store.related_news(t.get("title", ""))}
+        topic_facts = search_facts_for_topics([t], store=fact_store)
+        user_msg = build_trend_generation_message([t], related, topic_facts)
+        jobs.append({
+            "topic": t,
+            "request": build_generation_request(user_msg, system_prompt),
+            "fact_index": fact_search.FactIndex(join_topic_facts(topic_facts)),
+        })
+
+    print("\n🤖 ポストを生成中...")
+    generated = run_batch(client, "generate", {f"gen-{i}": job["request"] for i, job in enumerate(jobs)})
+    for i, job in enumerate(jobs):
+        message = generated.get(f"gen-{i}")
+        job["result"] = _text(message) if message else ""
+        job["posts"] = parse_generated_posts(job["result"]) if job["result"] else []
+
+    # ── 3. ファクトチェック → 要確認なら自動修正 ──
+    print("\n🔍 ファクトチェック中...")
+    fc_requests, grounded = {}, {}
+    for i, job in enumerate(jobs):
+        job["search_texts"] = {}
+        for post in job["posts"]:
+            if not post.get("body"):
+                continue
+            cid = f"fc-{i}-{post['number']}"
+            # 案ごとに関連の高い検索結果だけを使う（FC・自動修正・照合で共通）
+            search_text = job["search_texts"][post["number"]] = factcheck_context(job["fact_index"], post["body"])
+            index = claim_grounding.ClaimIndex(search_text) if claim_prepass_enabled(PROFILE) else None
+            # 数字・固有名詞が全て検索結果で確認できた案はバッチに入れない（暫定 ✅）
+            if index is not None:
+                try:
+                    verified = claim_store.verified_sentences(post["body"])
+                except Exception as e:
+                    print(f"   ⚠️ 確認済みの文を読み込めません（照合は続行）: {e}")
+                    verified = set()
+                grounding = claim_grounding.ground_post(post["body"], index, verified)
+                claim_grounding.record_prepass(grounding["passed"])
+                if grounding["passed"]:
+                    grounded[cid] = claim_grounding.provisional_factcheck_text(grounding)
+                    continue
+            fc_requests[cid] = build_factcheck_request(post["body"], search_text)
+    if grounded:
+        summary = claim_grounding.prepass_summary()
+        print(f"   🧮 ローカル照合: {summary['passed']}/{summary['checked']}案が通過（{summary['pass_rate']:.0%}）")
+    checked = run_batch(client, "factcheck", fc_requests)
+
+    fix_requests = {}
+    for i, job in enumerate(jobs):
+        job["factcheck"], job["auto_fixed"] = {}, {}
+        for post in job["posts"]:
+            cid = f"fc-{i}-{post['number']}"
+            if cid in grounded:
+                job["factcheck"][post["number"]] = grounded[cid]
+                continue
+            message = checked.get(cid)
+            if not message:
+                continue
+            fc_text = extract_factcheck_text(message).strip()
+            job["factcheck"][post["number"]] = fc_text
+            search_text = job["search_texts"][post["number"]]
+            try:
+                claim_store.record_factcheck(post["body"], fc_text, claim_grounding.ClaimIndex(search_text), message.model)
+            except Exception as e:
+                print(f"   ⚠️ 確認済みの主張の保存に失敗（事前生成は続行）: {e}")
+            if not needs_auto_fix(fc_text) or not stage_config(PROFILE, "auto_fix")["enabled"]:
+                continue
+            # 該当箇所の置き換えで済む指摘はその場で直し、残りだけ書き直しバッチに回す
+            patched = apply_factcheck_patches(post["body"], fc_text)
+            if patched is not None:
+                job["auto_fixed"][post["number"]] = {"original": post["body"], "fixed": patched, "fc_text": fc_text}
+            else:
+                fix_requests[f"fix-{i}-{post['number']}"] = build_auto_fix_request(
+                    post["body"], fc_text, search_text, system_prompt,
+                )
+    if fix_requests:
+        print("\n🔧 ファクトチェック指摘を自動修正中...")
+    fixed = run_batch(client, "auto_fix", fix_requests)
+    for i, job in enumerate(jobs):
+        for post in job["posts"]:
+            message = fixed.get(f"fix-{i}-{post['number']}")
+            if message:
+                job["auto_fixed"][post["number"]] = {
+                    "original": post["body"],
+                    "fixed": _text(message),
+                    "fc_text": job["factcheck"][post["number"]],
+                }
+
+    # ── 4. 履歴に保存 ──
+    saved = 0
+    for job in jobs:
+        if not job["result"]:
+            continue
+        t = job["topic"]
+        save_history("batch", {
+            "selected_topics": [t["title"]],
+            "angles": [t.get("angle", "")],
+            "score": t.get("score", 0),
+            "profile": PROFILE,
+        }, job["result"], extra={"factcheck": job["factcheck"], "auto_fixed": job["auto_fixed"]})
+        saved += 1
+    record_run(PROFILE, time.time() - started)
+    print(f"\n✨ 完了！ {saved}件のトピックの下書きを履歴に保存しました")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,8 @@ Windows PC用: Xニューストレンドを取得してJSONキャッシュに保
   1. Windows PCでXにログイン済みの状態で実行
   2. python sync_x_trends.py
   3. x_trends_cache.json が生成/更新される
-  4. --push オプションで自動的にGitHub にコミット＆プッシュ
+  4. --push オプションで自動的にGitHub にコミット＆プッシュ（Git Data API の1コミット）
+  5. --mirror を併せて指定すると、ローカルの AI_Workspace リポジトリにも別コミットで反映
 
 定期実行: sync_x_trends.bat をタスクスケジューラに登録すると自動化できます
 """
@@ -26,6 +27,8 @@ except Exception:
 JST = timezone(timedelta(hours=9))
 from pathlib import Path
 
+import trend_store
+
 SCRIPT_DIR = Path(__file__).parent
 CACHE_FILE = SCRIPT_DIR / "x_trends_cache.json"
 WORKER_SCRIPT = SCRIPT_DIR / "_x_worker.py"
@@ -62,9 +65,14 @@ def fetch_trends():
 
 
 def save_cache(trends):
-    """トレンドをJSONキャッシュファイルに保存"""
+    """トレンドをJSONキャッシュファイルに保存（時系列ストアにも追記して勢いを付与）"""
+    now = datetime.now(JST)
+    try:
+        trends = trend_store.record_snapshot(trends, taken_at=now)
+    except Exception as e:
+        print(f"⚠️ 時系列ストアへの記録に失敗（キャッシュ保存は続行）: {e}")
     cache_data = {
-        "updated_at": datetime.now(JST).isoformat(),
+        "updated_at": now.isoformat(),
         "count": len(trends),
         "trends": trends,
     }
@@ -73,87 +81,176 @@ def save_cache(trends):
     print(f"   更新日時: {cache_data['updated_at']}")
 
 
-def git_push():
-    """キャッシュファイルをGitHub API経由でx-post-toolリポジトリに直接プッシュ"""
-    import os
-    import base64
-    import urllib.request
+GITHUB_REPO = "Kota-kun777/x-post-tool"
+
 
-    REPO = "Kota-kun777/x-post-tool"
-    FILE_PATH = "x_trends_cache.json"
-    API_URL = f"https://api.github.com/repos/{REPO}/contents/{FILE_PATH}"
+def _github_token():
+    """GitHubトークンを取得（GITHUB_TOKEN 環境変数 → gh CLI の認証）"""
+    import os
 
-    # GitHubトークンを取得（gh CLI の認証を利用）
+    token = os.environ.get("GITHUB_TOKEN", "")
+    if token:
+        return token
     try:
         token_result = subprocess.run(
             ["gh", "auth", "token"],
             capture_output=True, text=True, timeout=10,
         )
-        token = token_result.stdout.strip()
-        if not token:
-            print("❌ GitHubトークンが取得できません。gh auth login を実行してください")
-            return
+        return token_result.stdout.strip()
     except Exception as e:
         print(f"❌ gh CLIエラー: {e}")
-        return
+        return ""
+
+
+def _github_api(method, path, token, payload=None, api_base=None):
+    """GitHub REST API を呼び出してJSONを返す"""
+    import os
+    import urllib.request
+
+    api_base = (api_base or os.environ.get("GITHUB_API_URL") or "https://api.github.com").rstrip("/")
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Accept": "application/vnd.github.v3+json",
+        "User-Agent": "x-post-tool-sync",
+    }
+    data = None
+    if payload is not None:
+        data = json.dumps(payload).encode("utf-8")
+        headers["Content-Type"] = "application/json"
+    req = urllib.request.Request(f"{api_base}{path}", data=data, method=method, headers=headers)
+    with urllib.request.urlopen(req, timeout=15) as resp:
+        return json.loads(resp.read().decode("utf-8"))
+
+
+def _remote_text(repo, path, ref, token, api_base=None):
+    """リポジトリ上のファイル内容（ref時点。無ければNone）"""
+    import base64
+    import urllib.error
+    import urllib.parse
 
     try:
-        # 1. 既存ファイルのSHAを取得（更新に必要）
-        req = urllib.request.Request(API_URL, headers={
-            "Authorization": f"Bearer {token}",
-            "Accept": "application/vnd.github.v3+json",
-            "User-Agent": "x-post-tool-sync",
-        })
-        with urllib.request.urlopen(req, timeout=10) as resp:
-            existing = json.loads(resp.read().decode("utf-8"))
-            sha = existing["sha"]
-
-        # 2. ファイル内容をBase64エンコード
-        content = CACHE_FILE.read_text(encoding="utf-8")
-        content_b64 = base64.b64encode(content.encode("utf-8")).decode("ascii")
-
-        # 3. GitHub API でファイルを更新
-        now = datetime.now(JST).strftime("%Y-%m-%d %H:%M")
-        payload = json.dumps({
-            "message": f"sync: X trends update {now}",
-            "content": content_b64,
-            "sha": sha,
-        }).encode("utf-8")
-
-        req = urllib.request.Request(API_URL, data=payload, method="PUT", headers={
-            "Authorization": f"Bearer {token}",
-            "Accept": "application/vnd.github.v3+json",
-            "Content-Type": "application/json",
-            "User-Agent": "x-post-tool-sync",
-        })
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            if resp.status == 200:
-                print("✅ x-post-tool リポジトリにプッシュしました")
-            else:
-                print(f"⚠️ レスポンス: {resp.status}")
+        data = _github_api(
+            "GET", f"/repos/{repo}/contents/{urllib.parse.quote(path)}?ref={ref}", token, api_base=api_base,
+        )
+    except urllib.error.HTTPError as e:
+        if e.code == 404:
+            return None
+        raise
+    return base64.b64decode(data.get("content", "")).decode("utf-8")
+
+
+def publish_files(files, message, token, repo=GITHUB_REPO, branch=None, api_base=None, merge=None):
+    """複数ファイルを Git Data API で1つのコミットとしてまとめて公開
+
+    ref取得 → 親コミット取得 → ツリー作成（内容はインライン） → コミット作成 → ref更新 の順に呼び出す。
+    ref更新が競合した場合（他のコミットが先に入った場合）は1回だけ作り直す。
+
+    Args:
+        files: {リポジトリ内パス: ファイル内容(str)}
+        branch: 公開先ブランチ（省略時はリポジトリのデフォルトブランチ）
+        merge: {リポジトリ内パス: 関数(リモートの内容 or None, ローカルの内容) → 公開する内容}。
+               親コミット上の内容を読み直して合流させる（作り直しのたびに最新の親で読み直す）
+    Returns:
+        str: 作成したコミットのSHA
+    """
+    import urllib.error
+
+    if not branch:
+        branch = _github_api("GET", f"/repos/{repo}", token, api_base=api_base)["default_branch"]
+
+    for attempt in range(2):
+        ref = _github_api("GET", f"/repos/{repo}/git/ref/heads/{branch}", token, api_base=api_base)
+        parent_sha = ref["object"]["sha"]
+        parent = _github_api("GET", f"/repos/{repo}/git/commits/{parent_sha}", token, api_base=api_base)
+        contents = dict(files)
+        for path, merge_fn in (merge or {}).items():
+            if path in contents:
+                contents[path] = merge_fn(_remote_text(repo, path, parent_sha, token, api_base), files[path])
+        tree = _github_api("POST", f"/repos/{repo}/git/trees", token, {
+            "base_tree": parent["tree"]["sha"],
+            "tree": [
+                {"path": path, "mode": "100644", "type": "blob", "content": content}
+                for path, content in contents.items()
+            ],
+        }, api_base=api_base)
+        commit = _github_api("POST", f"/repos/{repo}/git/commits", token, {
+            "message": message,
+            "tree": tree["sha"],
+            "parents": [parent_sha],
+        }, api_base=api_base)
+        try:
+            _github_api("PATCH", f"/repos/{repo}/git/refs/heads/{branch}", token, {
+                "sha": commit["sha"],
+                "force": False,
+            }, api_base=api_base)
+            return commit["sha"]
+        except urllib.error.HTTPError as e:
+            # 422: fast-forward できない → 最新のrefから作り直す
+            if e.code != 422 or attempt == 1:
+                raise
+    return None
+
 
+def git_push(extra_files=(), message=None, merge=None):
+    """キャッシュファイル（＋追加ファイル）を Git Data API の1コミットで x-post-tool リポジトリに公開
+
+    ローカルの git にはコミットしない（AI_Workspace への反映が必要なら mirror_to_workspace を別に呼ぶ）。
+
+    Args:
+        extra_files: キャッシュと一緒に公開するファイル（SCRIPT_DIR配下のPath）。
+                     watch_trigger.py はトリガーファイルを渡して同一コミットにする
+        message: コミットメッセージ（省略時は "sync: X trends update <日時>"）
+        merge: {ファイル名: 関数}。リモートの内容と合流させてから公開する（publish_files を参照）
+    Returns:
+        bool: x-post-tool への公開に成功したか
+    """
+    import urllib.error
+
+    paths = [CACHE_FILE, *extra_files]
+    now = datetime.now(JST).strftime("%Y-%m-%d %H:%M")
+    message = message or f"sync: X trends update {now}"
+
+    token = _github_token()
+    if not token:
+        print("❌ GitHubトークンが取得できません。gh auth login を実行してください")
+        return False
+
+    try:
+        files = {p.name: p.read_text(encoding="utf-8") for p in paths}
+        publish_files(files, message, token, merge=merge)
+        print(f"✅ x-post-tool リポジトリにプッシュしました（{len(files)}ファイル / 1コミット）")
+        return True
     except urllib.error.HTTPError as e:
         print(f"❌ GitHub APIエラー: {e.code} {e.reason}")
-        if e.code == 422:
-            print("   （内容が前回と同じ可能性があります）")
     except Exception as e:
         print(f"❌ プッシュ失敗: {e}")
+    return False
+
+
+def mirror_to_workspace(paths, message):
+    """公開したファイルをローカルの AI_Workspace リポジトリにもコミット＆プッシュ（--mirror 指定時のみ）
+
+    x-post-tool への公開とは別のコミットになるので、公開の手順には含めず明示的に呼ぶ。
+    Returns:
+        bool: 反映に成功したか（変更が無ければ何もせず True）
+    """
+    def git(*args):
+        return subprocess.run(["git", *args], cwd=SCRIPT_DIR, capture_output=True, text=True, check=True)
 
-    # AI_Workspace リポジトリにもプッシュ（ローカルgit）
     try:
-        os.chdir(SCRIPT_DIR)
-        subprocess.run(["git", "add", CACHE_FILE.name], capture_output=True, text=True)
-        diff = subprocess.run(["git", "diff", "--cached", "--name-only"], capture_output=True, text=True)
-        if diff.stdout.strip():
-            now = datetime.now(JST).strftime("%Y-%m-%d %H:%M")
-            subprocess.run(
-                ["git", "commit", "-m", f"sync: X trends update {now}"],
-                capture_output=True, text=True,
-            )
-            subprocess.run(["git", "push"], capture_output=True, text=True)
-            print("✅ AI_Workspace リポジトリにもプッシュしました")
-    except Exception:
-        pass  # AI_Workspace側は失敗しても問題ない
+        git("add", *[p.name for p in paths])
+        if not git("diff", "--cached", "--name-only").stdout.strip():
+            return True
+        git("commit", "-m", message)
+        git("push")
+    except subprocess.CalledProcessError as e:
+        print(f"⚠️ AI_Workspace への反映に失敗しました: {(e.stderr or e.stdout or '').strip() or e}")
+        return False
+    except OSError as e:
+        print(f"⚠️ AI_Workspace への反映に失敗しました: {e}")
+        return False
+    print("✅ AI_Workspace リポジトリにもプッシュしました")
+    return True
 
 
 def main():
@@ -168,10 +265,12 @@ def main():
 
     save_cache(trends)
 
-    # --push オプションでGitHubにプッシュ
+    # --push オプションでGitHubにプッシュ（--mirror でローカルの AI_Workspace にも反映）
     if "--push" in sys.argv:
         print("\n📤 GitHubにプッシュ中...")
-        git_push()
+        if git_push() and "--mirror" in sys.argv:
+            print("\n📁 AI_Workspace に反映中...")
+            mirror_to_workspace([CACHE_FILE], f"sync: X trends update {datetime.now(JST).strftime('%Y-%m-%d %H:%M')}")
 
     print("\n✨ 完了！")
 
@@ -0,0 +1,97 @@
+"""
+ローカル照合（claim_grounding）と確認済みの文（claim_store）が誤った文を ✅ にしないこと
+
+  python -m unittest discover -s tests
+"""
+
+import importlib.util
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+HAS_DEPS = importlib.util.find_spec("feedparser") is not None
+
+
+@unittest.skipUnless(HAS_DEPS, "feedparser が必要")
+class VerifiedSentenceTest(unittest.TestCase):
+
+    def setUp(self):
+        import claim_grounding
+        import claim_store
+
+        self.grounding, self.store = claim_grounding, claim_store
+        tmp = self.enterContext(tempfile.TemporaryDirectory())
+        self.db = Path(tmp) / "verified_claims.db"
+        claim_store.record_factcheck(
+            "アップルの新製品が発表されました。日本の政策金利は0.5%です。", "✅ 問題なし\n", db_path=self.db,
+        )
+
+    def test_only_exact_sentences_are_verified(self):
+        body = "日本の政策金利は0.5%です。アップルは破綻しました。"
+        self.assertEqual(self.store.verified_sentences(body, db_path=self.db), {"日本の政策金利は0.5%です。"})
+
+    def test_stored_claims_alone_never_pass(self):
+        body = "日本の政策金利は0.5%です。アップルは破綻しました。"
+        verified = self.store.verified_sentences(body, db_path=self.db)
+        for facts in ("", "[日経] アップル、新製品を発表（2026-01-01）"):
+            with self.subTest(facts=facts):
+                result = self.grounding.ground_post(body, self.grounding.ClaimIndex(facts), verified)
+                self.assertFalse(result["passed"])
+
+    def test_fully_verified_post_is_not_passed_without_search(self):
+        body = "日本の政策金利は0.5%です。"
+        verified = self.store.verified_sentences(body, db_path=self.db)
+        self.assertFalse(self.grounding.ground_post(body, self.grounding.ClaimIndex(""), verified)["passed"])
+
+
+FACTS = "\n".join([
+    "[日経] 日銀、政策金利を0.75%に引き上げ（2025年12月）",
+    "[ロイター] 家計金融資産2351兆円で過去最高（2025年）",
+    "[共同] トヨタ、純利益4.8兆円 2025年3月期",
+    "[NHK] 岸田首相が辞任表明 2024年",
+])
+
+
+@unittest.skipUnless(HAS_DEPS, "feedparser が必要")
+class GroundPostTest(unittest.TestCase):
+
+    def setUp(self):
+        import claim_grounding
+
+        self.grounding = claim_grounding
+        self.index = claim_grounding.ClaimIndex(FACTS)
+
+    def passed(self, body):
+        return self.grounding.ground_post(body, self.index)["passed"]
+
+    def test_figures_and_entities_grounded_in_the_same_line(self):
+        self.assertTrue(self.passed("トヨタの純利益は4.8兆円でした。"))
+        # 数字も名前も検索結果にあるが、別々の記事の組み合わせ
+        self.assertFalse(self.passed("トヨタの純利益は2351兆円でした。"))
+
+    def test_kanji_names_fall_back_to_llm(self):
+        for body in ("石破首相は2025年に就任しました。", "岸田首相は2025年も首相です。",
+                     "日銀は政策金利を0.75%に引き上げました。", "自民党の支持率は25%です。"):
+            with self.subTest(body=body):
+                self.assertFalse(self.passed(body))
+
+    def test_sentences_without_strong_figures_fall_back_to_llm(self):
+        self.assertFalse(self.passed("2025年は1位でした。"))
+        self.assertFalse(self.passed("家計金融資産は2351兆円です。トヨタも好調です。"))
+
+    def test_commentary_sentences_are_not_judged(self):
+        body = ("家計金融資産は2351兆円で過去最高です。トヨタの純利益は4.8兆円でした。"
+                "数字だけ見ると景気が良さそうですね。一緒に考えてみましょう。")
+        result = self.grounding.ground_post(body, self.index)
+        self.assertTrue(result["passed"])
+        self.assertEqual(result["ungrounded"], [])
+        self.assertEqual(result["claim_free"], 2)
+        # 主張を含まない文だけの案は確認できたことにならない
+        self.assertFalse(self.passed("一緒に考えてみましょう。"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,174 @@
+"""
+pregenerate_drafts の夜間バッチを、Message Batches API のスタブサーバーに対して通しで動かす
+
+  python -m unittest discover -s tests
+"""
+
+import functools
+import importlib.util
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+HAS_DEPS = all(importlib.util.find_spec(m) for m in ("anthropic", "dotenv", "feedparser"))
+MODEL = "claude-sonnet-4-20250514"
+
+TOPIC = "日銀が政策金利を引き上げ"
+POST1 = "日銀は政策金利を0.5%に引き上げました。物価の上昇が続いています。"
+POST2 = "利上げで住宅ローンの返済額はどう変わるのでしょうか。変動金利の人は注意が必要です。"
+GENERATED = f"【案1】仕組み解説\n{POST1}\n品質スコア: 85/100\n\n【案2】家計への影響\n{POST2}\n品質スコア: 80/100\n"
+
+
+def _message(content):
+    return {
+        "id": "msg_stub", "type": "message", "role": "assistant", "model": MODEL,
+        "content": content, "stop_reason": "end_turn", "stop_sequence": None,
+        "usage": {"input_tokens": 100, "output_tokens": 50},
+    }
+
+
+def _tool_use(name, payload):
+    return _message([{"type": "tool_use", "id": "toolu_stub", "name": name, "input": payload}])
+
+
+def _reply(custom_id):
+    """custom_id ごとのスタブ応答（案1は置き換えで直せる指摘、案2は書き直しが必要な指摘）"""
+    if custom_id == "recommend":
+        return _tool_use("submit_recommendations", {"recommendations": [{
+            "index": 1, "title": TOPIC, "source_type": "x", "reason": "金利の仕組みを解説できる",
+            "angle": "家計への影響", "pillars": ["経済"], "hook_type": "数字ショック型", "score": 90,
+        }]})
+    if custom_id.startswith("gen-"):
+        return _message([{"type": "text", "text": GENERATED}])
+    if custom_id == "fc-0-1":
+        return _tool_use("report_factcheck", {"verdict": "error", "findings": [{
+            "span": "0.5%", "problem": "利上げ後の金利が違う", "correct_info": "0.75%", "replacement": "0.75%",
+        }]})
+    if custom_id == "fc-0-2":
+        return _tool_use("report_factcheck", {"verdict": "warning", "findings": [{
+            "span": "変動金利の人は注意が必要です。", "problem": "根拠が示されていない",
+            "correct_info": "確認推奨", "replacement": "",
+        }]})
+    if custom_id.startswith("fix-"):
+        return _message([{"type": "text", "text": "修正版の本文です。"}])
+    raise AssertionError(f"unexpected custom_id: {custom_id}")
+
+
+class BatchStub(BaseHTTPRequestHandler):
+    """/v1/messages/batches の作成・取得・結果取得だけを実装したスタブ（投入直後に ended を返す）"""
+
+    batches = {}
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json"):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _batch(self, batch_id):
+        base = f"http://127.0.0.1:{self.server.server_port}"
+        n = len(self.batches[batch_id])
+        return json.dumps({
+            "id": batch_id, "type": "message_batch", "processing_status": "ended",
+            "request_counts": {"processing": 0, "succeeded": n, "errored": 0, "canceled": 0, "expired": 0},
+            "created_at": "2026-01-01T00:00:00Z", "expires_at": "2026-01-02T00:00:00Z",
+            "ended_at": "2026-01-01T00:01:00Z", "archived_at": None, "cancel_initiated_at": None,
+            "results_url": f"{base}/v1/messages/batches/{batch_id}/results",
+        })
+
+    def do_POST(self):
+        if self.path.split("?")[0] != "/v1/messages/batches":
+            return self._send(404, "{}")
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        batch_id = f"msgbatch_{len(self.batches) + 1}"
+        self.batches[batch_id] = payload["requests"]
+        self._send(200, self._batch(batch_id))
+
+    def do_GET(self):
+        parts = self.path.split("?")[0].strip("/").split("/")
+        if parts[:3] != ["v1", "messages", "batches"] or len(parts) < 4 or parts[3] not in self.batches:
+            return self._send(404, "{}")
+        batch_id = parts[3]
+        if len(parts) == 5 and parts[4] == "results":
+            lines = [json.dumps({"custom_id": r["custom_id"], "result": {"type": "succeeded", "message": _reply(r["custom_id"])}},
+                                ensure_ascii=False) for r in self.batches[batch_id]]
+            return self._send(200, "\n".join(lines) + "\n", "application/binary")
+        self._send(200, self._batch(batch_id))
+
+
+@unittest.skipUnless(HAS_DEPS, "anthropic / python-dotenv / feedparser が必要")
+class PregenerateBatchTest(unittest.TestCase):
+
+    def setUp(self):
+        import post_pipeline
+        import pregenerate_drafts
+
+        self.pipeline, self.job = post_pipeline, pregenerate_drafts
+        BatchStub.batches = {}
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), BatchStub)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        tmp = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        cache = tmp / "x_trends_cache.json"
+        cache.write_text(json.dumps({"trends": [
+            {"title": TOPIC, "source": "X ニューストレンド", "origin": "x_news", "post_count": 1200},
+        ]}, ensure_ascii=False), encoding="utf-8")
+        (tmp / "history").mkdir()
+        self.history_dir = tmp / "history"
+
+        import claim_store
+        patches = [
+            mock.patch.dict(os.environ, {"ANTHROPIC_API_KEY": "test-key",
+                                         "ANTHROPIC_BASE_URL": f"http://127.0.0.1:{self.server.server_port}"}),
+            mock.patch.object(sys, "argv", ["pregenerate_drafts.py", "--no-news"]),
+            mock.patch.object(pregenerate_drafts, "CACHE_FILE", cache),
+            mock.patch.object(post_pipeline, "HISTORY_DIR", self.history_dir),
+            mock.patch.object(post_pipeline, "_search_google_news", return_value=[
+                {"title": "日銀、政策金利を0.75%に引き上げ", "source": "日経", "link": "", "published": "2026-01-01"},
+            ]),
+            mock.patch.object(post_pipeline, "_search_duckduckgo", return_value=[]),
+            mock.patch.object(claim_store, "verified_sentences",
+                              functools.partial(claim_store.verified_sentences, db_path=tmp / "verified_claims.db")),
+            # 確認済みの主張の保存が失敗してもバッチ全体は止まらないこと
+            mock.patch.object(claim_store, "record_factcheck", side_effect=sqlite3.OperationalError("database is locked")),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_batch_job_saves_drafts_with_factcheck_and_fixes(self):
+        self.job.main()
+
+        stages = [sorted(r["custom_id"] for r in reqs) for reqs in BatchStub.batches.values()]
+        self.assertEqual(stages, [["recommend"], ["gen-0"], ["fc-0-1", "fc-0-2"], ["fix-0-2"]])
+
+        saved = list(self.history_dir.glob("*_batch*.json"))
+        self.assertEqual(len(saved), 1)
+        entry = json.loads(saved[0].read_text(encoding="utf-8"))
+        self.assertEqual(entry["input"]["selected_topics"], [TOPIC])
+        self.assertEqual(entry["result"], GENERATED.strip())
+        self.assertEqual(set(entry["factcheck"]), {"1", "2"})
+        self.assertTrue(entry["factcheck"]["1"].startswith("❌"))
+        # 案1は該当箇所の置き換え（バッチ不要）、案2は書き直しバッチで修正される
+        self.assertEqual(entry["auto_fixed"]["1"]["fixed"], POST1.replace("0.5%", "0.75%"))
+        self.assertEqual(entry["auto_fixed"]["2"]["fixed"], "修正版の本文です。")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,178 @@
+"""
+sync_x_trends.publish_files を GitHub API（Git Data / Contents）のスタブサーバーに対して動かす
+
+  python -m unittest discover -s tests
+"""
+
+import base64
+import json
+import sys
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import sync_x_trends  # noqa: E402
+import watch_trigger  # noqa: E402
+
+REPO = "owner/x-post-tool"
+TRIGGER = "_trigger_sync.json"
+CACHE = "x_trends_cache.json"
+
+
+def _trigger(status, requests=(), served=()):
+    return json.dumps({"status": status, "requests": list(requests), "served": list(served)}, ensure_ascii=False)
+
+
+def _request(request_id):
+    return {"id": request_id, "requested_at": "2026-01-01T00:00:00+00:00", "max_age_minutes": 30}
+
+
+class GitHubStub(BaseHTTPRequestHandler):
+    """1ブランチ分の ref / commit / tree / contents を持つスタブ
+
+    race: 最初の ref 更新の直前に割り込ませるトリガーの内容（別のコミットが先に入った状態を作る）
+    """
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        return json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+
+    def do_GET(self):
+        state, url = self.server.state, urlparse(self.path)
+        path = url.path.removeprefix(f"/repos/{REPO}")
+        if path == "":
+            return self._send(200, {"default_branch": "main"})
+        if path == "/git/ref/heads/main":
+            return self._send(200, {"object": {"sha": state["head"]}})
+        if path.startswith("/git/commits/"):
+            sha = path.rsplit("/", 1)[1]
+            return self._send(200, {"sha": sha, "tree": {"sha": state["commits"][sha]["tree"]}})
+        if path.startswith("/contents/"):
+            name = path.removeprefix("/contents/")
+            files = state["trees"][state["commits"][parse_qs(url.query)["ref"][0]]["tree"]]
+            state["content_reads"] += 1
+            if name not in files:
+                return self._send(404, {"message": "Not Found"})
+            return self._send(200, {"encoding": "base64", "content": base64.b64encode(files[name].encode("utf-8")).decode()})
+        self._send(404, {"message": "Not Found"})
+
+    def do_POST(self):
+        state = self.server.state
+        path = urlparse(self.path).path.removeprefix(f"/repos/{REPO}")
+        body = self._body()
+        if path == "/git/trees":
+            files = dict(state["trees"][body["base_tree"]])
+            files.update({e["path"]: e["content"] for e in body["tree"]})
+            sha = f"tree{len(state['trees'])}"
+            state["trees"][sha] = files
+            return self._send(201, {"sha": sha})
+        if path == "/git/commits":
+            sha = f"commit{len(state['commits'])}"
+            state["commits"][sha] = {"tree": body["tree"], "parents": body["parents"]}
+            return self._send(201, {"sha": sha})
+        self._send(404, {"message": "Not Found"})
+
+    def do_PATCH(self):
+        state = self.server.state
+        body = self._body()
+        if state.get("race"):
+            # 別のクライアントが先にトリガーを更新したコミットを積む
+            files = dict(state["trees"][state["commits"][state["head"]]["tree"]])
+            files[TRIGGER] = state.pop("race")
+            state["trees"]["tree-race"] = files
+            state["commits"]["commit-race"] = {"tree": "tree-race", "parents": [state["head"]]}
+            state["head"] = "commit-race"
+        if state["commits"][body["sha"]]["parents"] != [state["head"]]:
+            return self._send(422, {"message": "Update is not a fast forward"})
+        state["head"] = body["sha"]
+        self._send(200, {"object": {"sha": body["sha"]}})
+
+
+class PublishFilesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), GitHubStub)
+        self.server.state = {
+            "head": "commit0",
+            "commits": {"commit0": {"tree": "tree0", "parents": []}},
+            "trees": {"tree0": {CACHE: "{}", TRIGGER: _trigger("pending", [_request("a")])}},
+            "content_reads": 0,
+        }
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.api_base = f"http://127.0.0.1:{self.server.server_port}"
+
+    def publish(self, merge=True):
+        files = {CACHE: '{"count": 1}', TRIGGER: _trigger("completed", served=["a"])}
+        return sync_x_trends.publish_files(
+            files, "sync: test", "token", repo=REPO, api_base=self.api_base,
+            merge={TRIGGER: watch_trigger.merge_remote_trigger} if merge else None,
+        )
+
+    def published(self):
+        state = self.server.state
+        return state["trees"][state["commits"][state["head"]]["tree"]]
+
+    def test_retry_merges_requests_that_arrived_before_the_conflict(self):
+        self.server.state["race"] = _trigger("pending", [_request("a"), _request("b")])
+        sha = self.publish()
+
+        self.assertEqual(self.server.state["head"], sha)
+        self.assertEqual(self.server.state["commits"][sha]["parents"], ["commit-race"])
+        self.assertEqual(self.server.state["content_reads"], 2)
+        files = self.published()
+        self.assertEqual(files[CACHE], '{"count": 1}')
+        trigger = json.loads(files[TRIGGER])
+        self.assertEqual(trigger["status"], "pending")
+        self.assertEqual([r["id"] for r in trigger["requests"]], ["b"])
+        self.assertEqual(trigger["served"], ["a"])
+
+    def test_served_requests_are_completed_without_conflict(self):
+        sha = self.publish()
+
+        self.assertEqual(self.server.state["commits"][sha]["parents"], ["commit0"])
+        trigger = json.loads(self.published()[TRIGGER])
+        self.assertEqual(trigger["status"], "completed")
+        self.assertEqual(trigger["requests"], [])
+
+    def test_without_merge_retry_overwrites_remote_trigger(self):
+        self.server.state["race"] = _trigger("pending", [_request("b")])
+        self.publish(merge=False)
+
+        self.assertEqual(self.server.state["content_reads"], 0)
+        self.assertEqual(json.loads(self.published()[TRIGGER])["status"], "completed")
+
+
+class MergeRemoteTriggerTest(unittest.TestCase):
+
+    def test_legacy_pending_trigger_is_kept(self):
+        local = _trigger("completed", served=["a"])
+        merged = json.loads(watch_trigger.merge_remote_trigger(
+            json.dumps({"status": "pending", "requested_at": "2026-01-01T00:00:00"}), local,
+        ))
+        self.assertEqual(merged["status"], "pending")
+        self.assertEqual([r["id"] for r in merged["requests"]], ["legacy-2026-01-01T00:00:00"])
+
+    def test_missing_or_broken_remote_keeps_local(self):
+        local = _trigger("completed", served=["a"])
+        self.assertEqual(watch_trigger.merge_remote_trigger(None, local), local)
+        self.assertEqual(watch_trigger.merge_remote_trigger("{broken", local), local)
+
+
+if __name__ == "__main__":
+    unittest.main()
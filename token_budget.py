@@ -0,0 +1,87 @@
+"""
+プロンプト組み立て用のトークン予算管理
+
+- estimate_tokens: API を呼ばずにローカルでトークン数を概算（日本語は1文字≒1トークンで安全側に見積もる）
+- fit_sections: 優先度の低いセクションから行単位で削って予算内に収める
+- max_tokens_for: 期待する出力文字数から max_tokens を決める（固定の 8192 / 4096 をやめる）
+"""
+
+import math
+import os
+
+# 見積もり係数（Claudeのトークナイザは日本語でおおむね 1文字≒0.7〜1.2トークン）
+TOKENS_PER_CJK_CHAR = 1.0
+CHARS_PER_ASCII_TOKEN = 4.0
+
+# 出力の見積もりに掛ける余裕（見出し・メタデータ・文字数超過の分）
+OUTPUT_HEADROOM = 2.0
+OUTPUT_MIN_TOKENS = 512
+OUTPUT_MAX_TOKENS = 8192
+
+
+def budget_from_env(name, default):
+    """環境変数で上書きできる予算値を取得"""
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def estimate_tokens(text):
+    """テキストのトークン数を概算"""
+    if not text:
+        return 0
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    other_chars = len(text) - ascii_chars
+    return math.ceil(ascii_chars / CHARS_PER_ASCII_TOKEN + other_chars * TOKENS_PER_CJK_CHAR)
+
+
+def fit_sections(sections, budget):
+    """セクション群を予算内に収める
+
+    Args:
+        sections: [{"name": 名前, "text": 本文, "priority": 大きいほど残す, "trim": 削ってよいか}]
+                  trim=True のセクションは末尾の行から削る（呼び出し側で重要な行を先に並べておく）
+        budget: 全セクション合計のトークン予算
+    Returns:
+        (list[str], dict): 予算内に収めた各セクションの本文（入力と同じ順）と、
+                           {名前: (削る前のトークン数, 削った後のトークン数)} のレポート
+    """
+    lines = [s["text"].split("\n") if s.get("text") else [] for s in sections]
+    costs = [[estimate_tokens(line) + 1 for line in ls] for ls in lines]
+    before = [sum(c) for c in costs]
+    total = sum(before)
+
+    # 優先度の低い順（同じ優先度なら後ろのセクションから）に削る
+    order = sorted(
+        (i for i, s in enumerate(sections) if s.get("trim", True)),
+        key=lambda i: (sections[i].get("priority", 0), -i),
+    )
+    for i in order:
+        while total > budget and lines[i]:
+            lines[i].pop()
+            total -= costs[i].pop()
+        if total <= budget:
+            break
+
+    texts = ["\n".join(ls) for ls in lines]
+    report = {s["name"]: (before[i], sum(costs[i])) for i, s in enumerate(sections)}
+    return texts, report
+
+
+def trim_lines(text, budget):
+    """行単位で末尾から削って予算内に収める（検索結果など順序が重要度順のテキスト用）"""
+    texts, _ = fit_sections([{"name": "text", "text": text or "", "priority": 0}], budget)
+    return texts[0]
+
+
+def max_tokens_for(expected_chars, count=1, extra_chars=0):
+    """期待する出力文字数から max_tokens を算出
+
+    Args:
+        expected_chars: 1件あたりの想定文字数の上限（例: ポスト800文字）
+        count: 件数（3案なら3）
+        extra_chars: 見出し・品質スコアなど本文以外の想定文字数
+    """
+    tokens = (expected_chars * count + extra_chars) * TOKENS_PER_CJK_CHAR * OUTPUT_HEADROOM
+    return max(OUTPUT_MIN_TOKENS, min(OUTPUT_MAX_TOKENS, math.ceil(tokens)))
@@ -0,0 +1,176 @@
+"""
+Xトレンドの時系列スナップショットストア（SQLite）
+
+x_trends_cache.json は save_cache() のたびに上書きされるため、ポスト数の履歴が残らない。
+このモジュールはスナップショットを追記専用で保存し、書き込み時にトレンドごとの
+速度（1時間あたりのポスト増加数）と加速度を前回値から差分計算しておく。
+
+- トレンドは正規化タイトル（NFKC・空白除去・ポスト数表記除去）で同一視する
+- 最新値は trend_latest テーブルに保持する（勢い順の並び替えはキャッシュの velocity / acceleration で行う）
+"""
+
+import re
+import sqlite3
+import unicodedata
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+
+# 日本時間 (JST = UTC+9)
+JST = timezone(timedelta(hours=9))
+
+DB_PATH = Path(__file__).parent / "x_trends_history.db"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    taken_at  TEXT NOT NULL,
+    taken_ts  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_snapshots_ts ON snapshots(taken_ts);
+
+CREATE TABLE IF NOT EXISTS trend_points (
+    norm_title    TEXT NOT NULL,
+    ts            REAL NOT NULL,
+    snapshot_id   INTEGER NOT NULL REFERENCES snapshots(id),
+    post_count    INTEGER NOT NULL,
+    velocity      REAL,
+    acceleration  REAL,
+    PRIMARY KEY (norm_title, ts)
+);
+CREATE INDEX IF NOT EXISTS idx_points_snapshot ON trend_points(snapshot_id);
+
+CREATE TABLE IF NOT EXISTS trend_latest (
+    norm_title     TEXT PRIMARY KEY,
+    title          TEXT NOT NULL,
+    ts             REAL NOT NULL,
+    post_count     INTEGER NOT NULL,
+    velocity       REAL,
+    acceleration   REAL,
+    first_seen_ts  REAL NOT NULL
+);
+"""
+
+
+def normalize_title(title):
+    """トレンドタイトルを同一視用のキーに正規化"""
+    t = unicodedata.normalize("NFKC", title or "")
+    t = re.sub(r"\s*\(\d[\d,]*件のポスト\)", "", t)
+    t = re.sub(r"\s+", "", t)
+    return t.lower()
+
+
+def connect(db_path=DB_PATH):
+    """ストアに接続（テーブルが無ければ作成）"""
+    conn = sqlite3.connect(str(db_path), timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _to_ts(taken_at):
+    if taken_at is None:
+        taken_at = datetime.now(JST)
+    elif isinstance(taken_at, str):
+        taken_at = datetime.fromisoformat(taken_at)
+    # 旧キャッシュ互換: タイムゾーン情報がない場合はJSTとして扱う
+    if taken_at.tzinfo is None:
+        taken_at = taken_at.replace(tzinfo=JST)
+    return taken_at, taken_at.timestamp()
+
+
+def record_snapshot(trends, taken_at=None, db_path=DB_PATH):
+    """スナップショットを追記し、速度・加速度を付与したトレンドリストを返す
+
+    Args:
+        trends: _x_worker.py が返すトレンドリスト（title, post_count を含む dict）
+        taken_at: 取得時刻（datetime / ISO文字列）。省略時は現在時刻
+    Returns:
+        list: 各トレンドのコピーに "velocity"（件/時）と "acceleration"（件/時²）を追加したもの。
+              初出のトレンドは None
+    """
+    taken_at, ts = _to_ts(taken_at)
+
+    # 同一スナップショット内の重複はポスト数が多い方を採用
+    counts = {}
+    for t in trends:
+        key = normalize_title(t.get("title", ""))
+        if not key:
+            continue
+        count = int(t.get("post_count") or 0)
+        if key not in counts or count > counts[key][1]:
+            counts[key] = (t["title"], count)
+
+    metrics = {}
+    conn = connect(db_path)
+    try:
+        with conn:
+            cur = conn.execute(
+                "INSERT INTO snapshots (taken_at, taken_ts) VALUES (?, ?)",
+                (taken_at.isoformat(), ts),
+            )
+            snapshot_id = cur.lastrowid
+            for key, (title, count) in counts.items():
+                prev = conn.execute(
+                    "SELECT ts, post_count, velocity, first_seen_ts FROM trend_latest WHERE norm_title = ?",
+                    (key,),
+                ).fetchone()
+                velocity = acceleration = None
+                first_seen = ts
+                if prev is not None:
+                    first_seen = prev["first_seen_ts"]
+                    dt_hours = (ts - prev["ts"]) / 3600
+                    if dt_hours > 0:
+                        velocity = (count - prev["post_count"]) / dt_hours
+                        if prev["velocity"] is not None:
+                            acceleration = (velocity - prev["velocity"]) / dt_hours
+                conn.execute(
+                    "INSERT OR REPLACE INTO trend_points "
+                    "(norm_title, ts, snapshot_id, post_count, velocity, acceleration) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, ts, snapshot_id, count, velocity, acceleration),
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO trend_latest "
+                    "(norm_title, title, ts, post_count, velocity, acceleration, first_seen_ts) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, title, ts, count, velocity, acceleration, first_seen),
+                )
+                metrics[key] = (velocity, acceleration)
+    finally:
+        conn.close()
+
+    annotated = []
+    for t in trends:
+        velocity, acceleration = metrics.get(normalize_title(t.get("title", "")), (None, None))
+        annotated.append({
+            **t,
+            "velocity": round(velocity, 1) if velocity is not None else None,
+            "acceleration": round(acceleration, 1) if acceleration is not None else None,
+        })
+    return annotated
+
+
+def momentum_for(titles, db_path=DB_PATH):
+    """タイトル一覧の最新の速度・加速度を取得（正規化タイトル → (velocity, acceleration)）"""
+    keys = sorted({normalize_title(t) for t in titles if t})
+    if not keys or not Path(db_path).exists():
+        return {}
+    conn = connect(db_path)
+    try:
+        placeholders = ",".join("?" * len(keys))
+        rows = conn.execute(
+            f"SELECT norm_title, velocity, acceleration FROM trend_latest WHERE norm_title IN ({placeholders})",
+            keys,
+        ).fetchall()
+        return {r["norm_title"]: (r["velocity"], r["acceleration"]) for r in rows}
+    finally:
+        conn.close()
+
+
+def momentum_sort_key(item):
+    """velocity / acceleration / post_count を持つ dict の勢い順ソートキー（降順用）"""
+    return (
+        item.get("velocity") or 0,
+        item.get("acceleration") or 0,
+        item.get("post_count") or 0,
+    )
@@ -4,11 +4,30 @@ Windows PC用: Streamlit Cloudからのトリガーを監視して自動同期
 使い方:
   1. python watch_trigger.py         ← 常駐監視（2分おきにチェック）
   2. python watch_trigger.py --once   ← 1回だけチェックして終了
+  3. --mirror を付けると、プッシュ後にローカルの AI_Workspace リポジトリにも別コミットで反映
 
 仕組み:
   - GitHub上の _trigger_sync.json を定期チェック
-  - status が "pending" なら sync_x_trends.py を実行
-  - 完了後 status を "completed" に更新してプッシュ
+  - 未処理のリクエストがあれば sync_x_trends.py を1回だけ実行（複数リクエストを合流）
+  - 完了後 status を "completed" に更新し、処理したリクエストIDを served に記録
+  - トレンドキャッシュとトリガーは Git Data API で1つのコミットとしてまとめてプッシュ
+    （キャッシュだけ更新されてトリガーが pending のまま、という中間状態が生じない）
+  - プッシュ直前にリモートのトリガーを読み直し、その間に届いたリクエストは pending のまま残す
+
+トリガーファイルの形式:
+  {
+    "status": "pending",
+    "requests": [
+      {"id": "abc123", "requested_at": "2026-03-01T14:36:43+00:00", "max_age_minutes": 30}
+    ],
+    "served": ["xyz789"]
+  }
+  - max_age_minutes: このリクエストが許容するキャッシュの古さ（最低鮮度）
+  - リクエスト時点で十分新しいキャッシュがあるものはスクレイピングせずに served 扱い
+  - 同期中に届いたリクエストも、同期結果が鮮度を満たせば同じ同期で served 扱い
+  - 旧形式（{"status": "pending", "requested_at": ...}）も1件のリクエストとして扱う
+  - トリガーを書く側（Streamlit Cloud）はこのリポジトリには無い。旧形式のまま書いても動き、
+    requests に追記する場合は既存の未処理リクエストを消さずに追加すること（複数の要求が1回の同期に合流する）
 """
 
 import json
@@ -17,12 +36,21 @@ import sys
 import time
 import os
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timezone, timedelta
+
+import sync_x_trends
+
+# 日本時間 (JST = UTC+9)
+JST = timezone(timedelta(hours=9))
 
 SCRIPT_DIR = Path(__file__).parent
 TRIGGER_FILE = SCRIPT_DIR / "_trigger_sync.json"
+CACHE_FILE = SCRIPT_DIR / "x_trends_cache.json"
 SYNC_SCRIPT = SCRIPT_DIR / "sync_x_trends.py"
 CHECK_INTERVAL = 120  # 2分
+DEFAULT_MAX_AGE_MINUTES = 30  # max_age_minutes 未指定時の許容鮮度
+MIN_SYNC_INTERVAL_MINUTES = 10  # スクレイピングの最短間隔（これより厳しい鮮度要求は切り上げ）
+SERVED_HISTORY = 50  # served に残すリクエストIDの件数
 
 
 def git_pull():
@@ -49,77 +77,166 @@ def check_trigger():
         return None
 
 
+def _parse_time(value):
+    """ISO形式の時刻をタイムゾーン付きdatetimeに変換（失敗時はNone）"""
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    # タイムゾーン情報がない場合はJSTとして扱う
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=JST)
+    return dt
+
+
+def cache_updated_at():
+    """ローカルのトレンドキャッシュの更新時刻"""
+    if not CACHE_FILE.exists():
+        return None
+    try:
+        cache = json.loads(CACHE_FILE.read_text(encoding="utf-8"))
+        return _parse_time(cache.get("updated_at"))
+    except Exception:
+        return None
+
+
+def pending_requests(trigger):
+    """未処理のリクエスト一覧を返す（旧形式のトリガーも1件として扱う）"""
+    if not trigger:
+        return []
+    served = set(trigger.get("served", []))
+    requests = list(trigger.get("requests", []))
+    if not requests and trigger.get("status") == "pending":
+        requested_at = trigger.get("requested_at", "")
+        requests = [{"id": f"legacy-{requested_at}", "requested_at": requested_at}]
+    return [r for r in requests if r.get("id") and r["id"] not in served]
+
+
+def is_satisfied(request, updated_at):
+    """キャッシュの更新時刻がリクエストの鮮度要求を満たしているか"""
+    if updated_at is None:
+        return False
+    requested_at = _parse_time(request.get("requested_at")) or datetime.now(JST)
+    max_age = max(
+        float(request.get("max_age_minutes") or DEFAULT_MAX_AGE_MINUTES),
+        MIN_SYNC_INTERVAL_MINUTES,
+    )
+    return updated_at >= requested_at - timedelta(minutes=max_age)
+
+
+def merge_remote_trigger(remote_text, local_text):
+    """公開直前のリモートのトリガーに届いていた未処理リクエストを、ローカルのトリガーに合流させる
+
+    git pull の後に届いたリクエストを completed で上書きして失わないようにする（次回の同期で処理）。
+    """
+    try:
+        remote = json.loads(remote_text) if remote_text else None
+    except ValueError:
+        remote = None
+    local = json.loads(local_text)
+    known = set(local.get("served", [])) | {r["id"] for r in local.get("requests", [])}
+    arrived = [r for r in pending_requests(remote) if r["id"] not in known]
+    if not arrived:
+        return local_text
+    local["requests"] = list(local.get("requests", [])) + arrived
+    local["status"] = "pending"
+    return json.dumps(local, ensure_ascii=False, indent=2)
+
+
 def run_sync():
-    """sync_x_trends.py --push を実行"""
-    print("  📡 Xトレンド取得 & GitHubプッシュ中...")
+    """sync_x_trends.py を実行（プッシュはトリガー更新と一緒に行う）"""
+    print("  📡 Xトレンド取得中...")
     result = subprocess.run(
-        [sys.executable, str(SYNC_SCRIPT), "--push"],
+        [sys.executable, str(SYNC_SCRIPT)],
         timeout=120,
     )
     return result.returncode == 0
 
 
-def update_trigger_completed():
-    """トリガーを completed に更新してプッシュ"""
+def update_trigger_completed(served_ids, previous_served=(), remaining=(), mirror=False):
+    """トリガーを completed に更新し、トレンドキャッシュと同じコミットでプッシュ
+
+    Args:
+        served_ids: 今回処理したリクエストID
+        previous_served: 以前から served に記録されているID
+        remaining: まだ鮮度を満たしていないリクエスト（次回に持ち越し）
+        mirror: True ならプッシュ後にローカルの AI_Workspace にも反映（--mirror）
+    """
+    served = [i for i in previous_served if i not in served_ids] + list(served_ids)
+    updated_at = cache_updated_at()
     trigger = {
-        "status": "completed",
-        "completed_at": datetime.now().isoformat(),
+        "status": "pending" if remaining else "completed",
+        "completed_at": datetime.now(JST).isoformat(),
+        "cache_updated_at": updated_at.isoformat() if updated_at else None,
+        "requests": list(remaining),
+        "served": served[-SERVED_HISTORY:],
     }
     TRIGGER_FILE.write_text(
         json.dumps(trigger, ensure_ascii=False, indent=2),
         encoding="utf-8",
     )
 
-    os.chdir(str(SCRIPT_DIR))
-    try:
-        subprocess.run(
-            ["git", "add", TRIGGER_FILE.name],
-            check=True, capture_output=True, text=True,
-        )
-        subprocess.run(
-            ["git", "commit", "-m", "trigger: sync completed"],
-            check=True, capture_output=True, text=True,
-        )
-        subprocess.run(
-            ["git", "push"],
-            check=True, capture_output=True, text=True,
-        )
-        print("  ✅ ステータス更新をプッシュしました")
-    except subprocess.CalledProcessError as e:
-        print(f"  ⚠️ ステータス更新のプッシュに失敗: {e}")
+    now = datetime.now(JST).strftime("%Y-%m-%d %H:%M")
+    print("  📤 トレンドキャッシュとステータスをまとめてプッシュ中...")
+    message = f"sync: X trends update {now} (trigger: {len(served_ids)} served)"
+    if sync_x_trends.git_push(
+        extra_files=[TRIGGER_FILE],
+        message=message,
+        merge={TRIGGER_FILE.name: merge_remote_trigger},
+    ):
+        print("  ✅ キャッシュとステータス更新をプッシュしました")
+        if mirror:
+            sync_x_trends.mirror_to_workspace([sync_x_trends.CACHE_FILE, TRIGGER_FILE], message)
+    else:
+        print("  ⚠️ x-post-tool へのプッシュに失敗しました")
 
 
-def check_and_sync():
+def check_and_sync(mirror=False):
     """1回のチェック & 同期サイクル"""
     # 最新を取得
     git_pull()
 
     # トリガー確認
     trigger = check_trigger()
-    if not trigger or trigger.get("status") != "pending":
+    requests = pending_requests(trigger)
+    if not requests:
         return False
 
-    requested = trigger.get("requested_at", "不明")
     print(f"\n{'='*50}")
-    print(f"🔔 同期リクエスト検出！")
-    print(f"   リクエスト時刻: {requested}")
+    print(f"🔔 同期リクエスト検出！（{len(requests)}件）")
+    for r in requests:
+        print(f"   {r['id']}: {r.get('requested_at', '不明')}")
     print(f"{'='*50}")
 
-    # 同期実行
-    ok = run_sync()
-
-    if ok:
-        # ステータス更新
-        update_trigger_completed()
-        print(f"\n✅ 同期完了！Streamlit Cloudに反映されます")
+    # 既存キャッシュで鮮度を満たすリクエストはスクレイピング不要
+    updated_at = cache_updated_at()
+    stale = [r for r in requests if not is_satisfied(r, updated_at)]
+    ok = True
+    if stale:
+        ok = run_sync()
+        if not ok:
+            print(f"\n❌ 同期に失敗しました")
+            return False
+        # 同期中に届いたリクエストも合流させる
+        git_pull()
+        trigger = check_trigger() or trigger
+        requests = pending_requests(trigger)
+        updated_at = cache_updated_at()
     else:
-        print(f"\n❌ 同期に失敗しました")
+        print("  ♻️ キャッシュが十分新しいため、スクレイピングせずに完了扱いにします")
 
+    served = [r["id"] for r in requests if is_satisfied(r, updated_at)]
+    remaining = [r for r in requests if r["id"] not in served]
+    update_trigger_completed(served, trigger.get("served", []), remaining, mirror=mirror)
+    print(f"\n✅ 同期完了！{len(served)}件のリクエストに対応しました（Streamlit Cloudに反映されます）")
     return ok
 
 
 def main():
     once = "--once" in sys.argv
+    mirror = "--mirror" in sys.argv
 
     print("=" * 50)
     print("👀 Xトレンド同期 トリガー監視")
@@ -128,7 +245,7 @@ def main():
     if once:
         print("モード: 1回チェック")
         print()
-        check_and_sync()
+        check_and_sync(mirror)
         return
 
     print(f"モード: 常駐監視（{CHECK_INTERVAL}秒おき）")
@@ -140,7 +257,7 @@ def main():
             now = datetime.now().strftime("%H:%M:%S")
             print(f"[{now}] チェック中...", end="", flush=True)
 
-            if check_and_sync():
+            if check_and_sync(mirror):
                 print()  # 同期実行時は改行済み
             else:
                 print(" 待機中")